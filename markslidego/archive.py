@@ -0,0 +1,317 @@
+""" Streaming ZIP archive writer, which indexes every written entry.
+
+Files and generated contents are streamed in chunks straight into the archive, while the size and
+SHA1 of each entry is computed on the fly. The index of a written archive is kept in memory, so
+later build steps (e.g. the Moodle backup) can use it instead of extracting and re-hashing the archive.
+
+Archives of many files (e.g. the course zip) are compressed in parallel: the members are deflated in memory on
+a pool of threads (zlib releases the GIL) and written to the archive in order. Archives written concurrently
+(e.g. by the render jobs) share one pool with a thread per CPU core, so compressing doesn't oversubscribe the CPU.
+Already compressed formats are stored without compression, and members of the previous archive whose file is
+unchanged are copied compressed as-is. Writing compressed data as-is relies on internals of zipfile, if these
+are not available (other Python versions), the members are decompressed and compressed again instead.
+"""
+import copy
+import hashlib
+import os
+import struct
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+
+
+CHUNK_SIZE = 65536  # Read/write in 64k chunks
+
+# Formats which are compressed already, deflating them again costs time but saves (next to) nothing
+STORED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".zip", ".mbz", ".pptx", ".docx", ".xlsx",
+                     ".mp3", ".mp4", ".webm", ".woff", ".woff2", ".gz", ".7z"}
+MAX_BUFFERED_SIZE = 64 * 1024 * 1024  # larger files are deflated while streaming them into the archive
+POOL_SIZE = os.cpu_count() or 1  # threads of the shared compression pool
+
+# Internals of zipfile used to read and write compressed member data as-is (see ZipStreamWriter.copy_member)
+RAW_ZIPFILE_NAMES = ("structFileHeader", "sizeFileHeader", "_FH_FILENAME_LENGTH", "_FH_EXTRA_FIELD_LENGTH")
+RAW_ZIPFILE_ATTRIBUTES = ("fp", "start_dir", "filelist", "NameToInfo")
+
+
+_pool: ThreadPoolExecutor|None = None
+_pool_lock = threading.Lock()
+
+
+def _shared_pool() -> ThreadPoolExecutor:
+    """ The compression pool shared by all archives written (concurrently) in this process. """
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="zip")
+        return _pool
+
+
+class ZipEntry:
+    """ Index entry of a file inside a ZIP archive (sha1 may be None if not computed yet). """
+    def __init__(self, name: str, size: int, sha1: str|None, date_time: tuple) -> None:
+        self.name = name
+        self.size = size
+        self.sha1 = sha1
+        self.date_time = date_time
+
+
+    def __repr__(self) -> str:
+        return f"ZipEntry(name={self.name}, size={self.size}, sha1={self.sha1})"
+
+
+class ZipStreamWriter:
+    """ Writes files and generated contents into a ZIP archive and indexes the entries. """
+
+    def __init__(self, zip_path: str, compression: int = zipfile.ZIP_STORED) -> None:
+        self.zip_path = zip_path
+        self.zipf = zipfile.ZipFile(zip_path, 'w', compression)
+        self.entries: list[ZipEntry] = []
+        self.raw_writes = supports_raw_access(self.zipf)
+
+
+    def __enter__(self) -> "ZipStreamWriter":
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close(register=exc_type is None)
+
+
+    def add_file(self, filepath: str, arcname: str, compress_type: int|None = None) -> ZipEntry:
+        """ Stream a file from disk into the archive (with the compression of the archive, if not specified). """
+        zinfo = zipfile.ZipInfo.from_file(filepath, arcname)
+        with open(filepath, "rb") as in_file:
+            return self.__write_entry__(zinfo, in_file, compress_type)
+
+
+    def add_stream(self, in_file, arcname: str) -> ZipEntry:
+        """ Stream the content of an opened (binary) file object into the archive. """
+        zinfo = zipfile.ZipInfo(arcname, time.localtime(time.time())[:6])
+        return self.__write_entry__(zinfo, in_file)
+
+
+    def __write_entry__(self, zinfo: zipfile.ZipInfo, in_file, compress_type: int|None = None) -> ZipEntry:
+        zinfo.compress_type = self.zipf.compression if compress_type is None else compress_type
+        sha1 = hashlib.sha1()
+        size = 0
+        with self.zipf.open(zinfo, 'w') as out_file:
+            while data := in_file.read(CHUNK_SIZE):
+                sha1.update(data)
+                size += len(data)
+                out_file.write(data)
+        entry = ZipEntry(zinfo.filename, size, sha1.hexdigest(), zinfo.date_time)
+        self.entries.append(entry)
+        return entry
+
+
+    def add_bytes(self, content: bytes|str, arcname: str) -> ZipEntry:
+        """ Write generated content into the archive, without staging it on disk. """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        zinfo = zipfile.ZipInfo(arcname, time.localtime(time.time())[:6])
+        zinfo.compress_type = self.zipf.compression
+        self.zipf.writestr(zinfo, content)
+        entry = ZipEntry(zinfo.filename, len(content), hashlib.sha1(content).hexdigest(), zinfo.date_time)
+        self.entries.append(entry)
+        return entry
+
+
+    def add_files(self, files: list[tuple[str, str]], jobs: int|None = None,
+                  previous: zipfile.ZipFile|None = None) -> int:
+        """ Add the files (path, arcname) in order, while they are compressed ahead on a pool of jobs (default: the
+        shared pool with one thread per CPU core). Already compressed formats are stored. Unchanged members of the
+        previous archive (same size and CRC, which is much cheaper than compressing) are copied as-is.
+        Returns the number of copied members. """
+        pool = ThreadPoolExecutor(max_workers=jobs) if jobs else nullcontext(_shared_pool())
+        jobs = jobs or POOL_SIZE
+        copied = 0
+        with pool as executor:
+            pending: deque[tuple[str, str, int, Future]] = deque()
+
+            def write_next() -> None:
+                nonlocal copied
+                path, arcname, compress_type, future = pending.popleft()
+                member = future.result()
+                if member is None:
+                    self.add_file(path, arcname, compress_type)  # stored or too large to buffer: stream it
+                elif isinstance(member, zipfile.ZipInfo):
+                    self.copy_member(previous, member)
+                    copied += 1
+                elif self.raw_writes:
+                    self.__add_deflated__(path, arcname, *member)
+                else:
+                    self.add_file(path, arcname, compress_type)
+
+            for path, arcname in files:
+                compress_type = compress_type_of(path)
+                info = previous.NameToInfo.get(arcname) if previous is not None else None
+                pending.append((path, arcname, compress_type,
+                                executor.submit(_prepare_member, path, compress_type, info)))
+                if len(pending) > 2 * jobs:  # bounds the memory of the compressed members ahead
+                    write_next()
+            while pending:
+                write_next()
+        return copied
+
+
+    def __add_deflated__(self, filepath: str, arcname: str, crc: int, size: int, sha1: str,
+                         chunks: list[bytes]) -> ZipEntry:
+        zinfo = zipfile.ZipInfo.from_file(filepath, arcname)
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.CRC = crc
+        zinfo.file_size = size
+        zinfo.compress_size = sum(len(chunk) for chunk in chunks)
+        self.__write_raw__(zinfo, chunks)
+        entry = ZipEntry(zinfo.filename, size, sha1, zinfo.date_time)
+        self.entries.append(entry)
+        return entry
+
+
+    def copy_member(self, source: zipfile.ZipFile, info: zipfile.ZipInfo) -> ZipEntry:
+        """ Copy a member of another archive as-is, without decompressing and compressing it again
+        (or, if the internals of zipfile are not available, decompressed and compressed again). """
+        if not (self.raw_writes and supports_raw_access(source)):
+            zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+            zinfo.external_attr = info.external_attr
+            with source.open(info) as in_file:
+                return self.__write_entry__(zinfo, in_file, info.compress_type)
+
+        source.fp.seek(info.header_offset)
+        header = struct.unpack(zipfile.structFileHeader, source.fp.read(zipfile.sizeFileHeader))
+        name_length = header[zipfile._FH_FILENAME_LENGTH]  # pylint: disable=protected-access
+        extra_length = header[zipfile._FH_EXTRA_FIELD_LENGTH]  # pylint: disable=protected-access
+        source.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+
+        def chunks():
+            remaining = info.compress_size
+            while remaining > 0:
+                data = source.fp.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    raise zipfile.BadZipFile(f"Truncated member {info.filename} in {source.filename}")
+                remaining -= len(data)
+                yield data
+
+        self.__write_raw__(copy.copy(info), chunks())
+        entry = ZipEntry(info.filename, info.file_size, None, info.date_time)
+        self.entries.append(entry)
+        return entry
+
+
+    def __write_raw__(self, zinfo: zipfile.ZipInfo, chunks) -> None:
+        """ Write a member whose data is compressed already (its CRC and sizes are set in zinfo),
+        only if raw_writes is set (see supports_raw_access). """
+        zinfo.flag_bits &= ~0x08  # sizes and CRC are written in the header, not in a trailing data descriptor
+        zinfo.header_offset = self.zipf.start_dir
+        self.zipf.fp.seek(zinfo.header_offset)
+        self.zipf.fp.write(zinfo.FileHeader())
+        for data in chunks:
+            self.zipf.fp.write(data)
+        self.zipf.filelist.append(zinfo)
+        self.zipf.NameToInfo[zinfo.filename] = zinfo
+        self.zipf.start_dir = self.zipf.fp.tell()
+
+
+    def close(self, register: bool = True) -> list[ZipEntry]:
+        """ Finish the archive and keep its index in memory (see get_index). """
+        self.zipf.close()
+        if register:
+            register_index(self.zip_path, self.entries)
+        return self.entries
+
+
+def supports_raw_access(zipf: zipfile.ZipFile) -> bool:
+    """ Check if the internals of zipfile, which are used to read and write compressed member data as-is,
+    are available for the archive. """
+    return all(hasattr(zipfile, name) for name in RAW_ZIPFILE_NAMES) \
+        and all(hasattr(zipf, name) for name in RAW_ZIPFILE_ATTRIBUTES)
+
+
+def compress_type_of(path: str) -> int:
+    """ Stored for already compressed formats, deflated otherwise. """
+    return zipfile.ZIP_STORED if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def _prepare_member(path: str, compress_type: int, info: zipfile.ZipInfo|None):
+    """ Runs on the pool of add_files: returns the member of the previous archive if it is unchanged,
+    the deflated file as (CRC, size, SHA1, compressed chunks), or None if the file is streamed when it is written. """
+    size = os.path.getsize(path)
+    reusable = info is not None and info.compress_type == compress_type and not info.flag_bits & 0x01 \
+        and info.file_size == size
+    if not reusable and (compress_type == zipfile.ZIP_STORED or size > MAX_BUFFERED_SIZE):
+        return None
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if not reusable else None
+    crc = 0
+    sha1 = hashlib.sha1()
+    chunks = []
+    with open(path, "rb") as in_file:
+        while data := in_file.read(CHUNK_SIZE):
+            crc = zlib.crc32(data, crc)
+            if compressor is not None:
+                sha1.update(data)
+                chunks.append(compressor.compress(data))
+    if reusable:
+        if crc == info.CRC:
+            return info
+        # changed: compress it now (a second pass, but the file is in the page cache)
+        return _prepare_member(path, compress_type, None)
+    chunks.append(compressor.flush())
+    return crc, size, sha1.hexdigest(), [chunk for chunk in chunks if chunk]
+
+
+def update_archive(zip_path: str, files: list[tuple[str, str]], jobs: int|None = None) -> tuple[int, int]:
+    """ Write the archive of the files (path, arcname), reusing the unchanged members of the previous archive
+    and compressing the others in parallel (see ZipStreamWriter.add_files). The archive is replaced atomically.
+    Returns the numbers of copied and newly compressed members. """
+    previous = None
+    if os.path.exists(zip_path):
+        try:
+            previous = zipfile.ZipFile(zip_path, 'r')
+        except (OSError, zipfile.BadZipFile):
+            previous = None  # rebuilt completely
+    tmp_path = zip_path + ".tmp"
+    try:
+        writer = ZipStreamWriter(tmp_path, zipfile.ZIP_DEFLATED)
+        try:
+            copied = writer.add_files(files, jobs, previous)
+        finally:
+            entries = writer.close(register=False)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if previous is not None:
+            previous.close()
+    os.replace(tmp_path, zip_path)
+    register_index(zip_path, entries)
+    return copied, len(files) - copied
+
+
+_indexes: dict[str, tuple] = {}
+_indexes_lock = threading.Lock()
+
+
+def register_index(zip_path: str, entries: list[ZipEntry]) -> None:
+    """ Remember the index of a written archive, bound to its current size and modification time. """
+    stat = os.stat(zip_path)
+    with _indexes_lock:
+        _indexes[os.path.abspath(zip_path)] = (stat.st_size, stat.st_mtime_ns, entries)
+
+
+def get_index(zip_path: str) -> list[ZipEntry]|None:
+    """ Return the index of an archive written in this process, None if unknown or modified since. """
+    with _indexes_lock:
+        known = _indexes.get(os.path.abspath(zip_path))
+    if known is None:
+        return None
+    try:
+        stat = os.stat(zip_path)
+    except OSError:
+        return None
+    if (stat.st_size, stat.st_mtime_ns) != known[:2]:
+        return None
+    return known[2]
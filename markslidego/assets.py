@@ -0,0 +1,166 @@
+""" Asset references (images, links, backgrounds) in Markdown slide decks.
+
+All local references are found by one regular expression, which covers
+- Markdown images and links, including Marp background images: ![bg left](images/bg.jpg)
+  (paths may contain spaces, an optional "title" is not part of the path)
+- HTML images: <img src="images/diagram.svg">
+- CSS urls, e.g. in Marp backgroundImage directives: url('images/bg.jpg')
+References with a scheme (http://, https://, data:, mailto:, ...) and anchors (#...) are ignored.
+
+Referenced assets are materialized in the output directories as reflinks (copy-on-write clones) or hardlinks
+where the filesystem supports it, and are not copied again while they are up to date.
+"""
+import hashlib
+import os
+import re
+import shutil
+import threading
+from collections.abc import Callable
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+from markslidego.archive import CHUNK_SIZE
+
+
+FICLONE = 0x40049409  # Linux ioctl to clone a file (reflink on Btrfs, XFS, ...)
+
+
+ASSET_PATTERN = re.compile(
+    r'\[.*?\]\(\s*(?P<link>[^)\s][^)\n]*?)(?:\s+"[^"\n]*")?\s*\)'
+    r'|<img\b[^>]*?\bsrc=(?P<quote>["\'])(?P<src>[^"\'>]+)(?P=quote)'
+    r'|\burl\((?P<url_quote>["\']?)(?P<url>[^"\')\s]+)(?P=url_quote)\)',
+    re.IGNORECASE)
+PATH_GROUPS = ("link", "src", "url")
+REMOTE_PATTERN = re.compile(r'^(?:[a-zA-Z][a-zA-Z0-9+.-]+:|#)')
+
+
+def is_local(path: str) -> bool:
+    """ Check if the reference is a local (relative or absolute) file path. """
+    return not REMOTE_PATTERN.match(path)
+
+
+def find_asset_links(content: str) -> list[str]:
+    """ Return the unique local references in the content, in order of their first occurrence. """
+    links = {}
+    for match in ASSET_PATTERN.finditer(content):
+        path = next(match.group(group) for group in PATH_GROUPS if match.group(group) is not None)
+        if is_local(path):
+            links[path] = None
+    return list(links)
+
+
+def rewrite_asset_links(content: str, rewrite: Callable[[str], str|None]) -> str:
+    """ Rewrite all local references in a single pass over the content. The rewrite function is called
+    once per unique reference and returns the new path (or None to keep the reference unchanged). """
+    rewritten: dict[str, str|None] = {}
+
+    def replace(match: re.Match) -> str:
+        group = next(group for group in PATH_GROUPS if match.group(group) is not None)
+        path = match.group(group)
+        if not is_local(path):
+            return match.group(0)
+        if path not in rewritten:
+            rewritten[path] = rewrite(path)
+        new_path = rewritten[path]
+        if new_path is None:
+            return match.group(0)
+        start, end = match.start(group) - match.start(0), match.end(group) - match.start(0)
+        return match.group(0)[:start] + new_path + match.group(0)[end:]
+
+    return ASSET_PATTERN.sub(replace, content)
+
+
+_stats = {'copied': 0, 'linked': 0, 'skipped': 0}  # bytes per kind of materialization
+_stats_lock = threading.Lock()
+
+
+def _count(kind: str, size: int) -> None:
+    with _stats_lock:
+        _stats[kind] += size
+
+
+def file_hash(path: str) -> str:
+    """ SHA1 of the file content. """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        while data := f.read(CHUNK_SIZE):
+            sha1.update(data)
+    return sha1.hexdigest()
+
+
+def _is_up_to_date(source: str, source_stat: os.stat_result, target: str) -> bool:
+    try:
+        target_stat = os.stat(target)
+    except OSError:
+        return False
+    if os.path.samestat(source_stat, target_stat):
+        return True  # already linked
+    if source_stat.st_size != target_stat.st_size:
+        return False
+    if source_stat.st_mtime_ns == target_stat.st_mtime_ns:
+        return True
+    if file_hash(source) != file_hash(target):
+        return False
+    # same content, so take over the modification time to skip the hashing next time
+    os.utime(target, ns=(target_stat.st_atime_ns, source_stat.st_mtime_ns))
+    return True
+
+
+def reflink(source: str, target: str) -> bool:
+    """ Clone the source file to the target (copy-on-write), returns False if the filesystem doesn't support it. """
+    if fcntl is None:
+        return False
+    try:
+        with open(source, "rb") as in_file, open(target, "wb") as out_file:
+            fcntl.ioctl(out_file.fileno(), FICLONE, in_file.fileno())
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+    shutil.copystat(source, target)
+    return True
+
+
+def _hardlink(source: str, target: str) -> bool:
+    try:
+        os.link(source, target)
+    except OSError:
+        return False
+    return True
+
+
+def materialize_asset(source: str, target: str) -> None:
+    """ Provide the source file at the target path: nothing is done if the target is up to date (same size and
+    modification time or content), otherwise it is reflinked or hardlinked if possible, or else copied.
+    Set ASSET_LINKS='copy' in the environment to always copy.
+    Raises FileNotFoundError if the source doesn't exist. """
+    source_stat = os.stat(source)
+    if _is_up_to_date(source, source_stat, target):
+        _count('skipped', source_stat.st_size)
+        return
+    if os.path.lexists(target):
+        os.remove(target)  # never write through an earlier link into its source file
+    link = os.getenv('ASSET_LINKS', 'auto').lower() != 'copy'
+    if link and (reflink(source, target) or _hardlink(source, target)):
+        _count('linked', source_stat.st_size)
+        return
+    shutil.copy2(source, target)
+    _count('copied', source_stat.st_size)
+
+
+def materialize_tree(source_dir: str, target_dir: str) -> None:
+    """ Materialize all files of the source directory (recursively) in the target directory. """
+    for root, _, files in os.walk(source_dir):
+        root_target = os.path.join(target_dir, os.path.relpath(root, source_dir))
+        os.makedirs(root_target, exist_ok=True)
+        for file in files:
+            materialize_asset(os.path.join(root, file), os.path.join(root_target, file))
+
+
+def materialize_report() -> str:
+    """ Summary of the materialized assets (of this process). """
+    with _stats_lock:
+        stats = dict(_stats)
+    return (f"Assets: {stats['copied']} bytes copied, {stats['linked'] + stats['skipped']} bytes not copied "
+            f"({stats['linked']} bytes linked, {stats['skipped']} bytes up to date)")
@@ -0,0 +1,146 @@
+""" Content-hash based build cache for incremental builds.
+
+Every generated file is recorded in a manifest (output/.msgo-cache.json) together with a key,
+which is a hash over everything the file was built from (sources, referenced assets, template,
+options, tool versions). A file is only rebuilt when its key changes, so files which were
+merely touched (git checkout, restored CI caches) don't trigger a rebuild.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from markslidego.assets import find_asset_links
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+CACHE_FILE = os.path.join("output", ".msgo-cache.json")
+SAVE_INTERVAL = 10  # seconds between intermediate saves of the manifest during a build
+
+
+def referenced_assets(content: str, base_dir: str) -> list[str]:
+    """ Return the existing local files referenced by image/link-tags in the Markdown content. """
+    assets = []
+    for link in find_asset_links(content):
+        asset_path = os.path.join(base_dir, link)
+        if os.path.isfile(asset_path):
+            assets.append(asset_path)
+    return assets
+
+
+class BuildCache:
+    """ Manifest of the generated files and the keys they were built with. """
+
+    def __init__(self, cache_file: str = CACHE_FILE) -> None:
+        self.cache_file = os.path.abspath(cache_file)
+        self.base_dir = os.path.dirname(self.cache_file)
+        self.outputs: dict[str, str] = {}        # output path -> build key
+        self.hashes: dict[str, list] = {}        # file path -> [size, mtime_ns, sha1]
+        self.lock = threading.RLock()
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        self.__load__()
+
+
+    def __load__(self) -> None:
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable build cache %s: %s", self.cache_file, e)
+            return
+        if data.get('version') == CACHE_VERSION:
+            self.outputs = data.get('outputs', {})
+            self.hashes = data.get('hashes', {})
+
+
+    def save(self) -> None:
+        """ Write the manifest (atomically, so an interrupted build can't corrupt it). """
+        with self.lock:
+            os.makedirs(self.base_dir, exist_ok=True)
+            tmp_file = self.cache_file + ".tmp"
+            with open(tmp_file, 'w', encoding="utf-8") as file:
+                json.dump({'version': CACHE_VERSION, 'outputs': self.outputs, 'hashes': self.hashes},
+                          file, indent=1, sort_keys=True)
+            os.replace(tmp_file, self.cache_file)
+            self.dirty = False
+            self.saved_at = time.monotonic()
+
+
+    def flush(self) -> None:
+        """ Save the manifest if outputs were recorded since the last save (call at the end of a build). """
+        with self.lock:
+            if self.dirty:
+                self.save()
+
+
+    def relpath(self, path: str) -> str:
+        """ Path relative to the cache location, so the cache survives moving the course. """
+        return os.path.relpath(os.path.abspath(path), self.base_dir).replace('\\', '/')
+
+
+    def hash_file(self, path: str) -> str|None:
+        """ SHA1 of the file content, only re-read when size or modification time changed. """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        rel_path = self.relpath(path)
+        with self.lock:
+            known = self.hashes.get(rel_path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            while data := f.read(65536):  # Read in 64k chunks
+                sha1.update(data)
+        digest = sha1.hexdigest()
+        with self.lock:
+            self.hashes[rel_path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+
+    def key(self, files: list[str], values: dict|None = None) -> str:
+        """ Build key over the contents of the files and further values (options, versions, ...). """
+        hasher = hashlib.sha1()
+        hasher.update(json.dumps(values or {}, sort_keys=True, default=str).encode("utf-8"))
+        for rel_path, path in sorted({self.relpath(f): f for f in files}.items()):
+            hasher.update(f"\n{rel_path}:{self.hash_file(path)}".encode("utf-8"))
+        return hasher.hexdigest()
+
+
+    def is_up_to_date(self, target: str, key: str) -> bool:
+        """ Check if the target exists and was built with the same key. """
+        if not os.path.exists(target):
+            return False
+        with self.lock:
+            return self.outputs.get(self.relpath(target)) == key
+
+
+    def update(self, target: str, key: str) -> None:
+        """ Record that the target was (successfully) built with the key.
+        The manifest is saved every SAVE_INTERVAL seconds (so an interrupted build keeps most of it) and on flush(). """
+        with self.lock:
+            self.outputs[self.relpath(target)] = key
+            self.dirty = True
+            if time.monotonic() - self.saved_at >= SAVE_INTERVAL:
+                self.save()
+
+
+_caches: dict[str, BuildCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_build_cache(cache_file: str = CACHE_FILE) -> BuildCache:
+    """ Return the (shared) build cache for the given manifest file. """
+    with _caches_lock:
+        cache_path = os.path.abspath(cache_file)
+        if cache_path not in _caches:
+            _caches[cache_path] = BuildCache(cache_file)
+        return _caches[cache_path]
@@ -0,0 +1,37 @@
+""" Locating the courses and their templates in the repository (courses/, catalogs/).
+
+Kept free of the generation modules (which need the Marp setup at import), so the dependency index can use it.
+"""
+import os
+
+
+def resolve_course(course: str) -> tuple[str, str]|None:
+    """ Resolve a course argument (YAML file, course directory or course name in courses/)
+    to ("yaml", <yaml file>) for YAML-defined courses or ("moodle", <course directory>) otherwise. """
+    if course.endswith(".yml"):
+        return "yaml", course
+    course_dir = course if os.path.isdir(course) else os.path.join("courses", course)
+    course_name = os.path.basename(os.path.normpath(course_dir))
+    if not os.path.isdir(course_dir) or course_name.startswith("_"):
+        return None  # no course, e.g. README.md or _template when called with courses/*
+    yaml_file = os.path.join(course_dir, course_name + ".yml")
+    if os.path.exists(yaml_file):
+        return "yaml", yaml_file
+    return "moodle", course_dir
+
+
+def find_template_directory(start_dir: str|None = None) -> str|None:
+    """ Find the _template directory in the start directory (default: working directory) or its parents,
+    the TEMPLATE_DIR environment variable takes precedence. """
+    template_dir = os.environ.get('TEMPLATE_DIR', '')
+    if template_dir and os.path.exists(template_dir):
+        return template_dir
+
+    current_dir = os.path.abspath(start_dir or os.getcwd())
+    while True:
+        if "_template" in os.listdir(current_dir):
+            return os.path.abspath(os.path.join(current_dir, "_template"))
+        parent_dir = os.path.dirname(current_dir)
+        if parent_dir == current_dir:
+            return None
+        current_dir = parent_dir
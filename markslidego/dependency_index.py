@@ -0,0 +1,235 @@
+""" Dependency index of the courses: which outputs depend on which catalog files, assets and templates.
+
+The index (.msgo-deps.json in the repository root, next to courses/ and catalogs/) maps each output of a course,
+identified as (course, topic, deck), to the Markdown files it is built from. The assets referenced by each
+Markdown file are recorded separately, so a course YAML file or Markdown file is only parsed again when it changed.
+From this the reverse mapping (file -> outputs) is derived, which answers "what is affected by these files"
+without walking or parsing anything. Changes of a course YAML file or its template affect all outputs of the course.
+For Moodle courses (course directories without YAML file) every Markdown file in the course directory is a deck.
+"""
+import json
+import logging
+import os
+import threading
+import yaml
+from markslidego.build_cache import referenced_assets
+from markslidego.courses import find_template_directory, resolve_course
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_FILE = ".msgo-deps.json"
+
+
+def file_stamp(path: str) -> list[int]|None:
+    """ Size and modification time of the file, None if it doesn't exist. """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class DependencyIndex:
+    """ Persisted index of the files (sources, assets, templates) the outputs of the courses depend on.
+    Relative paths are relative to the repository root. """
+
+    def __init__(self, root_dir: str = ".") -> None:
+        self.root_dir = os.path.abspath(root_dir)
+        self.index_file = os.path.join(self.root_dir, INDEX_FILE)
+        self.courses: dict[str, dict] = {}   # course (YAML file or directory) -> stamp, kind, template, outputs
+        self.sources: dict[str, dict] = {}   # Markdown file -> stamp, referenced assets
+        self.dependents: dict[str, set[tuple[str, str, str]]] = {}  # file -> outputs (course, topic, deck)
+        self.lock = threading.RLock()
+        self.dirty = False
+        self.__load__()
+
+
+    def __load__(self) -> None:
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable dependency index %s: %s", self.index_file, e)
+            return
+        if data.get('version') == INDEX_VERSION:
+            self.courses = data.get('courses', {})
+            self.sources = data.get('sources', {})
+            self.__reindex__()
+
+
+    def save(self) -> None:
+        """ Write the index (atomically), if it changed. """
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp_file = self.index_file + ".tmp"
+            with open(tmp_file, 'w', encoding="utf-8") as file:
+                json.dump({'version': INDEX_VERSION, 'courses': self.courses, 'sources': self.sources},
+                          file, indent=1, sort_keys=True)
+            os.replace(tmp_file, self.index_file)
+            self.dirty = False
+
+
+    def relpath(self, path: str) -> str:
+        """ Path relative to the repository root, as used in the index. """
+        return os.path.relpath(self.abspath(path), self.root_dir).replace('\\', '/')
+
+
+    def abspath(self, path: str) -> str:
+        """ Absolute path of a path (relative paths are relative to the repository root). """
+        return os.path.normpath(os.path.join(self.root_dir, path))
+
+
+    def update(self, courses_dir: str = "courses") -> None:
+        """ Bring the index up to date with all courses of the courses directory (and save it). """
+        courses_dir = os.path.join(self.root_dir, courses_dir)
+        found = set()
+        for name in sorted(os.listdir(courses_dir)) if os.path.isdir(courses_dir) else []:
+            resolved = resolve_course(os.path.join(courses_dir, name))
+            if resolved is None:
+                continue
+            kind, path = resolved
+            found.add(self.update_course(path) if kind == "yaml" else self.update_moodle_course(path))
+        with self.lock:
+            prefix = self.relpath(courses_dir) + "/"
+            removed = [c for c in self.courses if c.startswith(prefix) and c not in found]
+            for course in removed:
+                del self.courses[course]
+            if removed:
+                self.dirty = True
+                self.__reindex__()
+        self.save()
+
+
+    def update_course(self, yaml_file: str, template_dir: str|None = None) -> str:
+        """ Index the outputs of a YAML-defined course, only parsing the files which changed. Returns the course. """
+        yaml_file = self.abspath(yaml_file)
+        course = self.relpath(yaml_file)
+        template_dir = template_dir or find_template_directory(os.path.dirname(yaml_file))
+        template = self.relpath(template_dir) if template_dir else None
+        stamp = file_stamp(yaml_file)
+        with self.lock:
+            entry = self.courses.get(course)
+            changed = entry is None or entry['stamp'] != stamp or entry['template'] != template
+            if changed:
+                entry = {'kind': "yaml", 'stamp': stamp, 'template': template,
+                         'outputs': self.__course_outputs__(yaml_file)}
+                self.courses[course] = entry
+            self.__update_sources__(entry, changed)
+        return course
+
+
+    def update_moodle_course(self, course_dir: str) -> str:
+        """ Index the decks of a Moodle course directory. Returns the course. """
+        course_dir = self.abspath(course_dir)
+        course = self.relpath(course_dir)
+        outputs = {}
+        for root, dirs, files in os.walk(course_dir):
+            dirs[:] = [d for d in dirs if d != "output" and not d.startswith(".")]
+            for file in files:
+                if file.endswith(".md"):
+                    md_path = os.path.relpath(os.path.join(root, file), course_dir).replace('\\', '/')
+                    outputs[md_path] = [self.relpath(os.path.join(root, file))]
+        with self.lock:
+            entry = self.courses.get(course)
+            changed = entry is None or entry['outputs'] != outputs
+            if changed:
+                entry = {'kind': "moodle", 'stamp': None, 'template': None, 'outputs': outputs}
+                self.courses[course] = entry
+            self.__update_sources__(entry, changed)
+        return course
+
+
+    def __course_outputs__(self, yaml_file: str) -> dict[str, list[str]]:
+        """ The Markdown files of each output (topic/deck) of the course YAML file. """
+        course_dir = os.path.dirname(yaml_file)
+        catalogs_dir = os.path.join(course_dir, "..", "..", "catalogs")
+        with open(yaml_file, 'r', encoding="utf-8") as file:
+            data = yaml.safe_load(file)
+        outputs = {}
+        for data_topic in data.get('topics') or []:
+            name = data_topic['name']
+            for slide in data_topic.get('slides') or []:
+                intermediate_file = os.path.splitext(slide['target'])[0] + ".md"
+                sources = [slide['source']] if 'source' in slide else slide.get('sources') or []
+                if sources:
+                    files = [os.path.join(catalogs_dir, source) for source in sources]
+                else:
+                    # provided file of the course (see prepare_course_topic)
+                    files = [os.path.join(course_dir, "moodle", name, intermediate_file)]
+                deck = f"{name}/{os.path.basename(intermediate_file)}"
+                outputs.setdefault(deck, [])
+                outputs[deck] += [self.relpath(f) for f in files if self.relpath(f) not in outputs[deck]]
+        return outputs
+
+
+    def __update_sources__(self, entry: dict, changed: bool) -> None:
+        """ Update the Markdown files of the course entry, and the reverse mapping if anything changed. """
+        for files in entry['outputs'].values():
+            for md_file in files:
+                changed = self.__update_source__(md_file) or changed
+        if changed:
+            self.dirty = True
+            self.__reindex__()
+
+
+    def __update_source__(self, md_file: str) -> bool:
+        """ Re-read the referenced assets of the Markdown file, if it changed. """
+        path = self.abspath(md_file)
+        stamp = file_stamp(path)
+        known = self.sources.get(md_file)
+        if known is not None and known['stamp'] == stamp:
+            return False
+        assets = []
+        if stamp is not None:
+            with open(path, 'r', encoding="utf-8") as file:
+                assets = [self.relpath(a) for a in referenced_assets(file.read(), os.path.dirname(path))]
+        self.sources[md_file] = {'stamp': stamp, 'assets': assets}
+        return True
+
+
+    def __reindex__(self) -> None:
+        """ Derive the reverse mapping: file -> outputs. """
+        dependents = {}
+        for course, entry in self.courses.items():
+            for deck, files in entry['outputs'].items():
+                topic, deck_name = deck.rsplit("/", 1) if "/" in deck else ("", deck)
+                output = (course, topic, deck_name)
+                for md_file in files:
+                    dependents.setdefault(md_file, set()).add(output)
+                    for asset in self.sources.get(md_file, {}).get('assets', []):
+                        dependents.setdefault(asset, set()).add(output)
+        self.dependents = dependents
+
+
+    def outputs(self, course: str) -> set[tuple[str, str, str]]:
+        """ All outputs (course, topic, deck) of the course. """
+        entry = self.courses.get(course, {'outputs': {}})
+        return {(course,) + (tuple(deck.rsplit("/", 1)) if "/" in deck else ("", deck)) for deck in entry['outputs']}
+
+
+    def affected_courses(self, paths: list[str]) -> set[str]:
+        """ The courses of which all outputs are affected by the files (course YAML file or template changed). """
+        courses = set()
+        with self.lock:
+            for rel_path in (self.relpath(path) for path in paths):
+                for course, entry in self.courses.items():
+                    template = entry['template']
+                    if rel_path == course or (template and rel_path.startswith(template + "/")):
+                        courses.add(course)
+        return courses
+
+
+    def affected(self, paths: list[str]) -> set[tuple[str, str, str]]:
+        """ The outputs (course, topic, deck) affected by the changed files. """
+        with self.lock:
+            outputs = set()
+            for course in self.affected_courses(paths):
+                outputs |= self.outputs(course)
+            for path in paths:
+                outputs |= self.dependents.get(self.relpath(path), set())
+            return outputs
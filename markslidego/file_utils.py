@@ -1,6 +1,6 @@
 """ Utility functions for file operations """
 import os
-import zipfile
+from markslidego.archive import ZipStreamWriter
 
 
 def remove_dir_recursively(path:str) -> None:
@@ -20,13 +20,12 @@ def remove_file_if_exists(filepath:str) -> None:
         os.remove(filepath)
 
 
-def zip_current_directory(extension:str = ".zip") -> None:
-    """ Create a zip archive of the current directory """
-    archive_filename = os.path.basename(os.getcwd()) + extension
-    zip_path = os.path.join("..", archive_filename)
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk("."):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, ".")
-                zipf.write(file_path, arcname)
+def zip_directory(directory:str, zip_path:str, jobs:int|None = None) -> None:
+    """ Create a zip archive with the contents of the directory (compressed in parallel, see archive module) """
+    files = []
+    for root, _, filenames in os.walk(directory):
+        for file in filenames:
+            file_path = os.path.join(root, file)
+            files.append((file_path, os.path.relpath(file_path, directory)))
+    with ZipStreamWriter(zip_path) as writer:
+        writer.add_files(files, jobs)
@@ -0,0 +1,115 @@
+""" Compilation PDFs of several sources, assembled from one PDF fragment per source.
+
+The fragment decks (title with table of contents, then one deck per source) and their manifest are written to
+<output dir>/.fragments/<deck>/ by the preprocessing. Each fragment is rendered (and cached) on its own, so editing
+one source only renders its fragment again. The fragments are then concatenated into the compilation PDF
+(only if each of them was rendered with its current build-cache key),
+with the outlines (bookmarks) moved to the pages in the compilation and continuous page labels.
+Page numbers which the Marp theme renders onto the slides start again in each fragment.
+"""
+import json
+import logging
+import os
+import fitz  # PyMuPDF
+from markslidego.build_cache import get_build_cache
+
+
+FRAGMENTS_DIR = ".fragments"
+FRAGMENTS_MANIFEST = "fragments.json"
+FRAGMENTS_KEYS = "keys.json"
+
+
+logger = logging.getLogger(__name__)
+
+
+def fragments_directory(target_file: str) -> str:
+    """ The directory of the fragments of a compilation (hidden, so it isn't packaged with the outputs). """
+    target_name, _ = os.path.splitext(os.path.basename(target_file))
+    return os.path.join(os.path.dirname(target_file), FRAGMENTS_DIR, target_name)
+
+
+def fragment_pdf(fragment_file: str) -> str:
+    """ The rendered PDF of a fragment deck. """
+    return os.path.splitext(fragment_file)[0] + ".pdf"
+
+
+def write_if_changed(path: str, content: str) -> None:
+    """ Write the file only if its content changed, so unchanged fragments keep their modification time. """
+    if os.path.exists(path):
+        with open(path, 'r', encoding="utf-8") as file:
+            if file.read() == content:
+                return
+    with open(path, 'w', encoding="utf-8") as file:
+        file.write(content)
+
+
+def write_manifest(manifest_file: str, fragment_files: list[str]) -> None:
+    """ Record the fragment decks of a compilation (in order). """
+    manifest_dir = os.path.dirname(manifest_file)
+    fragments = [os.path.relpath(f, manifest_dir).replace('\\', '/') for f in fragment_files]
+    write_if_changed(manifest_file, json.dumps({'fragments': fragments}, indent=1))
+
+
+def read_manifest(manifest_file: str) -> list[str]:
+    """ The fragment decks of a compilation (in order). """
+    with open(manifest_file, 'r', encoding="utf-8") as file:
+        fragments = json.load(file)['fragments']
+    return [os.path.join(os.path.dirname(manifest_file), f) for f in fragments]
+
+
+def write_keys(manifest_file: str, cache_file: str, keys: list[str]) -> None:
+    """ Record the build cache and the keys the fragments of a compilation have to be rendered with (in order). """
+    manifest_dir = os.path.dirname(manifest_file)
+    cache_path = os.path.relpath(cache_file, manifest_dir).replace('\\', '/')
+    write_if_changed(os.path.join(manifest_dir, FRAGMENTS_KEYS), json.dumps({'cache': cache_path, 'keys': keys}, indent=1))
+
+
+def is_rendered(manifest_file: str) -> list[bool]:
+    """ Check for each fragment of a compilation if it was rendered with its recorded key
+    (without recorded keys only if its PDF exists). """
+    fragment_files = read_manifest(manifest_file)
+    keys_file = os.path.join(os.path.dirname(manifest_file), FRAGMENTS_KEYS)
+    if not os.path.exists(keys_file):
+        return [os.path.exists(fragment_pdf(f)) for f in fragment_files]
+    with open(keys_file, 'r', encoding="utf-8") as file:
+        recorded = json.load(file)
+    cache = get_build_cache(os.path.join(os.path.dirname(manifest_file), recorded['cache']))
+    keys = recorded['keys'] + [None] * (len(fragment_files) - len(recorded['keys']))
+    return [key is not None and cache.is_up_to_date(fragment_pdf(f), key) for f, key in zip(fragment_files, keys)]
+
+
+def is_manifest(path: str) -> bool:
+    """ Check if the path is the manifest of a compilation (which is assembled instead of rendered). """
+    return os.path.basename(path) == FRAGMENTS_MANIFEST
+
+
+def assemble_pdf(manifest_file: str, target: str) -> bool:
+    """ Concatenate the rendered fragments of the manifest into the target PDF. """
+    parts = []
+    for fragment_file, rendered in zip(read_manifest(manifest_file), is_rendered(manifest_file)):
+        pdf_file = fragment_pdf(fragment_file)
+        if not rendered:
+            logger.error("Fragment %s of %s was not rendered", pdf_file, target)
+            return False
+        parts.append(pdf_file)
+
+    logger.info("Assembling %s from %d fragments ...", target, len(parts))
+    with fitz.open() as doc:
+        toc = []
+        for pdf_file in parts:
+            with fitz.open(pdf_file) as part:
+                offset = doc.page_count
+                if offset == 0:
+                    doc.set_metadata(part.metadata)
+                doc.insert_pdf(part)
+                for level, title, page in part.get_toc(simple=True):
+                    # the levels must not skip a level (set_toc rejects that)
+                    level = min(level, toc[-1][0] + 1) if toc else 1
+                    toc.append([level, title, page + offset if page > 0 else page])
+        doc.set_toc(toc)
+        doc.set_page_labels([{'startpage': 0, 'prefix': '', 'style': 'D', 'firstpagenum': 1}])
+        # garbage collection merges the fonts and images the fragments have in common
+        tmp_file = target + ".tmp"
+        doc.save(tmp_file, garbage=3, deflate=True)
+    os.replace(tmp_file, target)
+    return True
@@ -1,12 +1,24 @@
 #!/usr/bin/env python3
 """ Generate slides (as PDF, PPTX or HTML files) from Markdown files using Marp. """
-import re
+import functools
+import glob
+import itertools
+import json
 import os
 import sys
 import subprocess
 import logging
-import zipfile
+import yaml
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from tqdm.autonotebook import tqdm
+from markslidego import marp_worker
+from markslidego.archive import ZipEntry, ZipStreamWriter
+from markslidego.assets import materialize_tree, rewrite_asset_links
+from markslidego.build_cache import BuildCache, referenced_assets
+from markslidego.fragments import assemble_pdf, is_manifest
+from markslidego.render_cache import get_render_cache
 
 
 load_dotenv()  # take environment variables from .env.
@@ -35,28 +47,59 @@ if not os.path.exists(MARKSLIDE_DIR):
     "to the .env file (or to the path of the installed MarkSlideGo scripts).", MARKSLIDE_DIR)
     sys.exit(1)
 
+TEMPLATE_ASSETS_DIR = "_template"  # assets of the course template, shared by the decks of an output directory
+
+# Options passed to marp for every generated output
+MARP_OPTIONS = ["--html", "--pdf-outlines", "--pdf-outlines.pages=false",
+    "--pdf-notes", "--allow-local-files"]
+MARP_CONFIG_FILES = (".marprc", ".marprc.yml", ".marprc.yaml", ".marprc.json")
+
+
+def marp_theme_files(start_dir: str|None = None) -> list[str]:
+    """ The theme CSS files Marp loads: the themeSet of the Marp configuration file,
+    which Marp looks up from the working directory (default) upwards. """
+    current_dir = os.path.abspath(start_dir or os.getcwd())
+    while True:
+        for name in MARP_CONFIG_FILES:
+            config_file = os.path.join(current_dir, name)
+            if os.path.isfile(config_file):
+                return _theme_set(config_file)
+        parent_dir = os.path.dirname(current_dir)
+        if parent_dir == current_dir:
+            return []
+        current_dir = parent_dir
+
+
+def _theme_set(config_file: str) -> list[str]:
+    try:
+        with open(config_file, 'r', encoding="utf-8") as file:
+            config = yaml.safe_load(file) or {}  # JSON is YAML as well
+    except (OSError, yaml.YAMLError) as e:
+        logger.warning("Could not read the Marp configuration %s: %s", config_file, e)
+        return []
+    theme_set = config.get('themeSet', []) if isinstance(config, dict) else []
+    files = []
+    for path in [theme_set] if isinstance(theme_set, str) else theme_set:
+        path = os.path.normpath(os.path.join(os.path.dirname(config_file), path))
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '**', '*.css'), recursive=True)))
+        elif os.path.isfile(path):
+            files.append(path)
+    return files
+
 
 
 def correct_relative_paths(content : str, source_file : str, target_file : str) -> str:
-    """ Correct relative paths in image/link-tags. """
+    """ Correct relative paths in image/link-tags (and HTML images, CSS urls), see assets module. """
     source_dir = os.path.dirname(source_file)
     target_dir = os.path.dirname(target_file)
 
-    # Find image/link tags with relative paths
-    # Ignore paths that start with "http://" or "https://"
-    img_tags = re.findall(r'\[.*?\]\((?!http://|https://)(.*?)\)', content)
-
-    for img_tag in img_tags:
-        # Calculate the absolute path of the image relative to the source folder
-        absolute_path = os.path.abspath(os.path.join(source_dir, img_tag))
-
+    def relative_to_target(link: str) -> str:
         # Calculate the new relative path from the target folder to the file
-        relative_path = os.path.relpath(absolute_path, target_dir).replace('\\', '/')
-
-        # Replace the old relative-path with the new relative-path in the content
-        content = content.replace(f'({img_tag})', f'({relative_path})')
+        absolute_path = os.path.abspath(os.path.join(source_dir, link))
+        return os.path.relpath(absolute_path, target_dir).replace('\\', '/')
 
-    return content
+    return rewrite_asset_links(content, relative_to_target)
 
 
 def create_ims_manifest(target_file: str, course: str, course_title: str, title: str) -> None:
@@ -106,48 +149,49 @@ def copy_file_with_assets(source_file:str, dest_file:str) -> None:
     source_file_dir = source_file.replace('.md', '')
     if os.path.exists(source_file_dir):
         dest_file_dir = dest_file.replace('.md', '')
-        os.makedirs(dest_file_dir, exist_ok=True)
-        os.system(f"cp -r {source_file_dir}/* {dest_file_dir}")
-
-
-
-def is_source_newer(sourcefile :str, targetfile :str) -> bool:
-    """ Check if the source file is newer than the target file. """
-    if not os.path.exists(sourcefile):
-        return False
-    if not os.path.exists(targetfile):
-        return True
-
-    # Get the last modification times for both files
-    sourcefile_time = os.path.getmtime(sourcefile)
-    targetfile_time = os.path.getmtime(targetfile)
-
-    # Compare the modification times
-    return bool(sourcefile_time > targetfile_time)
-
-
-
-def is_any_source_newer(sourcefiles :list, targetfile :str) -> bool:
-    """ Check is any of the source files is newer than the target file. """
-    if not os.path.exists(targetfile):
-        return True
-
-    # Get the last modification time for the target file
-    targetfile_time = os.path.getmtime(targetfile)
-
-    # Compare the modification times
-    for sourcefile in sourcefiles:
-        if os.path.exists(sourcefile) and \
-            os.path.getmtime(sourcefile) > targetfile_time:
-            return True
-
-    # If none of the source files are newer, return False
-    return False
-
-
-
-def create_zip_archive(target: str) -> None:
-    """ Create a ZIP archive of the output file """
+        materialize_tree(source_file_dir, dest_file_dir)
+
+
+
+@functools.cache
+def marp_cli_version() -> str:
+    """ Return the version of the used marp-cli, so that upgrading Marp triggers a rebuild. """
+    package_file = os.path.join(MARKSLIDE_DIR, "node_modules", "@marp-team", "marp-cli", "package.json")
+    if os.path.exists(package_file):
+        with open(package_file, 'r', encoding="utf-8") as file:
+            return json.load(file).get('version', 'unknown')
+    version = marp_worker.version()
+    if version is not None:
+        return version
+    try:
+        result = subprocess.run([NPX_CMD, "marp", "--version"], capture_output=True, text=True,
+                                check=True, timeout=120)
+        return result.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+
+def render_key(cache: BuildCache, source: str, options: list|None = None,
+               theme_files: list|None = None, values: dict|None = None) -> str:
+    """ Build-cache key of a Marp output: the Markdown source, all referenced assets,
+    the theme files, the Marp options and the marp-cli version. """
+    with open(source, 'r', encoding="utf-8") as file:
+        content = file.read()
+    files = [source] + referenced_assets(content, os.path.dirname(source)) + (theme_files or [])
+    return cache.key(files, {
+        'marp-cli': marp_cli_version(),
+        'marp-options': MARP_OPTIONS,
+        'options': options or [],
+        **(values or {}),
+    })
+
+
+
+def create_zip_archive(target: str) -> list[ZipEntry]:
+    """ Create a ZIP archive of the output file, streaming all parts straight into the archive.
+    The SCORM manifest is taken from the .xml file next to the target (see create_ims_manifest).
+    Returns the index of the archive entries (names, sizes and SHA1 hashes). """
     target_dir = os.path.dirname(target)
     target_filename, _ = os.path.splitext(os.path.basename(target))
     target_assets_dir = os.path.join(target_dir, target_filename)
@@ -155,45 +199,141 @@ def create_zip_archive(target: str) -> None:
     intermediate_file = zip_file.replace('.zip', '.md')
     imsmanifest_file = zip_file.replace('.zip', '.xml')
     logger.info("Creating ZIP archive: %s ...", zip_file)
-    # Create a ZipFile object in WRITE mode
-    with zipfile.ZipFile(zip_file, 'w') as zipf:
-        # Add target file to the zip file
-        zipf.write(target, os.path.basename(target))
-        zipf.write(intermediate_file, os.path.basename(intermediate_file))
-        if os.path.exists(imsmanifest_file):
-            zipf.write(imsmanifest_file, "imsmanifest.xml")
-        # Add files from the target assets directory to the zip file
-        for foldername, _, filenames in os.walk(target_assets_dir):
-            for filename in filenames:
-                # create complete filepath of file in directory
-                filepath = os.path.join(foldername, filename)
-                # Add file to zip
-                zipf.write(filepath, os.path.relpath(filepath, start=target_dir))
-        # Add generation scripts to the zip file
-        generate_file = os.path.join(MARKSLIDE_DIR, 'generate.sh')
-        zipf.write(generate_file, os.path.relpath(generate_file, start=MARKSLIDE_DIR))
-        setup_file = os.path.join(MARKSLIDE_DIR, 'setup.sh')
-        zipf.write(setup_file, os.path.relpath(setup_file, start=MARKSLIDE_DIR))
+    files = [(target, os.path.basename(target)), (intermediate_file, os.path.basename(intermediate_file))]
+    if os.path.exists(imsmanifest_file):
+        files.append((imsmanifest_file, "imsmanifest.xml"))
+    # Add files from the target assets directory and the shared template assets to the zip file
+    template_assets_dir = os.path.join(target_dir, TEMPLATE_ASSETS_DIR)
+    for foldername, _, filenames in itertools.chain(os.walk(target_assets_dir), os.walk(template_assets_dir)):
+        for filename in filenames:
+            # create complete filepath of file in directory
+            filepath = os.path.join(foldername, filename)
+            files.append((filepath, os.path.relpath(filepath, start=target_dir)))
+    # Add generation scripts to the zip file
+    for script in ('generate.sh', 'setup.sh'):
+        files.append((os.path.join(MARKSLIDE_DIR, script), script))
+    with ZipStreamWriter(zip_file) as writer:
+        # the files are compressed in parallel, or stored if they are compressed already (PDF, images)
+        writer.add_files(files)
+    return writer.entries
+
+
+def run_marp(source: str, targets: list[str]) -> list[str]:
+    """ Run Marp for each target of the source, as a single job on the persistent render worker,
+    or as npx subprocesses if no worker is available. Returns the successfully generated targets. """
+    runs = [MARP_OPTIONS + [os.path.abspath(source), "-o", os.path.abspath(target)] for target in targets]
+    statuses = marp_worker.render(runs, os.getcwd())
+    if statuses is None:
+        statuses = [subprocess.run([NPX_CMD, "marp"] + MARP_OPTIONS + [source, "-o", target],
+                                   check=False).returncode for target in targets]
+
+    generated = []
+    for target, status in zip(targets, statuses):
+        if status == 0:
+            generated.append(target)
+        else:
+            logger.error("Marp failed to generate %s (exit code %d)", target, status)
+    return generated
+
+
+def generate_targets(source: str, targets: dict) -> list[str]:
+    """ Generate several files (e.g. PDF and SCORM-HTML) from one Markdown file, as one job
+    (Marp converts the deck once per target, as marp-cli can't write several formats from one conversion).
+    The targets dictionary maps each output file to its options, returns the generated files.
+    The compilation PDFs of a fragments manifest are assembled from the rendered fragments instead. """
+    if is_manifest(source):
+        return [target for target in targets if assemble_pdf(source, target)]
 
-
-def generate(source: str, target: str, options: list|None = None) -> bool:
-    """ Generate a PDF, PPTX or HTML file from a Markdown file using Marp. """
     # Check if the source file exists and is readable
-    if os.access(source, os.R_OK):
-        logger.debug("Processing file: %s", source)
-        logger.debug("Generating file: %s ...", target)
-        subprocess.run([NPX_CMD, "marp", "--html",
-        "--pdf-outlines", "--pdf-outlines.pages=false",
-        "--pdf-notes", "--allow-local-files", source, "-o", target], check=True)
-
+    if not os.access(source, os.R_OK):
+        logger.warning("Source file %s not found or is not readable", source)
+        return []
+
+    logger.debug("Processing file: %s", source)
+    logger.debug("Generating files: %s ...", ", ".join(targets))
+    generated = []
+    render_cache = get_render_cache()
+    if render_cache is not None:
+        # identical decks (e.g. of several courses) are rendered once, then taken from the render cache
+        values = {'marp-cli': marp_cli_version(), 'marp-options': MARP_OPTIONS}
+        themes = marp_theme_files()
+        keys = {target: render_cache.key(source, target, values, themes) for target in targets}
+        generated = [target for target in targets if render_cache.fetch(keys[target], target)]
+    rendered = run_marp(source, [target for target in targets if target not in generated])
+    if render_cache is not None:
+        for target in rendered:
+            render_cache.store(keys[target], target)
+    generated += rendered
+
+    for target in generated:
+        options = targets[target]
         if options:
             if "--zip" in options or "--scorm" in options:
                 create_zip_archive(target)
-    else:
-        logger.warning("Source file %s not found or is not readable", source)
-        return False
+    return generated
 
-    return True
+
+def generate(source: str, target: str, options: list|None = None) -> bool:
+    """ Generate a PDF, PPTX or HTML file from a Markdown file using Marp. """
+    return bool(generate_targets(source, {target: options}))
+
+
+def generate_parallel(jobs: list, max_workers: int = 1, desc: str = "Generating files",
+                      on_generated: Callable[[str], None]|None = None) -> int:
+    """ Generate the (source, target, options) jobs concurrently on a bounded pool of threads.
+    Jobs of the same source are rendered together, one after another (see generate_targets).
+    Compilations of fragments are assembled after all other jobs, when their fragments are rendered.
+    Returns the number of successfully generated files, failed jobs are logged and skipped.
+    The optional on_generated callback is called (in the calling thread) with each generated target. """
+    if not jobs:
+        return 0
+    sources: dict[str, dict] = {}
+    for source, target, options in jobs:
+        sources.setdefault(source, {})[target] = options
+    stages = [{source: targets for source, targets in sources.items() if not is_manifest(source)},
+              {source: targets for source, targets in sources.items() if is_manifest(source)}]
+
+    output_count = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor, \
+         tqdm(total=len(jobs), unit="file", desc=desc) as progress:
+        for stage in stages:
+            futures = {executor.submit(generate_targets, source, targets): targets
+                       for source, targets in stage.items()}
+            for future in as_completed(futures):
+                targets = futures[future]
+                try:
+                    generated = future.result()
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logger.error("Failed to generate %s: %s", ", ".join(targets), e)
+                    generated = []
+                for target in targets:
+                    if target in generated:
+                        output_count += 1
+                        if on_generated is not None:
+                            on_generated(target)
+                    else:
+                        failed.append(target)
+                progress.update(len(targets))
+    if failed:
+        logger.error("%d of %d files could not be generated: %s", len(failed), len(jobs), ", ".join(failed))
+    return output_count
+
+
+def pop_jobs_option(argv: list) -> int:
+    """ Remove the "--jobs N" option from the command line arguments and return N.
+    Defaults to 1 (sequential), N <= 0 uses one job per CPU core. """
+    jobs = 1
+    for option in ("--jobs", "-j"):
+        if option in argv:
+            idx = argv.index(option)
+            if idx + 1 >= len(argv):
+                raise ValueError(f"Missing value for {option}")
+            jobs = int(argv[idx + 1])
+            del argv[idx:idx + 2]
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    return jobs
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+""" Build only the outputs affected by a set of changed files (e.g. in CI after a push), across all courses.
+
+The changed files are given as paths or as git revision range. The affected outputs are resolved with the
+dependency index (course YAML files, sources, templates and referenced assets), then only those are preprocessed
+and rendered (like the batch target), the affected YAML-defined courses are packaged again and the affected
+Moodle courses are rebuilt.
+"""
+import logging
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from markslidego.assets import materialize_report
+from markslidego.dependency_index import DependencyIndex
+from markslidego.generate import pop_jobs_option
+from markslidego.generate_batch import render_deduplicated, split_jobs
+from markslidego.generate_course import find_template_directory, package_course, prepare_course
+from markslidego.generate_moodle import generate_moodle
+from markslidego.render_cache import render_cache_report
+
+
+logger = logging.getLogger(__name__)
+
+
+def changed_files(revision_range: str, root_dir: str = ".") -> list[str]:
+    """ The files changed in the git revision range (e.g. HEAD~1..HEAD), as absolute paths. """
+    toplevel = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=root_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    names = subprocess.run(["git", "diff", "--name-only", "--no-renames", revision_range], cwd=root_dir,
+                           capture_output=True, text=True, check=True).stdout.splitlines()
+    return [os.path.join(toplevel, name) for name in names if name]
+
+
+def affected_outputs(index: DependencyIndex, paths: list[str]) -> set[tuple[str, str, str]]:
+    """ The outputs (course, topic, deck) affected by the changed files, before and after updating the index
+    (e.g. of a removed image as well as of a newly referenced one). """
+    outputs = index.affected(paths)
+    index.update()
+    return outputs | index.affected(paths)
+
+
+def generate_affected(paths: list[str], jobs: int = 1, root_dir: str = ".") -> int:
+    """ Build the outputs affected by the changed files. Returns the number of generated items. """
+    index = DependencyIndex(root_dir)
+    outputs = affected_outputs(index, paths)
+    whole_courses = index.affected_courses(paths)
+    # courses removed by the change are not in the index anymore, there is nothing to build
+    courses = {course for course, _, _ in outputs if course in index.courses} | whole_courses
+    yaml_files = sorted(index.abspath(c) for c in courses if index.courses[c]['kind'] == "yaml")
+    # the Moodle backup contains all decks of the course, so it is generated completely
+    moodle_dirs = sorted(index.abspath(c) for c in courses if index.courses[c]['kind'] == "moodle")
+    print(f"{len(paths)} changed files affect {len(outputs)} outputs of {len(courses)} courses.")
+
+    def prepare(yaml_file: str) -> list:
+        course = index.relpath(yaml_file)
+        course_dir = os.path.dirname(yaml_file)
+        template_dir = find_template_directory(course_dir)
+        decks = None
+        if course not in whole_courses:
+            # the YAML file is loaded once, with the affected decks of each topic
+            decks = {}
+            for c, topic, deck in outputs:
+                if c == course:
+                    decks.setdefault(topic, set()).add(deck)
+        return [render_job + (course_dir,) for render_job in prepare_course(yaml_file, template_dir=template_dir,
+                                                                            decks=decks)]
+
+    render_jobs_count, backups, backup_jobs = split_jobs(jobs, len(moodle_dirs), bool(yaml_files))
+    with ThreadPoolExecutor(max_workers=max(1, backups)) as moodle_executor, \
+         ThreadPoolExecutor(max_workers=jobs) as executor:
+        moodle_futures = [moodle_executor.submit(generate_moodle, course_dir, jobs=backup_jobs)
+                          for course_dir in moodle_dirs]
+        render_jobs = [render_job for course_jobs in executor.map(prepare, yaml_files) for render_job in course_jobs]
+
+        output_count = render_deduplicated(render_jobs, render_jobs_count)
+        list(executor.map(package_course, yaml_files))
+        for future in moodle_futures:
+            future.result()
+    return output_count + len(moodle_dirs)
+
+
+if __name__ == "__main__":
+    jobs = pop_jobs_option(sys.argv)
+    dry_run = "--dry-run" in sys.argv
+    if dry_run:
+        sys.argv.remove("--dry-run")
+
+    if len(sys.argv) < 2:
+        script_file = os.path.basename(sys.argv[0])
+        print(f"Usage: {script_file} <revision-range> [--dry-run] [--jobs N]")
+        print(f"       {script_file} --paths <path>... [--dry-run] [--jobs N]")
+        print("Run in the repository root (containing courses/ and catalogs/).")
+        print("Examples:")
+        print(f"- build what the last commit affects:     {script_file} HEAD~1..HEAD --jobs 8")
+        print(f"- list the outputs affected by a file:    {script_file} --paths catalogs/prog/intro.md --dry-run")
+        sys.exit(0)
+
+    if sys.argv[1] == "--paths":
+        changed = [os.path.abspath(path) for path in sys.argv[2:]]
+    else:
+        changed = changed_files(sys.argv[1])
+
+    if dry_run:
+        for course, topic, deck in sorted(affected_outputs(DependencyIndex(), changed)):
+            print(f"{course}: {topic}/{deck}" if topic else f"{course}: {deck}")
+        sys.exit(0)
+
+    output_count = generate_affected(changed, jobs)
+    print(f"Generated {output_count} items.")
+    logger.info(materialize_report())
+    logger.info(render_cache_report())
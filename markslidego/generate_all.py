@@ -3,11 +3,11 @@
 import os
 import sys
 import fnmatch
-from tqdm.autonotebook import tqdm
-from markslidego.generate import generate
+from markslidego.generate import generate_parallel, pop_jobs_option
 
 
-print(f"Usage: {sys.argv[0]} [pdf|pptx|html] [--zip]")
+print(f"Usage: {sys.argv[0]} [pdf|pptx|html] [--zip] [--jobs N]")
+JOBS = pop_jobs_option(sys.argv)
 FILE_EXT = ".pdf"
 if len(sys.argv) >= 2:
     FILE_EXT = f".{sys.argv[1]}"
@@ -24,13 +24,15 @@ for root, dirs, files in os.walk('catalogs/'):
         md_files.append(os.path.join(root, file))
 
 
-# Iterate over all .md files with a progress bar
-for md_file in tqdm(md_files, unit="file", desc='Processing files'):
+# Collect the output file for every .md file
+jobs = []
+for md_file in md_files:
     #print(f'Processing {md_file}')
 
     # Replace all "/" in the filename with "-"
     output_file = md_file.replace('catalogs/', 'output/').replace('.md', FILE_EXT)
     #print(f'Generate     {output_file} ...')
+    jobs.append((md_file, output_file, OPTIONS))
 
-    # Generate the output file
-    generate(md_file, output_file, OPTIONS)
+# Generate the output files with a progress bar
+generate_parallel(jobs, JOBS, desc='Processing files')
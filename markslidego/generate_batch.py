@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+""" Build many courses in one run: the slide decks of all courses are rendered on one pool of jobs,
+decks which are shared by several courses (same content, assets, themes and options) are only rendered once,
+wherever the courses place them. """
+import logging
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from markslidego.assets import materialize_report
+from markslidego.build_cache import CACHE_FILE, get_build_cache
+from markslidego.courses import resolve_course
+from markslidego.fragments import is_manifest
+from markslidego.generate import create_zip_archive, generate_parallel, marp_theme_files, pop_jobs_option
+from markslidego.generate_course import find_template_directory, package_course, prepare_course
+from markslidego.generate_moodle import generate_moodle
+from markslidego.render_cache import content_key, render_cache_report
+
+
+logger = logging.getLogger(__name__)
+
+
+def dedup_key(source: str, target: str, options: list|None, key: str, themes: list[str]) -> str:
+    """ Key of a slidedeck to render: the content key of the deck (independent of the course and the topic
+    and file names), or the build-cache key for compilations, which are assembled from the course's fragments. """
+    if is_manifest(source):
+        return key
+    try:
+        return content_key(source, target, {'options': options or []}, themes)
+    except OSError:
+        return key
+
+
+def render_deduplicated(render_jobs: list, jobs: int = 1) -> int:
+    """ Render the slidedecks (source, target, options, build-cache key, course directory) of all courses,
+    decks with the same content (see dedup_key) are rendered once and copied to the other targets. """
+    themes = marp_theme_files()
+    groups = {}
+    for render_job in render_jobs:
+        groups.setdefault(dedup_key(*render_job[:4], themes), []).append(render_job)
+    duplicates = {group[0][1]: group for group in groups.values()}
+    logger.info("Rendering %d unique slidedecks for %d outputs", len(groups), len(render_jobs))
+
+    copied = 0
+    def on_generated(target: str) -> None:
+        nonlocal copied
+        for _, duplicate_target, options, key, course_dir in duplicates[target]:
+            if duplicate_target != target:
+                shutil.copy2(target, duplicate_target)
+                if options and ("--zip" in options or "--scorm" in options):
+                    create_zip_archive(duplicate_target)
+                copied += 1
+            get_build_cache(os.path.join(course_dir, CACHE_FILE)).update(duplicate_target, key)
+
+    try:
+        rendered = generate_parallel([group[0][:3] for group in groups.values()], jobs,
+                                     desc="Generating slides of all courses", on_generated=on_generated)
+    finally:
+        for course_dir in {render_job[4] for render_job in render_jobs}:
+            get_build_cache(os.path.join(course_dir, CACHE_FILE)).flush()
+    if copied:
+        print(f"Reused {copied} slidedecks shared between courses.")
+    return rendered + copied
+
+
+def split_jobs(jobs: int, moodle_count: int, renders: bool = True) -> tuple[int, int, int]:
+    """ Split the jobs between rendering the slide decks and building the Moodle backups alongside, so that
+    together they don't render more than jobs decks at once (at least one each).
+    Returns the jobs for rendering, the number of concurrent Moodle backups and the jobs of each backup. """
+    if moodle_count == 0:
+        return jobs, 0, 0
+    moodle_jobs = max(1, jobs // 2) if renders else jobs
+    backups = min(moodle_count, moodle_jobs)
+    return max(1, jobs - moodle_jobs), backups, max(1, moodle_jobs // backups)
+
+
+def generate_batch(courses: list, jobs: int = 1) -> int:
+    """ Build the courses: preprocess the YAML-defined courses and build the Moodle backups of the others,
+    then render the slide decks of all courses together and package the YAML-defined courses. """
+    yaml_files = []
+    moodle_dirs = []
+    for course in courses:
+        resolved = resolve_course(course)
+        if resolved is None:
+            logger.warning("Skipping %s, it is no course", course)
+            continue
+        kind, path = resolved
+        (yaml_files if kind == "yaml" else moodle_dirs).append(path)
+
+    def prepare(yaml_file: str) -> list:
+        course_dir = os.path.dirname(yaml_file) or "."
+        return [render_job + (course_dir,) for render_job in
+                prepare_course(yaml_file, template_dir=find_template_directory(course_dir))]
+
+    render_jobs_count, backups, backup_jobs = split_jobs(jobs, len(moodle_dirs), bool(yaml_files))
+    with ThreadPoolExecutor(max_workers=max(1, backups)) as moodle_executor, \
+         ThreadPoolExecutor(max_workers=jobs) as executor:
+        # the Moodle backups don't depend on other courses, so they are built alongside
+        moodle_futures = [moodle_executor.submit(generate_moodle, course_dir, jobs=backup_jobs)
+                          for course_dir in moodle_dirs]
+        render_jobs = [render_job for course_jobs in executor.map(prepare, yaml_files) for render_job in course_jobs]
+
+        output_count = render_deduplicated(render_jobs, render_jobs_count)
+        list(executor.map(package_course, yaml_files))
+        for future in moodle_futures:
+            future.result()
+    return output_count
+
+
+if __name__ == "__main__":
+    jobs = pop_jobs_option(sys.argv)
+
+    if len(sys.argv) < 2:
+        script_file = os.path.basename(sys.argv[0])
+        print(f"Usage: {script_file} <course>... [--jobs N]")
+        print("A course is a course YAML file, a course directory or the name of a course in courses/")
+        print("Examples:")
+        print(f"- build two courses sharing catalog decks:  {script_file} bif3-swen1 bif3-swen2 --jobs 8")
+        print(f"- build all courses:                        {script_file} courses/* --jobs 0")
+        sys.exit(0)
+
+    output_count = generate_batch(sys.argv[1:], jobs)
+    print(f"Generated {output_count} items.")
+    logger.info(materialize_report())
+    logger.info(render_cache_report())
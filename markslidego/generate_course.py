@@ -1,16 +1,25 @@
 #!/usr/bin/env python3
 """ Generate the slide decks for a course from a YAML file. """
+import functools
+import glob
 import logging
 import os
-import re
 import sys
-import shutil
+import threading
 from dotenv import load_dotenv
 import yaml
-import zipfile
 from tqdm.autonotebook import tqdm
-from markslidego.generate import copy_file_with_assets, create_ims_manifest, generate, is_source_newer, is_any_source_newer
+from markslidego.archive import update_archive
+from markslidego.assets import find_asset_links, materialize_asset, materialize_report, rewrite_asset_links
+from markslidego import courses
+from markslidego.build_cache import CACHE_FILE, BuildCache, get_build_cache, referenced_assets
+from markslidego.fragments import FRAGMENTS_MANIFEST, fragment_pdf, fragments_directory, read_manifest, \
+    write_if_changed, write_keys, write_manifest
+from markslidego.generate import TEMPLATE_ASSETS_DIR, copy_file_with_assets, correct_relative_paths, create_ims_manifest, \
+    generate_parallel, generate_targets, pop_jobs_option, render_key
 from markslidego.generate_questions import generate_questions
+from markslidego.placeholders import scoped_placeholders, substitute_placeholders
+from markslidego.render_cache import render_cache_report
 
 
 load_dotenv()  # take environment variables from .env.
@@ -24,23 +33,18 @@ logging.basicConfig(level=numeric_level)
 logger = logging.getLogger(__name__)
 
 TEMPLATE_DIR = os.environ.get('TEMPLATE_DIR', '')
-def find_template_directory() -> None:
-    # Find the template directory
+def find_template_directory(start_dir: str|None = None) -> str|None:
+    """ Find the _template directory in the start directory (default: working directory) or its parents.
+    Without start directory the result is stored in TEMPLATE_DIR, the environment variable takes precedence. """
     global TEMPLATE_DIR
 
     if TEMPLATE_DIR and os.path.exists(TEMPLATE_DIR):
-        return
-    
-    current_dir = os.getcwd()
-    while True:
-        if "_template" in os.listdir(current_dir):
-            TEMPLATE_DIR = os.path.abspath(os.path.join(current_dir, "_template"))
-            break
-        parent_dir = os.path.dirname(current_dir)
-        if parent_dir == current_dir:
-            TEMPLATE_DIR = None
-            break
-        current_dir = parent_dir
+        return TEMPLATE_DIR
+
+    template_dir = courses.find_template_directory(start_dir)
+    if start_dir is None:
+        TEMPLATE_DIR = template_dir
+    return template_dir
 
 
 def copy_assets_to_output(content: str, source_file: str, target_file: str) -> str:
@@ -52,33 +56,112 @@ def copy_assets_to_output(content: str, source_file: str, target_file: str) -> s
     if not os.path.exists(target_assets_dir):
         os.makedirs(target_assets_dir)
 
-    # Find image/link tags with relative paths
-    # Ignore paths that start with "http://" or "https://"
-    img_tags = re.findall(r'\[.*?\]\((?!http://|https://)(.*?)\)', content)
-
-    for img_tag in img_tags:
+    def copy_asset(link: str) -> str|None:
         # Calculate the absolute path of the image relative to the source folder
-        asset_source_path = os.path.abspath(os.path.join(source_dir, img_tag))
-        target_img_tag = os.path.basename(img_tag)
-        asset_target_path = os.path.abspath(os.path.join(target_assets_dir, target_img_tag))
+        asset_source_path = os.path.abspath(os.path.join(source_dir, link))
+        asset_target_path = os.path.abspath(os.path.join(target_assets_dir, os.path.basename(link)))
         try:
-            shutil.copy2(asset_source_path, asset_target_path)
+            materialize_asset(asset_source_path, asset_target_path)
         except FileNotFoundError:
             logger.warning("Asset file %s not found (or is not readable) "
             "and can't be copied to %s!", asset_source_path, asset_target_path)
-            continue
+            return None
 
         # Calculate the new relative path from the target folder to the file
-        relative_path = os.path.relpath(asset_target_path, target_dir).replace('\\', '/')
+        return os.path.relpath(asset_target_path, target_dir).replace('\\', '/')
+
+    # all references are rewritten in one pass, each referenced asset is copied once
+    return rewrite_asset_links(content, copy_asset)
+
+
+class Template:
+    """ The template of the slidedecks, read once per build. Its assets are materialized in each output directory
+    (in TEMPLATE_ASSETS_DIR) and shared by all decks in there; assets which are up to date are skipped. """
+
+    def __init__(self, template_dir: str) -> None:
+        self.template_file = os.path.join(template_dir, 'template.md')
+        logger.info("Using template from %s", self.template_file)
+        with open(self.template_file, 'r', encoding="utf-8") as file:
+            self.content = file.read()
+        self.assets = {link: os.path.abspath(os.path.join(template_dir, link)) for link in find_asset_links(self.content)}
+        self.lock = threading.Lock()
 
-        # Replace the old relative-path with the new relative-path in the content
-        content = content.replace(f'({img_tag})', f'({relative_path})')
 
-    return content
+    def for_target(self, target_file: str) -> str:
+        """ The template content with the paths of its assets relative to the target file. """
+        target_dir = os.path.dirname(os.path.abspath(target_file))
+        with self.lock:
+            # every time, as the assets may have been edited (or the outputs removed) since the last build
+            links = self.__materialize__(target_dir)
+        return rewrite_asset_links(self.content, links.get)
 
 
+    def __materialize__(self, target_dir: str) -> dict[str, str|None]:
+        assets_dir = os.path.join(target_dir, TEMPLATE_ASSETS_DIR)
+        os.makedirs(assets_dir, exist_ok=True)
+        links = {}
+        for link, asset_source_path in self.assets.items():
+            asset_target_path = os.path.join(assets_dir, os.path.basename(link))
+            try:
+                materialize_asset(asset_source_path, asset_target_path)
+            except FileNotFoundError:
+                logger.warning("Asset file %s not found (or is not readable) "
+                "and can't be copied to %s!", asset_source_path, asset_target_path)
+                links[link] = None
+                continue
+            links[link] = os.path.relpath(asset_target_path, target_dir).replace('\\', '/')
+        return links
+
+
+_templates: dict[tuple, Template] = {}
+_templates_lock = threading.Lock()
+
 
-def preprocess(source_file: str, target_file: str, placeholders: dict) -> None:
+def get_template(template_dir: str|None = None) -> Template:
+    """ Return the (shared) template of the template directory, it is read again only if it was changed. """
+    template_dir = template_dir or TEMPLATE_DIR
+    if not template_dir:
+        logger.error("Error: No templates found at %s. "
+        "Please put your template files into the '/_template' subdirectory", os.getcwd() )
+        sys.exit(1)
+    template_file = os.path.abspath(os.path.join(template_dir, 'template.md'))
+    key = (template_file, os.stat(template_file).st_mtime_ns)
+    with _templates_lock:
+        if key not in _templates:
+            _templates[key] = Template(template_dir)
+        return _templates[key]
+
+
+
+def preprocess_key(cache: BuildCache, source_files: list, placeholders: dict, template_dir: str|None = None,
+                   fragments: bool = False) -> str:
+    """ Build-cache key of a preprocessed Markdown file: the sources, the template,
+    all assets referenced by them and the placeholder values. """
+    template_dir = template_dir or TEMPLATE_DIR
+    files = []
+    if template_dir:
+        template = get_template(template_dir)
+        files.append(template.template_file)
+        files.extend(path for path in template.assets.values() if os.path.isfile(path))
+    for md_file in source_files:
+        files.append(md_file)
+        if os.path.exists(md_file):
+            with open(md_file, 'r', encoding="utf-8") as file:
+                files.extend(referenced_assets(file.read(), os.path.dirname(md_file)))
+    values = {'placeholders': placeholders}
+    if fragments:
+        values['fragments'] = True
+    return cache.key(files, values)
+
+
+def theme_files(template_dir: str|None = None) -> list:
+    """ The theme files (CSS) in the template directory. """
+    template_dir = template_dir or TEMPLATE_DIR
+    return sorted(glob.glob(os.path.join(template_dir, '*.css'))) if template_dir else []
+
+
+
+def preprocess(source_file: str, target_file: str, placeholders: dict, template_dir: str|None = None) -> bool:
     """ Preprocess a Markdown file, to replace variables. """
     # Check if the source file exists and is readable
     if os.access(source_file, os.R_OK):
@@ -86,16 +169,7 @@ def preprocess(source_file: str, target_file: str, placeholders: dict) -> None:
         logger.debug("Generating file: %s ...", target_file)
 
         # Prepare the template
-        if not TEMPLATE_DIR:
-            logger.error("Error: No templates found at %s. "
-            "Please put your template files into the '/_template' subdirectory", os.getcwd() )
-            sys.exit(1)
-        template_file = os.path.join(TEMPLATE_DIR, 'template.md')
-        logger.info("Using template from %s", template_file)
-        logger.info("Working directory is %s", os.getcwd())
-        with open(template_file, 'r', encoding="utf-8") as file:
-            template = file.read()
-        template = copy_assets_to_output(template, template_file, target_file)
+        template = get_template(template_dir).for_target(target_file)
 
         # Read the source content
         with open(source_file, 'r', encoding="utf-8") as file:
@@ -110,148 +184,217 @@ def preprocess(source_file: str, target_file: str, placeholders: dict) -> None:
         content = template + "\n---\n".join(remaining_slides)
 
         # Replace the placeholders in the content
-        for key, value in placeholders.items():
-            content = content.replace('{{' + key + '}}', value)
+        content = substitute_placeholders(content, placeholders, target_file)
 
         with open(target_file, 'w', encoding="utf-8") as file:
             file.write(content)
-    else:
-        logger.warning("Source file %s not found or not readable, skipping generation of %s", source_file,target_file)
+        return True
 
+    logger.warning("Source file %s not found or not readable, skipping generation of %s", source_file,target_file)
+    return False
 
 
-def preprocess_multiple(source_files: list, target_file: str, placeholders: dict) -> None:
-    """ Preprocess multiple Markdown files, to replace variables. """
+
+def front_matter(source_file: str) -> dict:
+    """ The YAML front matter of a Markdown file (cached until the file changes),
+    empty if the file has no or an invalid front matter. """
+    return _read_front_matter(os.path.abspath(source_file), os.stat(source_file).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=1024)
+def _read_front_matter(source_file: str, mtime_ns: int) -> dict:
+    lines = []
+    with open(source_file, 'r', encoding="utf-8") as file:
+        if file.readline().rstrip() != '---':
+            return {}
+        for line in file:
+            if line.rstrip() == '---':
+                break
+            lines.append(line)
+        else:
+            return {}  # front matter is not closed
+    try:
+        properties = yaml.safe_load("".join(lines))
+    except yaml.YAMLError as e:
+        logger.warning("Invalid front matter in %s: %s", source_file, e)
+        return {}
+    return properties if isinstance(properties, dict) else {}
+
+
+def preprocess_multiple(source_files: list, target_file: str, placeholders: dict, template_dir: str|None = None,
+                        fragments: bool = False) -> bool:
+    """ Preprocess multiple Markdown files, to replace variables.
+    The slides are streamed source by source into the target file. With fragments, the title and
+    each source are additionally written as decks of their own, to be rendered separately (see fragments module). """
+
+    # Check the sources and collect their titles first, the table of contents precedes the slides
+    titles = []
+    for source_file in source_files:
+        if not os.access(source_file, os.R_OK):
+            logger.warning("Source file %s not found or is not readable", source_file)
+            titles = None
+            continue
+        if titles is not None:
+            titles.append(front_matter(source_file).get('title'))
+    if titles is None:
+        logger.warning("Source file(s) not found, skipping generation of %s", target_file)
+        return False
 
     # Prepare the template
-    if not TEMPLATE_DIR:
-        logger.error("Error: No templates found at %s. "
-        "Please set put your template files into the '/_template' subdirectory", os.getcwd() )
-        sys.exit(1)
-    template_file = os.path.join(TEMPLATE_DIR, 'template.md')
-    logger.info("Using template from %s", template_file)
-    logger.info("Working directory is %s", os.getcwd())
-    with open(template_file, 'r', encoding="utf-8") as file:
-        template = file.read()
-    template = copy_assets_to_output(template, template_file, target_file)
+    template = get_template(template_dir).for_target(target_file)
     toc = """
 
 # Table of Contents
 
 """
-    content = ""
-    failed = False
+    toc += "".join(f"* {title}\n" for title in titles if title is not None)
 
-    for source_file in source_files:
-        # Check if the source_file exists and is readable
-        if os.access(source_file, os.R_OK):
-            logger.debug("Processing file: %s", source_file)
+    fragment_files = []
+    fragments_dir = fragments_directory(target_file)
+    front = template.split('\n---\n', 1)[0] + '\n---\n' if template.startswith('---') else ''
+    if fragments:
+        os.makedirs(fragments_dir, exist_ok=True)
 
-            # Read the source content
-            with open(source_file, 'r', encoding="utf-8") as file:
-                source_content = file.read()
-                source_props = re.search('---\n(.*?)\n---', source_content, re.DOTALL).group(1)
-                properties = yaml.safe_load(source_props)
-                if 'title' in properties:
-                    toc += f"* {properties['title']}\n"
-                    content += f"""
+    def add_fragment(content: str) -> None:
+        fragment_file = os.path.join(fragments_dir, f"{len(fragment_files):03d}.md")
+        write_if_changed(fragment_file, correct_relative_paths(content, target_file, fragment_file))
+        fragment_files.append(fragment_file)
+
+    logger.debug("Generating file: %s ...", target_file)
+    unknown_placeholders = set()
+    temp_file = target_file + ".tmp"
+    with open(temp_file, 'w', encoding="utf-8") as file:
+        # Replace the placeholders in the content
+        title_slides = substitute_placeholders(template + toc, placeholders, target_file, unknown_placeholders)
+        file.write(title_slides)
+        if fragments:
+            add_fragment(title_slides)
+
+        for source_file, title in zip(source_files, titles):
+            logger.debug("Processing file: %s", source_file)
+            slides = []
+            if title is not None:
+                slides.append(f"""
 <!--
 _class: lead
 _paginate: skip
 _footer: ''
 -->
 
-# {properties['title']}
-
----
-"""
+# {title}
+""")
+            # Read the source content
+            with open(source_file, 'r', encoding="utf-8") as source:
+                source_content = source.read()
             source_content = copy_assets_to_output(source_content, source_file, target_file)
 
-            # Put together template and content
-            # take the first slide from the template (skipt that slide in the content)
+            # take the first slide from the template (skip that slide in the content)
             # and the rest from the content
-            slides = source_content.split('\n---\n')
-            remaining_slides = slides[2:]
-            content = content + "\n---\n".join(remaining_slides)
-        else:
-            logger.warning("Source file %s not found or is not readable", source_file)
-            failed = True
-
-    if failed:
-        logger.warning("Source file(s) not found, skipping generation of %s", target_file)
-        return
-    
-    # Build the complete content
-    toc += "\n---\n"
-    content = template + toc + content
-
-    # Replace the placeholders in the content
-    for key, value in placeholders.items():
-        content = content.replace('{{' + key + '}}', value)
-
-    logger.debug("Generating file: %s ...", target_file)
-    with open(target_file, 'w', encoding="utf-8") as file:
-        file.write(content)
-
-
-def generate_course_topic(name, data_topic, course_title, data_course, placeholders, md_file=None) -> int:
-    """ Create a subdirectory for the topic """
+            slides += source_content.split('\n---\n')[2:]
+            if not slides:
+                continue
+            segment = substitute_placeholders("\n---\n".join(slides), placeholders, target_file, unknown_placeholders)
+            file.write("\n---\n" + segment)
+            if fragments:
+                add_fragment(front + segment)
+    os.replace(temp_file, target_file)
+    if fragments:
+        write_manifest(os.path.join(fragments_dir, FRAGMENTS_MANIFEST), fragment_files)
+    return True
+
+
+def prepare_fragments(cache: BuildCache, target_file: str, template_dir: str|None = None) -> list:
+    """ The render jobs (source, target, options, build-cache key) of the outdated fragments of a compilation PDF,
+    followed by the job assembling the compilation (if it is outdated). """
+    manifest_file = os.path.join(fragments_directory(target_file), FRAGMENTS_MANIFEST)
+    if not os.path.exists(manifest_file):
+        return []
+    render_jobs = []
+    keys = []
+    for fragment_file in read_manifest(manifest_file):
+        key = render_key(cache, fragment_file, None, theme_files(template_dir))
+        keys.append(key)
+        if not cache.is_up_to_date(fragment_pdf(fragment_file), key):
+            render_jobs.append((fragment_file, fragment_pdf(fragment_file), None, key))
+    write_keys(manifest_file, cache.cache_file, keys)
+    key = cache.key([manifest_file], {'fragments': keys})
+    if render_jobs or not cache.is_up_to_date(target_file, key):
+        render_jobs.append((manifest_file, target_file, None, key))
+    return render_jobs
+
+
+def prepare_course_topic(name, data_topic, course_title, data_course, placeholders, md_file=None,
+                         course_dir=".", template_dir=None) -> list:
+    """ Preprocess the slidedecks of a topic, returns the outdated slidedecks as render jobs
+    (source, target, options, build-cache key). The course placeholders are extended by the
+    placeholders of the topic and of each slide. md_file selects one slidedeck or a collection of them. """
+    md_files = None if md_file is None else {md_file} if isinstance(md_file, str) else set(md_file)
 
     # Extract the slides data
     slides = data_topic['slides']
     slides_count = len(slides)
-    output_count = 0
+    render_jobs = []
+    cache = get_build_cache(os.path.join(course_dir, CACHE_FILE))
+    output_dir = os.path.join(course_dir, "output", name)
 
-    # Iterate through each slide
+    # Iterate through each slide, the slidedecks are rendered afterwards on a pool of jobs
     for j in tqdm(range(slides_count), unit="slide", desc=f"Processing slides for {name}"):
         #print(data_topic['slides'][j]['source'])
         # Extract the source and target for each slide
-        placeholders['title'] = slides[j]['title']
+        slide_placeholders = scoped_placeholders(placeholders, data_topic.get('placeholders'),
+                                                 {'title': slides[j]['title']}, slides[j].get('placeholders'))
         if slides[j]['target'].endswith('.md'):
-            target_file = "output/" + name + "/" + slides[j]['target']
+            target_file = os.path.join(output_dir, slides[j]['target'])
             intermediate_file = target_file
         else:
-            target_file = "output/" + name + "/" + slides[j]['target']
+            target_file = os.path.join(output_dir, slides[j]['target'])
             intermediate_file, _ = os.path.splitext(target_file)
             intermediate_file += ".md"
+        # compilation PDFs may be rendered per source and assembled (see fragments module)
+        fragments = bool(slides[j].get('fragments')) and 'sources' in slides[j] and target_file.endswith('.pdf')
 
         # Preprocess the source_file(s), replace placeholders
-        if md_file is None or md_file == os.path.basename(intermediate_file):
-            os.makedirs(f"output/{name}", exist_ok=True)
+        if md_files is None or os.path.basename(intermediate_file) in md_files:
+            os.makedirs(output_dir, exist_ok=True)
 
             if 'source' in slides[j]:
-                source_file = "../../catalogs/" + slides[j]['source']
-                if is_source_newer(source_file, intermediate_file):
-                    preprocess(source_file, intermediate_file, placeholders)
+                source_file = os.path.join(course_dir, "..", "..", "catalogs", slides[j]['source'])
+                key = preprocess_key(cache, [source_file], slide_placeholders, template_dir)
+                if os.path.exists(source_file) and not cache.is_up_to_date(intermediate_file, key):
+                    if preprocess(source_file, intermediate_file, slide_placeholders, template_dir):
+                        cache.update(intermediate_file, key)
 
             if 'sources' in slides[j]:
                 source_files = []
                 for source in slides[j]['sources']:
-                    source_files.append("../../catalogs/" + source)
-                if is_any_source_newer(source_files, intermediate_file):
-                    preprocess_multiple(source_files, intermediate_file, placeholders)
+                    source_files.append(os.path.join(course_dir, "..", "..", "catalogs", source))
+                key = preprocess_key(cache, source_files, slide_placeholders, template_dir, fragments)
+                if not cache.is_up_to_date(intermediate_file, key):
+                    if preprocess_multiple(source_files, intermediate_file, slide_placeholders, template_dir,
+                                           fragments):
+                        cache.update(intermediate_file, key)
 
             if target_file != intermediate_file:
                 if not os.path.exists(intermediate_file):
-                    # Use provided source from repo, so no preprocessing needed    
-                    provided_file = intermediate_file.replace('output/', 'moodle/')
+                    # Use provided source from repo, so no preprocessing needed
+                    provided_file = os.path.join(course_dir, "moodle", name, os.path.relpath(intermediate_file, output_dir))
                     copy_file_with_assets(provided_file, intermediate_file)
 
         # Generate the slidedeck
-        if target_file != intermediate_file:
-            if is_source_newer(intermediate_file, target_file):
-                # Provide generation options
-                if 'options' in slides[j]:
-                    options = slides[j]['options'].split(" ")
-                    if '--scorm' in options:
-                        create_ims_manifest(target_file,
-                        data_course, course_title, placeholders['title'])
-                else:
-                    options = None
-
-                if md_file is None or md_file == os.path.basename(intermediate_file):
-                    if generate(intermediate_file, target_file, options):
-                        output_count += 1
+        if fragments and os.path.exists(intermediate_file):
+            if md_files is None or os.path.basename(intermediate_file) in md_files:
+                render_jobs += prepare_fragments(cache, target_file, template_dir)
+        elif target_file != intermediate_file and os.path.exists(intermediate_file):
+            # Provide generation options
+            options = slides[j]['options'].split(" ") if 'options' in slides[j] else None
+            manifest = [data_course, course_title, slide_placeholders['title']] if options and '--scorm' in options else None
+            key = render_key(cache, intermediate_file, options, theme_files(template_dir), {'manifest': manifest})
+            if not cache.is_up_to_date(target_file, key):
+                if manifest:
+                    create_ims_manifest(target_file, *manifest)
+
+                if md_files is None or os.path.basename(intermediate_file) in md_files:
+                    render_jobs.append((intermediate_file, target_file, options, key))
 
         # Generate questions
         if 'questions' in slides[j]:
@@ -259,25 +402,55 @@ def generate_course_topic(name, data_topic, course_title, data_course, placehold
             questions_file, _ = os.path.splitext(target_file)
             questions_file += ".csv"
             if not os.path.exists(questions_file):
-                generate_questions(placeholders['title'], slides[j]['title'], intermediate_file, int(questions), questions_file)
+                generate_questions(slide_placeholders['title'], slides[j]['title'], intermediate_file, int(questions), questions_file)
 
-    return output_count
+    cache.flush()
+    return render_jobs
 
 
-def generate_course(yaml_file: str, topic: str|None = None, md_file: str|None = None) -> int:
-    """ Generate the slide decks for a course from a YAML file. """
+def generate_course_topic(name, data_topic, course_title, data_course, placeholders, md_file=None, jobs=1,
+                          course_dir=".", template_dir=None) -> int:
+    """ Create a subdirectory for the topic """
+    render_jobs = prepare_course_topic(name, data_topic, course_title, data_course, placeholders, md_file,
+                                       course_dir, template_dir)
+    return render_course_jobs(render_jobs, course_dir, jobs, desc=f"Generating slides for {name}")
+
+
+def render_course_jobs(render_jobs: list, course_dir: str = ".", jobs: int = 1, desc: str = "Generating slides") -> int:
+    """ Render the slidedecks (source, target, options, build-cache key) on a pool of jobs. """
+    cache = get_build_cache(os.path.join(course_dir, CACHE_FILE))
+    render_keys = {target: key for _, target, _, key in render_jobs}
+    try:
+        return generate_parallel([job[:3] for job in render_jobs], jobs, desc=desc,
+                                 on_generated=lambda target: cache.update(target, render_keys[target]))
+    finally:
+        cache.flush()
+
+
+def course_placeholders(data: dict) -> dict:
+    """ The placeholders of the course (from the loaded YAML file). """
+    return scoped_placeholders({
+        'course-title': data['course-title'],
+        'course': data['course'],
+        'program': data['program'],
+        'version': data['version'],
+    }, data.get('placeholders'))
+
+
+def prepare_course(yaml_file: str, topic: str|None = None, md_file: str|None = None,
+                   template_dir: str|None = None, decks: dict[str, set[str]]|None = None) -> list:
+    """ Preprocess the slidedecks of a course from a YAML file (in its course directory),
+    returns the outdated slidedecks as render jobs (source, target, options, build-cache key).
+    Instead of topic and md_file, decks may select the slidedecks of several topics (topic -> slidedecks). """
+    course_dir = os.path.dirname(yaml_file) or "."
     # Load YAML file
     with open(yaml_file, 'r', encoding="utf-8") as file:
         data = yaml.safe_load(file)
 
     # Read the number of topics
     topics_count = len(data['topics'])
-    placeholders = {}
-    placeholders['course-title'] = data['course-title']
-    placeholders['course'] = data['course']
-    placeholders['program'] = data['program']
-    placeholders['version'] = data['version']
-    output_count = 0
+    placeholders = course_placeholders(data)
+    render_jobs = []
 
     # Iterate through each topic
     for i in tqdm(range(topics_count), unit="topic", desc=f"Processing topics of {yaml_file}"):
@@ -288,60 +461,66 @@ def generate_course(yaml_file: str, topic: str|None = None, md_file: str|None =
         name = data_topic['name']
 
         # If a specific topic is provided, skip others
-        if topic is not None and name != topic:
+        if (topic is not None and name != topic) or (decks is not None and name not in decks):
             continue
 
-        output_count += generate_course_topic(name, data_topic, course_title, data_course, placeholders, md_file)
+        render_jobs += prepare_course_topic(name, data_topic, course_title, data_course, placeholders,
+                                            decks[name] if decks is not None else md_file, course_dir, template_dir)
+    return render_jobs
 
-        # if topic specified, then create a zip file of the topic
-        if topic is not None:
-            topic_output_dir = os.path.abspath(f"output/{topic}")
-            zip_file = os.path.join(topic_output_dir, "..", f"{topic}.zip")
-            if os.path.exists(zip_file):
-                os.remove(zip_file)
-            try:
-                with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for root, dirs, files in os.walk(topic_output_dir):
-                        for file in files:
-                            if file == f"{topic}.zip":
-                                continue  # Don't include the zip file itself
-                            file_path = os.path.join(root, file)
-                            arcname = os.path.relpath(file_path, topic_output_dir)
-                            zipf.write(file_path, arcname)        
-            except Exception as e:
-                print(f"Error creating zip file {zip_file}: {e}")
-
-    # if topic is not specified, then create a zip file of the course
-    if topic is None:
-        course_output_dir = os.path.abspath("output")
-        zip_file = os.path.join(course_output_dir, os.path.basename(yaml_file).replace(".yml", ".zip"))
-        if os.path.exists(zip_file):
-            os.remove(zip_file)
-        try:
-            with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, dirs, files in os.walk(course_output_dir):
-                    for file in files:
-                        if file == os.path.basename(zip_file):
-                            continue  # Don't include the zip file itself
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, course_output_dir)
-                        zipf.write(file_path, arcname)        
-        except Exception as e:
-            print(f"Error creating zip file {zip_file}: {e}")
 
+def package_course(yaml_file: str, topic: str|None = None) -> None:
+    """ Create the zip file of the course outputs (or of the topic outputs, if a topic is specified). """
+    course_dir = os.path.dirname(yaml_file) or "."
+    if topic is not None:
+        output_dir = os.path.abspath(os.path.join(course_dir, "output", topic))
+        zip_file = os.path.join(output_dir, "..", f"{topic}.zip")
+    else:
+        output_dir = os.path.abspath(os.path.join(course_dir, "output"))
+        zip_file = os.path.join(output_dir, os.path.basename(yaml_file).replace(".yml", ".zip"))
+    course_output_dir = os.path.abspath(os.path.join(course_dir, "output"))
+    files = []
+    for root, dirs, filenames in os.walk(output_dir):
+        # hidden files are internal to the build (.msgo-cache.json, .fragments/ of compilations)
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file in sorted(filenames):
+            if root == course_output_dir and file.endswith(".zip"):
+                continue  # Don't include the zip file itself, nor the topic zip files (their outputs are included)
+            if file.startswith(".") or file.endswith(".tmp"):
+                continue
+            file_path = os.path.join(root, file)
+            files.append((file_path, os.path.relpath(file_path, output_dir)))
+    try:
+        copied, written = update_archive(zip_file, files)
+        logger.info("Packaged %s: %d files unchanged, %d files added or updated", zip_file, copied, written)
+    except Exception as e:
+        print(f"Error creating zip file {zip_file}: {e}")
+
+
+def generate_course(yaml_file: str, topic: str|None = None, md_file: str|None = None, jobs: int = 1,
+                    template_dir: str|None = None) -> int:
+    """ Generate the slide decks for a course from a YAML file. """
+    course_dir = os.path.dirname(yaml_file) or "."
+    render_jobs = prepare_course(yaml_file, topic, md_file, template_dir)
+    output_count = render_course_jobs(render_jobs, course_dir, jobs, desc=f"Generating slides of {yaml_file}")
 
+    # create a zip file of the topic if specified, otherwise of the course
+    package_course(yaml_file, topic)
     return output_count
 
 
 if __name__ == "__main__":
+    jobs = pop_jobs_option(sys.argv)
+
     # Check if one argument was provided
     if len(sys.argv) < 2:
         script_file = os.path.basename(sys.argv[0])
-        print(f"Usage: {script_file} <course> [<topic>] [<md_file>] ")
+        print(f"Usage: {script_file} <course> [<topic>] [<md_file>] [--jobs N]")
         print("Examples (using the courses-repo of fhtw):")
         print(f"- generate complete course BIF3/SWEN1:  {script_file} bif3-swen1")
         print(f"- generate specific topic SS-A:         {script_file} bif3-swen1 SS-A")
         print(f"- generate specific markdown file:      {script_file} bif3-swen1 Class-1 java-kickstart.md")
+        print(f"- render 8 slidedecks concurrently:     {script_file} bif3-swen1 --jobs 8")
         sys.exit(0)
 
     # Path to the YAML file
@@ -367,7 +546,7 @@ if __name__ == "__main__":
     # Change into course-directory and generate the course
     os.chdir(os.path.dirname(course_path))
     find_template_directory()
-    output_count = generate_course(os.path.basename(course_path), topic, md_file)
+    output_count = generate_course(os.path.basename(course_path), topic, md_file, jobs)
 
     if output_count == 0 and topic is not None and md_file is not None:
         # The md_file is not in the yaml file yet, so generate this one manually
@@ -378,14 +557,13 @@ if __name__ == "__main__":
         source_file = dest_file.replace('output/', 'moodle/')
         copy_file_with_assets(source_file, dest_file)
 
-        # Generate the slidedeck PDF
-        target_file = f"output/{topic}/{md_file}".replace('.md', '.pdf')
-        output_count += generate(f"output/{topic}/{md_file}", target_file)
-
-        # Generate the HTML ZIP SCORM package
-        target_file = f"output/{topic}/{md_file}".replace('.md', '.html')
-        create_ims_manifest(target_file, course_name, course_name, md_file.replace('.md', ''))
-        output_count += generate(f"output/{topic}/{md_file}", target_file, ['--zip', '--scorm'])
+        # Generate the slidedeck PDF and the HTML ZIP SCORM package together
+        pdf_file = f"output/{topic}/{md_file}".replace('.md', '.pdf')
+        html_file = f"output/{topic}/{md_file}".replace('.md', '.html')
+        create_ims_manifest(html_file, course_name, course_name, md_file.replace('.md', ''))
+        output_count += len(generate_targets(dest_file, {pdf_file: None, html_file: ['--zip', '--scorm']}))
 
 
     print(f"Generated {output_count} items.")
+    logger.info(materialize_report())
+    logger.info(render_cache_report())
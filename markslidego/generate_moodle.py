@@ -2,26 +2,104 @@
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
+from markslidego.courses import find_template_directory
+from markslidego.generate import pop_jobs_option
 from markslidego.markdown.reader import MarkdownReader
 from markslidego.moodle.backup import MoodleBackup
 
 
+def generate_moodle(course_path:str, filter_topic_name:str|None = None, filter_md_file:str|None = None,
+                    jobs:int = 1) -> MoodleBackup:
+    """ Generate the Moodle backup (.mbz and .zip) of the course directory into its output/ subdirectory. """
+    course_name = os.path.basename(os.path.normpath(course_path))
+    course_title = course_name.replace("-", " ").title()
+    # if README.md exists, use the first line as course name
+    course_info = MarkdownReader.get_md_info(os.path.join(course_path, "README.md"))
+    if course_info is not None and 'title' in course_info:
+        course_title = course_info['title']
+    print(f"Generating course '{course_title}' from {course_path}:")
+    generator = MoodleBackup(course_name, course_title, 1, output_dir=os.path.join(course_path, "output"),
+                             template_dir=find_template_directory(course_path))
+
+    # collect all .md files in the course_path recursively
+    decks = []
+    for root, dirs, files in os.walk(course_path):
+        for file in files:
+            if file.endswith(".md"):
+                if filter_md_file is not None and file != filter_md_file:
+                    continue
+
+                md_filepath = os.path.relpath(os.path.join(root, file), course_path).replace("\\", "/")
+                md_file = MarkdownReader(os.path.join(course_path, md_filepath))
+                if md_file.metadata is None:
+                    continue
+
+                topic_name = os.path.dirname(md_filepath)
+                if topic_name is None or topic_name == "":
+                    topic_name = os.path.basename(md_filepath).replace(".md", "")
+                if filter_topic_name is not None and topic_name != filter_topic_name:
+                    continue
+                topic_nr = int(md_file.metadata.get('section_number', "0"))
+                print(f"- {md_filepath}: topic_name={topic_name}, topic_nr={topic_nr}")
+                decks.append((md_file, topic_name, topic_nr))
+
+    # render the materials of the Marp decks concurrently (the outputs are independent of each other)
+    def render(deck:MarkdownReader) -> None:
+        html_filepath = deck.filepath.replace(".md", ".html")
+        pdf_filepath = deck.filepath.replace(".md", ".pdf")
+        # render SCORM-HTML and PDF of the deck together
+        generator.render_material(deck.filepath, {html_filepath: ["--scorm"], pdf_filepath: None}, activity_title(deck))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(render, [md_file for md_file, _, _ in decks if md_file.is_marp]))
+
+    # create the sections and activities in the order of the course directory
+    for md_file, topic_name, topic_nr in decks:
+        section = generator.sections[topic_name] if topic_name in generator.sections else None
+        if section is None:
+            section = generator.create_section(md_file.filepath, topic_name, topic_nr)
+
+        if md_file.is_marp:
+            html_filepath = md_file.filepath.replace(".md", ".html")
+            pdf_filepath = md_file.filepath.replace(".md", ".pdf")
+            generator.create_activity_scorm(section, activity_title(md_file), html_filepath, md_file.filepath)
+            generator.create_activity_file(section, activity_title(md_file) + " (PDF)", pdf_filepath, md_file.filepath)
+
+        if md_file.is_moodle:
+            generator.create_activity_lesson(section, md_file)
+
+    # Generate the moodle backup .mbz file
+    keep_directory = os.getenv("MOODLE_KEEP_DIRECTORY", "false").lower() == "true"
+    generator.generate_mbz(course_name + ".mbz", keep_directory=keep_directory, replace_existing=True)
+    generator.generate_zip(course_name + ".zip", keep_directory=keep_directory, replace_existing=True)
+    return generator
+
+
+def activity_title(md_file:MarkdownReader) -> str:
+    """ Title of the activity, taken from the front matter or the filename of the Marp deck. """
+    if 'title' in md_file.metadata:
+        return md_file.metadata['title']
+    return os.path.basename(md_file.filepath).replace(".md", "").replace("-", " ").title()
+
+
 # ------------------- Main Program -------------------
 if __name__ == "__main__":
+    jobs = pop_jobs_option(sys.argv)
+
     # Check if one argument was provided
     if len(sys.argv) < 2:
         script_file = os.path.basename(sys.argv[0])
-        print(f"Usage: {script_file} <course> [<topic>] [<md_file>] ")
+        print(f"Usage: {script_file} <course> [<topic>] [<md_file>] [--jobs N]")
         print("Examples (using the courses-repo of bif3-swen1):")
         print(f"- generate complete course BIF3/SWEN1:  {script_file} bif3-swen1")
         print(f"- generate specific topic SS-A:         {script_file} bif3-swen1 SS-A")
         print(f"- generate specific markdown file:      {script_file} bif3-swen1 Class-1 java-kickstart.md")
+        print(f"- render 8 slidedecks concurrently:     {script_file} bif3-swen1 --jobs 8")
         sys.exit(0)
 
     # Path to the course
     course = sys.argv[1]
-    course_name = os.path.basename(course)
     course_path = os.path.join("courses", course)
     if not os.path.exists(course_path):
         print(f"Error: Course {course_path} does not exist.")
@@ -42,54 +120,4 @@ if __name__ == "__main__":
     if filter_md_file == "." or filter_md_file == "*" or filter_md_file == "":
         filter_md_file = None
 
-    # Change into course-directory 
-    project_root = os.path.dirname(os.path.abspath(__file__))
-    course_dir = os.path.dirname(course_path)
-    os.chdir(course_path)
-
-    course_name = os.path.basename(course_path)
-    course_title = course_name.replace("-", " ").title()
-    # if README.md exists, use the first line as course name
-    course_info = MarkdownReader.get_md_info("README.md")
-    if course_info is not None and 'title' in course_info:
-        course_title = course_info['title']
-    print(f"Generating course '{course_title}' from {course_path}:")
-    generator = MoodleBackup(course_name, course_title, 1)
-
-    # collect all .md files in the course_path recursively
-    for root, dirs, files in os.walk("."):
-        for file in files:
-            if file.endswith(".md"):
-                if filter_md_file is not None and file != filter_md_file:
-                    continue
-
-                md_filepath = os.path.join(root, file).replace("\\", "/").lstrip("./") 
-                md_file = MarkdownReader(md_filepath)
-                if md_file.metadata is None:
-                    continue
-                
-                topic_name = os.path.dirname(md_filepath)
-                if topic_name is None or topic_name == "":
-                    topic_name = os.path.basename(md_filepath).replace(".md", "")
-                if filter_topic_name is not None and topic_name != filter_topic_name:
-                    continue
-                topic_nr = int(md_file.metadata.get('section_number', "0"))
-                print(f"- {md_filepath}: topic_name={topic_name}, topic_nr={topic_nr}")
-
-                section = generator.sections[topic_name] if topic_name in generator.sections else None
-                if section is None:
-                    section = generator.create_section(md_filepath, topic_name, topic_nr)
-
-                if md_file.is_marp:
-                    activity_title = md_file.metadata['title'] if 'title' in md_file.metadata else os.path.basename(md_filepath).replace(".md", "").replace("-", " ").title()
-                    generator.create_activity_scorm(section, activity_title, md_filepath.replace(".md", ".html"), md_filepath)
-                    generator.create_activity_file(section, activity_title + " (PDF)", md_filepath.replace(".md", ".pdf"), md_filepath)
-                    
-                if md_file.is_moodle:
-                    generator.create_activity_lesson(section, md_file)
-
-
-
-    # Generate the moodle backup .mbz file
-    generator.generate_mbz(course_name + ".mbz", remove_intermediate_files=False, replace_existing=True)
-    generator.generate_zip(course_name + ".zip", remove_intermediate_files=False, replace_existing=True)
+    generate_moodle(course_path, filter_topic_name, filter_md_file, jobs)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+""" Watch a course while authoring: the slide decks affected by a change of their sources are rebuilt immediately.
+
+The course graph (YAML -> topics -> sources -> assets -> outputs) is looked up in the dependency index, so a change
+of a catalog file or asset only preprocesses and renders the outputs depending on it. Changes of the YAML file or the template
+rebuild the whole course (the build cache still skips the unchanged outputs). The course zip is not updated.
+The file system is watched with watchdog if it is installed, otherwise the directories are polled.
+"""
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import yaml
+from markslidego.dependency_index import DependencyIndex
+from markslidego.generate import pop_jobs_option
+from markslidego.courses import resolve_course
+from markslidego.generate_course import course_placeholders, find_template_directory, prepare_course_topic, \
+    render_course_jobs
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # optional, the directories are polled without it
+    FileSystemEventHandler = object
+    Observer = None
+
+
+DEBOUNCE_SECONDS = float(os.environ.get('WATCH_DEBOUNCE', '0.3'))  # quiet time before rebuilding
+POLL_SECONDS = 1.0  # interval of polling the directories (without watchdog)
+
+
+logger = logging.getLogger(__name__)
+
+
+class CourseGraph:
+    """ The outputs of a YAML-defined course and the files they depend on (see dependency_index). """
+
+    def __init__(self, yaml_file: str, template_dir: str|None = None) -> None:
+        self.yaml_file = os.path.abspath(yaml_file)
+        self.course_dir = os.path.dirname(self.yaml_file)
+        self.catalogs_dir = os.path.abspath(os.path.join(self.course_dir, "..", "..", "catalogs"))
+        self.template_dir = template_dir
+        self.index = DependencyIndex(os.path.join(self.course_dir, "..", ".."))
+        self.course = self.index.relpath(self.yaml_file)
+        self.data: dict = {}
+        self.placeholders: dict = {}
+        self.load()
+
+
+    def load(self) -> None:
+        """ (Re-)load the YAML file and update the dependencies of its outputs. """
+        with open(self.yaml_file, 'r', encoding="utf-8") as file:
+            self.data = yaml.safe_load(file)
+        self.placeholders = course_placeholders(self.data)
+        self.refresh()
+
+
+    def refresh(self) -> None:
+        """ Update the dependencies of the changed files in the index. """
+        self.index.update_course(self.yaml_file, self.template_dir)
+        self.index.save()
+
+
+    def affected(self, paths: set[str]) -> set[tuple[str, str]]|None:
+        """ The outputs (topic, intermediate Markdown file) affected by the changed files, None for all. """
+        if self.course in self.index.affected_courses(list(paths)):
+            return None
+        return {(topic, deck) for course, topic, deck in self.index.affected(list(paths)) if course == self.course}
+
+
+    def rebuild(self, paths: set[str]|None = None, jobs: int = 1) -> int|None:
+        """ Preprocess and render the outputs affected by the changed files (all outputs without files),
+        returns the number of generated items (None if no output depends on the files). """
+        outputs = self.affected(paths) if paths is not None else None
+        if outputs is None:
+            if paths is not None and self.yaml_file in paths:
+                self.load()
+        elif not outputs:
+            return None
+        else:
+            self.refresh()  # a changed source may reference other assets now
+
+        render_jobs = []
+        for data_topic in self.data['topics']:
+            name = data_topic['name']
+            md_files = [None] if outputs is None else sorted(md for topic, md in outputs if topic == name)
+            for md_file in md_files:
+                render_jobs += prepare_course_topic(name, data_topic, self.data['course-title'], self.data['course'],
+                                                    self.placeholders, md_file, self.course_dir,
+                                                    self.template_dir)
+        return render_course_jobs(render_jobs, self.course_dir, jobs, desc="Rebuilding slides")
+
+
+class ChangeHandler(FileSystemEventHandler):
+    """ Queues the changed files reported by watchdog. """
+
+    def __init__(self, changes: queue.Queue, is_ignored) -> None:
+        super().__init__()
+        self.changes = changes
+        self.is_ignored = is_ignored
+
+
+    def on_any_event(self, event) -> None:
+        if event.is_directory:
+            return
+        for path in (event.src_path, getattr(event, 'dest_path', None)):
+            if path and not self.is_ignored(os.path.abspath(path)):
+                self.changes.put((os.path.abspath(path), time.time()))
+
+
+def snapshot(roots: list[str], is_ignored) -> dict[str, tuple[int, int]]:
+    """ Modification time and size of all files in the directories. """
+    files = {}
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not is_ignored(os.path.join(dirpath, d))]
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # deleted meanwhile
+                files[path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def poll_changes(roots: list[str], is_ignored, changes: queue.Queue, stop: threading.Event) -> None:
+    """ Queue the changed files of the directories, until stopped. """
+    previous = snapshot(roots, is_ignored)
+    polled_at = time.time()
+    while not stop.wait(POLL_SECONDS):
+        current = snapshot(roots, is_ignored)
+        for path in previous.keys() | current.keys():
+            if previous.get(path) != current.get(path):
+                # the modification time tells when the file was changed (since the last poll)
+                changed_at = max(current[path][0] / 1e9, polled_at) if path in current else polled_at
+                changes.put((path, changed_at))
+        previous = current
+        polled_at = time.time()
+
+
+def rebuild_changes(graph: CourseGraph, paths: set[str], jobs: int = 1, first_change: float|None = None) -> bool:
+    """ Rebuild the outputs affected by the changed files and report it. Errors (e.g. a half-edited YAML file)
+    are logged, so watching goes on. Returns False if the rebuild failed. """
+    changed = ", ".join(sorted(os.path.relpath(p, graph.course_dir) for p in paths))
+    start = time.time()
+    try:
+        output_count = graph.rebuild(paths, jobs)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.error("Rebuild after the change of %s failed: %s", changed, e)
+        return False
+    end = time.time()
+    if output_count is None:
+        print(f"No output depends on {changed}")
+    else:
+        print(f"Rebuilt {output_count} items in {end - start:.2f}s, "
+              f"{end - (first_change or start):.2f}s after the change of {changed}")
+    return True
+
+
+def watch(yaml_file: str, jobs: int = 1, template_dir: str|None = None) -> None:
+    """ Build the course, then rebuild the affected outputs on each change (until interrupted). """
+    graph = CourseGraph(yaml_file, template_dir)
+    output_dir = os.path.join(graph.course_dir, "output")
+    roots = [graph.catalogs_dir, graph.course_dir]
+    if template_dir and not os.path.abspath(template_dir).startswith(graph.course_dir + os.sep):
+        roots.append(os.path.abspath(template_dir))
+
+    def is_ignored(path: str) -> bool:
+        name = os.path.basename(path)
+        return path.startswith(output_dir + os.sep) or path == output_dir or name.startswith(".") \
+            or name.endswith(".tmp")
+
+    start = time.time()
+    output_count = graph.rebuild(jobs=jobs)
+    print(f"Built {output_count} items in {time.time() - start:.2f}s, watching for changes (Ctrl+C to stop) ...")
+
+    changes = queue.Queue()
+    stop = threading.Event()
+    if Observer is not None:
+        observer = Observer()
+        handler = ChangeHandler(changes, is_ignored)
+        for root in roots:
+            if os.path.isdir(root):
+                observer.schedule(handler, root, recursive=True)
+        observer.start()
+    else:
+        logger.info("watchdog is not installed, polling for changes every %.1fs", POLL_SECONDS)
+        observer = threading.Thread(target=poll_changes, args=(roots, is_ignored, changes, stop), daemon=True)
+        observer.start()
+
+    try:
+        while True:
+            path, first_change = changes.get()
+            paths = {path}
+            # debounce: editors write files in several steps, wait until the changes have settled
+            while True:
+                try:
+                    path, changed_at = changes.get(timeout=DEBOUNCE_SECONDS)
+                except queue.Empty:
+                    break
+                paths.add(path)
+                first_change = min(first_change, changed_at)
+
+            rebuild_changes(graph, paths, jobs, first_change)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        if Observer is not None:
+            observer.stop()
+        observer.join()
+
+
+if __name__ == "__main__":
+    jobs = pop_jobs_option(sys.argv)
+
+    if len(sys.argv) < 2:
+        script_file = os.path.basename(sys.argv[0])
+        print(f"Usage: {script_file} <course> [--jobs N]")
+        print("A course is a course YAML file, a course directory or the name of a course in courses/")
+        print("Examples:")
+        print(f"- rebuild BIF3/SWEN1 while editing its slides:  {script_file} bif3-swen1")
+        sys.exit(0)
+
+    resolved = resolve_course(sys.argv[1])
+    if resolved is None or resolved[0] != "yaml":
+        print(f"Error: {sys.argv[1]} is no YAML-defined course.")
+        sys.exit(1)
+    yaml_file = resolved[1]
+    watch(yaml_file, jobs, find_template_directory(os.path.dirname(yaml_file) or "."))
@@ -1,94 +1,132 @@
 """ Module defining a Page within a Markdown document (separated by '---'). """
+import hashlib
+import re
+import threading
+from collections import OrderedDict
 import markdown
 from markslidego.markdown.link import MoodleLink
 
 
+# Kinds of the lines of a page
+HEADING = "heading"
+MOODLE_LINK = "moodle-link"
+COMMENT = "comment"
+BODY = "body"
+
+HEADING_PATTERN = re.compile(r'(#{1,3}) (.*)')
+MOODLE_LINK_PATTERN = re.compile(r'\[([^\]]*)\]\((moodle:[^)\s]*)\)')
+
+HTML_CACHE_SIZE = 1024  # number of converted pages kept (least recently used are dropped)
+
+_converters = threading.local()  # one reusable Markdown converter per thread
+_html_cache: OrderedDict[str, str] = OrderedDict()  # content hash -> HTML
+_html_cache_lock = threading.Lock()
+
+
+def _converter() -> markdown.Markdown:
+    converter = getattr(_converters, 'markdown', None)
+    if converter is None:
+        converter = _converters.markdown = markdown.Markdown()
+    return converter
+
+
 class MarkdownPage:
-    """ Represents a single page in a markdown presentation. """
+    """ Represents a single page in a markdown presentation.
+    The lines are classified in a single pass (heading, moodle-link, comment, body), title, links, comments
+    and the stripped content are derived from these tokens. """
     def __init__(self, content: str):
         self.content = content.replace('\n---', '').strip()
-        self.title = self.__extract_title__()
+        self.title: str|None = None
         self.moodle_type = ""
-        self.moodle_links : list[MoodleLink] = self.__extract_moodle_links__()
-        self.comments = self.__extract_comments__()
-
-
-    def __extract_title__(self) -> str|None:
-        """ Extract the title from the markdown content. """
-        for line in self.content.splitlines():
-            stripped = line.strip()
-            if stripped.startswith('# '):
-                return stripped.lstrip('# ').strip()
-            if stripped.startswith('## '):
-                return stripped.lstrip('## ').strip()
-            if stripped.startswith('### '):
-                return stripped.lstrip('### ').strip()
-        return None
-
-
-    def __extract_moodle_links__(self) -> list[MoodleLink]:
-        """ Extract "moodle:" links from the markdown content. """
-        links = []
-        for line in self.content.splitlines():
-            stripped = line.strip()
-            if stripped.startswith('[') and '](' in stripped:
-                start = stripped.find('](moodle:')
-                end = stripped.find(')', start)
-                if end != -1:
-                    url = stripped[start + 2:end]
-                    text_start = stripped.find('[') + 1
-                    text_end = stripped.find(']')
-                    text = stripped[text_start:text_end]
-                    link = MoodleLink(url, text)
-                    links.append(link)
-        return links
-
-
-    def __extract_comments__(self) -> list[str]:
-        """ Extract comments from the markdown content. """
-        comments = []
-        for line in self.content.splitlines():
+        self.moodle_links : list[MoodleLink] = []
+        self.comments: list[str] = []
+        self.tokens: list[tuple[str, int, int]] = []  # kind, start and end offset of each line in the content
+        self.link_spans: list[tuple[int, int]] = []  # start and end offset of each moodle link in the content
+        self._stripped: str|None = None
+        self.__tokenize__()
+
+
+    def __tokenize__(self) -> None:
+        """ Classify each line of the content, and extract title, moodle links and comments on the way. """
+        content = self.content
+        pos = 0
+        while pos <= len(content):
+            end = content.find('\n', pos)
+            if end == -1:
+                end = len(content)
+            line = content[pos:end]
             stripped = line.strip()
+            kind = BODY
             if stripped.startswith('<!--') and stripped.endswith('-->'):
+                kind = COMMENT
                 comment = stripped[4:-3].strip()
-                comments.append(comment)
+                self.comments.append(comment)
                 if comment.startswith('TYPE:'):
                     self.moodle_type = comment[len('TYPE:'):].strip()
-        return comments
+            elif (heading := HEADING_PATTERN.match(stripped)) is not None:
+                kind = HEADING
+                if self.title is None:
+                    self.title = heading.group(2).strip()
+            elif 'moodle:' in line:
+                for link in MOODLE_LINK_PATTERN.finditer(line):
+                    kind = MOODLE_LINK
+                    self.moodle_links.append(MoodleLink(link.group(2), link.group(1)))
+                    self.link_spans.append((pos + link.start(), pos + link.end()))
+            self.tokens.append((kind, pos, end))
+            pos = end + 1
 
 
     def strip(self) -> str:
-        """ Return content with Moodle links removed. """
+        """ Return content with Moodle links, comments and the title removed. """
+        if self._stripped is not None:
+            return self._stripped
         lines = []
-        for line in self.content.splitlines():
-            stripped = line.strip()
-            # Remove Moodle links
-            if stripped.startswith('[') and '](' in stripped:
-                start = stripped.find('](moodle:')
-                end = stripped.find(')', start)
-                if end != -1:
-                    continue
-            # Remove comments
-            if stripped.startswith('<!--') and stripped.endswith('-->'):
+        link_idx = 0
+        title_removed = False
+        for kind, start, end in self.tokens:
+            if kind == COMMENT:
                 continue
-            # Remove title
-            if self.title is not None:
-                if stripped.startswith('# ') or stripped.startswith('## ') or stripped.startswith('### '):
-                    if stripped.endswith(self.title):
-                        continue
-
+            if kind == HEADING and not title_removed:
+                title_removed = True  # the first heading is the title
+                continue
+            if kind == MOODLE_LINK:
+                # remove the links, keep the text around them (if any)
+                parts = []
+                while link_idx < len(self.link_spans) and self.link_spans[link_idx][0] < end:
+                    span_start, span_end = self.link_spans[link_idx]
+                    parts.append(self.content[start:span_start])
+                    start = span_end
+                    link_idx += 1
+                parts.append(self.content[start:end])
+                line = ''.join(parts)
+                if not line.strip():
+                    continue
+            else:
+                line = self.content[start:end]
             lines.append(line)
-        return '\n'.join(lines)
+        self._stripped = '\n'.join(lines)
+        return self._stripped
 
 
     @staticmethod
     def to_html(content: str) -> str:
-        """ Convert the markdown content to HTML. """
+        """ Convert the markdown content to HTML (unchanged pages are taken from the HTML cache). """
+        key = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        with _html_cache_lock:
+            html = _html_cache.get(key)
+            if html is not None:
+                _html_cache.move_to_end(key)
+                return html
         try:
-            html = markdown.markdown(content)
-            return html
+            # the converter of the thread is reused, reset() clears the state of the previous conversion
+            html = _converter().reset().convert(content)
         except ImportError:
             return "<p>Error: markdown module not installed.</p>"
+        with _html_cache_lock:
+            _html_cache[key] = html
+            if len(_html_cache) > HTML_CACHE_SIZE:
+                _html_cache.popitem(last=False)
+        return html
 
 
     @staticmethod
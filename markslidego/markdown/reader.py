@@ -1,11 +1,17 @@
 """ Module to read and parse markdown files. """
 import os
+from collections.abc import Iterator
+import yaml
 
 from markslidego.markdown.page import MarkdownPage
 
 
+PAGE_SEPARATOR = '\n---\n'
+
+
 class MarkdownReader:
-    """ Class to read and parse markdown files. """
+    """ Class to read and parse markdown files.
+    The file is read once, the pages are only parsed when they are used (not for metadata-only callers). """
 
     MAX_METADATA_LINES = 30
 
@@ -15,7 +21,8 @@ class MarkdownReader:
         self.is_marp: bool = False
         self.is_moodle: bool = False
         self.content: str = ""
-        self.pages: list[MarkdownPage] = []
+        self.body_start: int = 0  # offset of the pages in the content (after the front matter)
+        self._pages: list[MarkdownPage]|None = None
 
         self.__read__()
 
@@ -27,64 +34,103 @@ class MarkdownReader:
             print(f"Error: File '{self.filepath}' does not exist.")
             return None
 
-        frontmatter = []
         try:
             with open(self.filepath, 'r', encoding='utf-8') as f:
-
-                # Read meta-data
-                inside = False
-                for i in range(self.MAX_METADATA_LINES):
-                    line = f.readline()
-                    if line == '':
-                        break
-                    stripped = line.strip()
-                    if stripped == '---':
-                        if not inside:
-                            inside = True
-                            continue
-                        else:
-                            # end of frontmatter
-                            break
-                    if inside:
-                        frontmatter.append(stripped)
-
-                self.content = f.read()
-
-                # if content is not empty, then split into pages using '---' as separator
-                if self.content.strip():
-                    self.pages = [MarkdownPage(page.strip()) for page in self.content.split('\n---\n')]
+                content = f.read()
         except Exception:
             return None
 
-        if frontmatter:
-            # Parse metadata
-            for ln in frontmatter:
-                if not ln or ln.startswith('#'):
+        # Find the meta-data (front matter) in the first lines
+        frontmatter_start = frontmatter_end = None
+        pos = 0
+        for _ in range(self.MAX_METADATA_LINES):
+            if pos >= len(content):
+                break
+            line_end = content.find('\n', pos)
+            line_end = len(content) if line_end == -1 else line_end + 1
+            line_start, pos = pos, line_end
+            if content[line_start:line_end].strip() == '---':
+                if frontmatter_start is None:
+                    frontmatter_start = pos
                     continue
-                if ':' not in ln:
-                    # skip invalid lines
-                    continue
-                key, val = ln.split(':', 1)
-                key = key.strip()
-                val = val.strip()
-                # remove surrounding quotes if present
-                if (val.startswith('"') and val.endswith('"')) or (val.startswith("'") and val.endswith("'")):
-                    val = val[1:-1]
-                # convert booleans
-                if val.lower() == 'true':
-                    parsed_val = True
-                elif val.lower() == 'false':
-                    parsed_val = False
-                else:
-                    parsed_val = val
-                self.metadata[key] = parsed_val
-                if key == 'marp' and parsed_val is True:
-                    self.is_marp = True
-                if key == 'moodle' and parsed_val is True:
-                    self.is_moodle = True
-
-        with open(self.filepath, 'r', encoding='utf-8') as f:
-            self.content = f.read()
+                # end of frontmatter
+                frontmatter_end = line_start
+                break
+        self.body_start = pos
+
+        if frontmatter_start is not None:
+            self.__parse_metadata__(content[frontmatter_start:frontmatter_end if frontmatter_end is not None else pos])
+        self.content = content
+
+
+    def __parse_metadata__(self, frontmatter: str) -> None:
+        """ Parse the front matter with the YAML loader, with the simple "key: value" lines as fallback
+        (if it isn't valid YAML, and for unquoted values like #fff which YAML takes as comment, as Marp does).
+        Scalars are kept as they are written (e.g. version: 1.10, yes), only true/false are converted to booleans. """
+        loose = self.__parse_lines__(frontmatter)
+        try:
+            data = yaml.load(frontmatter, Loader=yaml.BaseLoader)
+        except yaml.YAMLError:
+            data = None
+        if isinstance(data, dict):
+            for key, val in data.items():
+                if val == "":
+                    val = loose.get(key, "")
+                elif isinstance(val, str) and val.lower() in ('true', 'false'):
+                    val = val.lower() == 'true'
+                self.metadata[key] = val
+        else:
+            self.metadata.update(loose)
+        self.is_marp = self.metadata.get('marp') is True
+        self.is_moodle = self.metadata.get('moodle') is True
+
+
+    @staticmethod
+    def __parse_lines__(frontmatter: str) -> dict:
+        """ Parse simple "key: value" lines. """
+        metadata = {}
+        for ln in frontmatter.splitlines():
+            ln = ln.strip()
+            if not ln or ln.startswith('#'):
+                continue
+            if ':' not in ln:
+                # skip invalid lines
+                continue
+            key, val = ln.split(':', 1)
+            key = key.strip()
+            val = val.strip()
+            # remove surrounding quotes if present
+            if (val.startswith('"') and val.endswith('"')) or (val.startswith("'") and val.endswith("'")):
+                val = val[1:-1]
+            # convert booleans
+            if val.lower() == 'true':
+                parsed_val = True
+            elif val.lower() == 'false':
+                parsed_val = False
+            else:
+                parsed_val = val
+            metadata[key] = parsed_val
+        return metadata
+
+
+    def iter_pages(self) -> Iterator[MarkdownPage]:
+        """ Parse the pages (separated by '---') one after the other. """
+        body = self.content[self.body_start:]
+        if not body.strip():
+            return
+        start = 0
+        while (end := body.find(PAGE_SEPARATOR, start)) != -1:
+            yield MarkdownPage(body[start:end].strip())
+            start = end + len(PAGE_SEPARATOR)
+        yield MarkdownPage(body[start:].strip())
+
+
+    @property
+    def pages(self) -> list[MarkdownPage]:
+        """ The pages of the markdown file (parsed on first use). """
+        if self._pages is None:
+            self._pages = list(self.iter_pages())
+        return self._pages
 
 
     @staticmethod
@@ -0,0 +1,116 @@
+#!/usr/bin/env node
+/*
+ * Long-lived Marp render worker, used by markslidego/marp_worker.py.
+ *
+ * Keeps NodeJS and marp-cli loaded and processes a queue of conversion jobs. This saves the start-up of npx,
+ * NodeJS and marp-cli per output, not the browser: every marp-cli run still launches (and closes) its own
+ * Chromium for PDF/PPTX/image outputs, as marp-cli's public API doesn't allow to keep it open between runs.
+ * - on start-up one line {"ready": true|false, "version": "..."} is written to stdout
+ * - every input line on stdin is a job {"id": 1, "cwd": "...", "runs": [["--html", ..., "in.md", "-o", "out.pdf"], ...]}
+ *   with the marp-cli arguments for each output of a Markdown source (e.g. PDF and HTML)
+ * - every job is answered by one line {"id": 1, "statuses": [0, ...]} on stdout (marp-cli exit codes)
+ * Marp's own console output is redirected to stderr, so stdout only carries the protocol.
+ */
+const fs = require('fs')
+const path = require('path')
+const readline = require('readline')
+
+const send = process.stdout.write.bind(process.stdout)
+process.stdout.write = process.stderr.write.bind(process.stderr)
+console.log = console.error
+console.info = console.error
+
+const reply = (message) => send(JSON.stringify(message) + '\n')
+
+/* Resolve marp-cli: local node_modules first, then MARKSLIDE_DIR and the global (npm -g) installation */
+const candidateDirs = () => {
+  const nodeDir = path.dirname(process.execPath)
+  const dirs = []
+  if (process.env.MARKSLIDE_DIR) {
+    dirs.push(path.join(process.env.MARKSLIDE_DIR, 'node_modules'))
+  }
+  dirs.push(path.join(nodeDir, '..', 'lib', 'node_modules'))  // Linux/Mac (incl. nvm)
+  dirs.push(path.join(nodeDir, 'node_modules'))               // Windows
+  if (process.env.APPDATA) {
+    dirs.push(path.join(process.env.APPDATA, 'npm', 'node_modules'))
+  }
+  return dirs
+}
+
+const packageDir = (mainFile) => {
+  let dir = path.dirname(mainFile)
+  while (!fs.existsSync(path.join(dir, 'package.json')) && path.dirname(dir) !== dir) {
+    dir = path.dirname(dir)
+  }
+  return dir
+}
+
+const loadMarpCli = () => {
+  let mainFile
+  try {
+    mainFile = require.resolve('@marp-team/marp-cli')
+  } catch (e) {
+    const pkgDir = candidateDirs()
+      .map((dir) => path.join(dir, '@marp-team', 'marp-cli'))
+      .find((dir) => fs.existsSync(dir))
+    if (!pkgDir) {
+      throw e
+    }
+    mainFile = require.resolve(pkgDir)
+  }
+  return { cli: require(mainFile), dir: packageDir(mainFile) }
+}
+
+let marpCli
+let version = 'unknown'
+try {
+  const marp = loadMarpCli()
+  marpCli = marp.cli.marpCli
+  try {
+    version = JSON.parse(fs.readFileSync(path.join(marp.dir, 'package.json'), 'utf-8')).version
+  } catch (e) {
+    // version is only informational
+  }
+} catch (e) {
+  reply({ ready: false, error: String((e && e.message) || e) })
+  process.exit(1)
+}
+reply({ ready: true, version })
+
+const run = async (job) => {
+  const statuses = []
+  const errors = []
+  for (const args of job.runs || []) {
+    let status = 1
+    try {
+      if (job.cwd) {
+        process.chdir(job.cwd)
+      }
+      status = await marpCli(args)
+    } catch (e) {
+      errors.push(String((e && e.message) || e))
+    }
+    statuses.push(status)
+  }
+  reply({ id: job.id, statuses, error: errors.length ? errors.join('; ') : undefined })
+}
+
+/* jobs are processed strictly one after another, in the order they arrive */
+let queue = Promise.resolve()
+const input = readline.createInterface({ input: process.stdin, terminal: false })
+input.on('line', (line) => {
+  if (!line.trim()) {
+    return
+  }
+  let job
+  try {
+    job = JSON.parse(line)
+  } catch (e) {
+    reply({ id: null, statuses: [], error: `Invalid job: ${line}` })
+    return
+  }
+  queue = queue.then(() => run(job))
+})
+input.on('close', () => {
+  queue.then(() => process.exit(0))
+})
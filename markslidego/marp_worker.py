@@ -0,0 +1,135 @@
+""" Client for the long-lived Marp render worker (see marp_worker.js).
+
+Instead of booting NodeJS, npx and marp-cli for every single output, conversion jobs are
+sent over a pipe to a pool of persistent worker processes. Only this start-up is saved: marp-cli
+still launches a browser for each PDF/PPTX output it renders. If no worker can be started
+(e.g. marp-cli is only available through npx), render() returns None and the caller falls
+back to running marp as a subprocess.
+"""
+import atexit
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# Set MARP_WORKER=false in the .env file to always run marp as separate subprocess
+MARP_WORKER = os.environ.get('MARP_WORKER', 'true').lower() not in ('false', '0', 'no', 'off')
+NODE_CMD = os.environ.get('NODE_CMD', '') or shutil.which('node') or ''
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'marp_worker.js')
+
+
+class MarpWorker:
+    """ One persistent NodeJS process with marp-cli loaded, processing one job at a time. """
+
+    def __init__(self) -> None:
+        self.next_job_id = 1
+        self.process = subprocess.Popen([NODE_CMD, WORKER_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, encoding="utf-8", bufsize=1)
+        handshake = self.__receive__()
+        if handshake is None or not handshake.get('ready'):
+            self.close()
+            error = handshake.get('error') if handshake else "no response"
+            raise RuntimeError(f"Marp render worker could not be started: {error}")
+        self.version = handshake.get('version', 'unknown')
+
+
+    def __receive__(self) -> dict|None:
+        line = self.process.stdout.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+
+    def render(self, runs: list[list[str]], cwd: str) -> list[int]:
+        """ Run marp-cli once per argument list inside the worker and return the exit codes. """
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        self.process.stdin.write(json.dumps({'id': job_id, 'cwd': cwd, 'runs': runs}) + "\n")
+        self.process.stdin.flush()
+        response = self.__receive__()
+        if response is None or response.get('id') != job_id:
+            raise RuntimeError("Marp render worker terminated unexpectedly")
+        if response.get('error'):
+            logger.error("Marp render worker: %s", response['error'])
+        statuses = [int(status) for status in response.get('statuses', [])]
+        return statuses + [1] * (len(runs) - len(statuses))
+
+
+    def close(self) -> None:
+        """ Terminate the worker process. """
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+
+
+_idle_workers: list[MarpWorker] = []
+_all_workers: list[MarpWorker] = []
+_lock = threading.Lock()
+_available = MARP_WORKER
+
+
+def _acquire_worker() -> MarpWorker|None:
+    global _available
+    with _lock:
+        if _idle_workers:
+            return _idle_workers.pop()
+        if not _available:
+            return None
+    try:
+        worker = MarpWorker()
+    except (OSError, RuntimeError, ValueError) as e:
+        logger.info("%s, falling back to npx marp.", e)
+        with _lock:
+            _available = False
+        return None
+    logger.debug("Started Marp render worker (marp-cli %s)", worker.version)
+    with _lock:
+        _all_workers.append(worker)
+    return worker
+
+
+def render(runs: list[list[str]], cwd: str|None = None) -> list[int]|None:
+    """ Render all outputs of one job (one marp-cli argument list per output) with a persistent
+    worker; returns the marp exit codes or None if no worker is available. """
+    worker = _acquire_worker()
+    if worker is None:
+        return None
+    try:
+        statuses = worker.render(runs, cwd or os.getcwd())
+    except (OSError, RuntimeError, ValueError) as e:
+        logger.warning("%s, falling back to npx marp.", e)
+        worker.close()
+        return None
+    with _lock:
+        _idle_workers.append(worker)
+    return statuses
+
+
+def version() -> str|None:
+    """ Version of the marp-cli loaded by the workers, or None if no worker is available. """
+    worker = _acquire_worker()
+    if worker is None:
+        return None
+    with _lock:
+        _idle_workers.append(worker)
+    return worker.version
+
+
+@atexit.register
+def shutdown() -> None:
+    """ Terminate all worker processes. """
+    with _lock:
+        workers = list(_all_workers)
+        _all_workers.clear()
+        _idle_workers.clear()
+    for worker in workers:
+        worker.close()
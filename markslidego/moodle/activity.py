@@ -2,12 +2,13 @@
 Moodle activity representation for Moodle backup structure.
 Provides methods to generate XML entries for Moodle activities in the backup.
 """
-import os
+import posixpath
 from typing import override
 from markslidego.markdown.reader import MarkdownReader
 from markslidego.moodle.base import MoodleBase
 from markslidego.moodle.file import MoodleFile
 from markslidego.moodle.section import MoodleSection
+from markslidego.moodle.writer import BackupWriter
 
 
 class MoodleActivity(MoodleBase):
@@ -20,10 +21,8 @@ class MoodleActivity(MoodleBase):
 
     def __init__(self, name:str, title:str, modulename:str="resource", lesson_md: MarkdownReader| None = None):
         super().__init__()
-        self.id = MoodleActivity.next_activity_id
-        MoodleActivity.next_activity_id += 1
-        self.module_id = MoodleActivity.next_module_id
-        MoodleActivity.next_module_id += 1
+        self.id = self._reserve_ids_(MoodleActivity, "next_activity_id")
+        self.module_id = self._reserve_ids_(MoodleActivity, "next_module_id")
         self.name = name
         self.title = title.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
         self.modulename = modulename
@@ -33,7 +32,7 @@ class MoodleActivity(MoodleBase):
         self.section: MoodleSection | None = None
 
 
-    def __generate_inforef__(self) -> None:
+    def __generate_inforef__(self, writer:BackupWriter, path:str) -> None:
         file_content = """<?xml version="1.0" encoding="UTF-8"?>
 <inforef>
   <fileref>
@@ -46,11 +45,10 @@ class MoodleActivity(MoodleBase):
         file_content += """  </fileref>
 </inforef>
 """
-        with open("inforef.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "inforef.xml"), file_content)
 
 
-    def __generate_module__(self) -> None:
+    def __generate_module__(self, writer:BackupWriter, path:str) -> None:
         file_content = f"""<?xml version="1.0" encoding="UTF-8"?>
 <module id="{self.module_id}" version="2024100700">
   <modulename>{self.modulename}</modulename>
@@ -82,11 +80,10 @@ class MoodleActivity(MoodleBase):
   </tags>
 </module>
 """
-        with open("module.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "module.xml"), file_content)
 
 
-    def __generate_resource__(self) -> None:
+    def __generate_resource__(self, writer:BackupWriter, path:str) -> None:
         file_content = f"""<?xml version="1.0" encoding="UTF-8"?>
 <activity id="{self.id}" moduleid="{self.module_id}" modulename="resource" contextid="{self.files[0].context_id if self.files else 0}">
   <resource id="{self.id}">
@@ -104,11 +101,10 @@ class MoodleActivity(MoodleBase):
   </resource>
 </activity>
 """
-        with open("resource.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "resource.xml"), file_content)
 
 
-    def __generate_scorm__(self) -> None:
+    def __generate_scorm__(self, writer:BackupWriter, path:str) -> None:
         # find the imsmanifest.xml file in self.files
         imsmanifest_file = next((f for f in self.files if f.filename == "imsmanifest.xml"), None)
         scormzip_file = self.files[-1] if self.files else None
@@ -208,11 +204,10 @@ class MoodleActivity(MoodleBase):
   </scorm>
 </activity>
 """
-        with open("scorm.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "scorm.xml"), file_content)
 
 
-    def __generate_lesson__(self) -> None:
+    def __generate_lesson__(self, writer:BackupWriter, path:str) -> None:
         file_content = f"""<?xml version="1.0" encoding="UTF-8"?>
 <activity id="{self.id}" moduleid="{self.module_id}" modulename="lesson" contextid="{self.files[0].context_id if self.files else 0}">
   <lesson id="{self.id}">
@@ -260,8 +255,9 @@ class MoodleActivity(MoodleBase):
     <pages>
 """
         if self.lesson_md:
+            first_page_id = self._reserve_ids_(MoodleActivity, "next_lesson_page_id", len(self.lesson_md.pages)*10)
             for idx, page in enumerate(self.lesson_md.pages):
-                page_id = MoodleActivity.next_lesson_page_id + idx*10
+                page_id = first_page_id + idx*10
                 if page.moodle_type == "ESSAY":
                     qtype = 10
                 elif page.moodle_type == "SHORTANSWER":
@@ -284,8 +280,9 @@ class MoodleActivity(MoodleBase):
         <contentsformat>1</contentsformat>
         <answers>
 """
+                first_answer_id = self._reserve_ids_(MoodleActivity, "next_lesson_answer_id", len(page.moodle_links))
                 for answer_idx, answer in enumerate(page.moodle_links):
-                    answer_content = f"""          <answer id="{MoodleActivity.next_lesson_answer_id + answer_idx}">
+                    answer_content = f"""          <answer id="{first_answer_id + answer_idx}">
             <jumpto>{answer.params.get("jumpto", 0)}</jumpto>
             <grade>0</grade>
             <score>{answer.params.get("score", 0)}</score>
@@ -302,7 +299,6 @@ class MoodleActivity(MoodleBase):
 """
                     page_content += answer_content
 
-                MoodleActivity.next_lesson_answer_id += len(page.moodle_links)
                 page_content += """        </answers>
         <branches>
         </branches>
@@ -310,7 +306,6 @@ class MoodleActivity(MoodleBase):
 """
                 file_content += page_content
 
-        MoodleActivity.next_lesson_page_id += len(self.lesson_md.pages)*10 if self.lesson_md else 0
         file_content += """    </pages>
     <grades>
     </grades>
@@ -321,26 +316,22 @@ class MoodleActivity(MoodleBase):
   </lesson>
 </activity>
 """
-        with open("lesson.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "lesson.xml"), file_content)
 
 
 
     @override
-    def generate(self) -> None:
-        os.makedirs(f"{self.modulename}_{self.module_id}", exist_ok=True)
-        os.chdir(f"{self.modulename}_{self.module_id}")
+    def generate(self, writer:BackupWriter, path:str = "") -> None:
+        path = posixpath.join(path, f"{self.modulename}_{self.module_id}")
 
-        self._generate_empty_("grade_history.xml", "grade_history", "grade_grades")
-        self._generate_empty_("grades.xml", "activity_gradebook", ["grade_items", "grade_letters"])
-        self.__generate_inforef__()
-        self.__generate_module__()
+        self._generate_empty_(writer, posixpath.join(path, "grade_history.xml"), "grade_history", "grade_grades")
+        self._generate_empty_(writer, posixpath.join(path, "grades.xml"), "activity_gradebook", ["grade_items", "grade_letters"])
+        self.__generate_inforef__(writer, path)
+        self.__generate_module__(writer, path)
         if self.modulename == "resource":
-            self.__generate_resource__()
+            self.__generate_resource__(writer, path)
         elif self.modulename == "scorm":
-            self.__generate_scorm__()
+            self.__generate_scorm__(writer, path)
         elif self.modulename == "lesson":
-            self.__generate_lesson__()
-        self._generate_empty_("roles.xml", "roles", ["role_overrides", "role_assignments"])
-
-        os.chdir("..")  # leave activity directory
+            self.__generate_lesson__(writer, path)
+        self._generate_empty_(writer, posixpath.join(path, "roles.xml"), "roles", ["role_overrides", "role_assignments"])
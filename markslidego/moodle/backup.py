@@ -3,36 +3,44 @@ Moodle backup representation for Moodle backup structure.
 Provides methods to generate the complete Moodle backup structure including files, activities, sections, and course information
 """
 
+import contextlib
 import hashlib
 import os
+import posixpath
 from typing import override
-from markslidego.file_utils import remove_dir_recursively, remove_file_if_exists, zip_current_directory
-from markslidego.generate import create_ims_manifest, generate, is_source_newer
+from markslidego.file_utils import remove_dir_recursively, remove_file_if_exists, zip_directory
+from markslidego.build_cache import CACHE_FILE, get_build_cache
+from markslidego.generate import create_ims_manifest, generate_targets, render_key
+from markslidego.generate_course import theme_files
 from markslidego.markdown.reader import MarkdownReader
 from markslidego.moodle.base import MoodleBase
 from markslidego.moodle.file import MoodleFile
 from markslidego.moodle.activity import MoodleActivity
 from markslidego.moodle.course import MoodleCourse
 from markslidego.moodle.section import MoodleSection
+from markslidego.moodle.writer import ArchiveWriter, BackupWriter, DirectoryWriter
 
 
 
 class MoodleBackup(MoodleBase):
     """ Class to represent a complete Moodle backup structure. """
-    def __init__(self, course_name, course_title, course_id):
+    def __init__(self, course_name, course_title, course_id, output_dir:str = "output", template_dir:str|None = None):
         super().__init__()
         self.course = MoodleCourse(course_name, course_title, course_id)
         self.files:list[MoodleFile] = []
         self.activities:list[MoodleActivity] = []
         self.sections:dict[str,MoodleSection] = {}
         self.filename:str = ""
+        self.output_dir = output_dir
+        self.template_dir = template_dir  # of the theme files the materials are rendered with
+        self.cache = get_build_cache(os.path.join(output_dir, os.path.basename(CACHE_FILE)))
 
         # generate a SHA1 hash from course name and id
         hash_input = f"{course_name}{course_id}".encode("utf-8")
         self.backup_hash = hashlib.sha1(hash_input).hexdigest()
 
 
-    def __generate_files__(self) -> None:
+    def __generate_files__(self, writer:BackupWriter, path:str) -> None:
         file_content = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
         file_content += "<files>\n"
         for f in self.files:
@@ -60,12 +68,11 @@ class MoodleBackup(MoodleBase):
   </file>
 """
         file_content += "</files>\n"
-        with open("files.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "files.xml"), file_content)
 
 
 
-    def __generate_groups__(self) -> None:
+    def __generate_groups__(self, writer:BackupWriter, path:str) -> None:
         file_content = """<?xml version="1.0" encoding="UTF-8"?>
 <groups>
   <groupcustomfields>
@@ -76,11 +83,10 @@ class MoodleBackup(MoodleBase):
   </groupings>
 </groups>
 """
-        with open("groups.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "groups.xml"), file_content)
 
 
-    def __generate_roles__(self) -> None:
+    def __generate_roles__(self, writer:BackupWriter, path:str) -> None:
         file_content = """<?xml version="1.0" encoding="UTF-8"?>
 <roles_definition>
   <role id=\"""" + self.ROLE_ID + """\">
@@ -93,12 +99,11 @@ class MoodleBackup(MoodleBase):
   </role>
 </roles_definition>
 """
-        with open("roles.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "roles.xml"), file_content)
 
 
     @override
-    def generate(self) -> None:
+    def generate(self, writer:BackupWriter, path:str = "") -> None:
         file_content =  f"""<?xml version="1.0" encoding="UTF-8"?>
 <moodle_backup>
   <information>
@@ -307,8 +312,7 @@ class MoodleBackup(MoodleBase):
   </information>
 </moodle_backup>"""
 
-        with open("moodle_backup.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "moodle_backup.xml"), file_content)
 
 
     def create_section(self, md_file:str, topic_name:str, topic_nr:int = 0) -> MoodleSection:
@@ -329,11 +333,33 @@ class MoodleBackup(MoodleBase):
         return section
 
 
+    def render_material(self, source_file:str, targets:dict, activity_title:str) -> None:
+        """ Render the outdated targets (mapped to their generation options) of a Marp deck together (one Marp conversion each) """
+        if not os.path.exists(source_file):
+            return
+        cache = self.cache
+        outdated = {}
+        keys = {}
+        for target_file, options in targets.items():
+            manifest = [self.course.name, self.course.title, activity_title] \
+                if options and "--scorm" in options else None
+            keys[target_file] = render_key(cache, source_file, options, theme_files(self.template_dir),
+                                           {'manifest': manifest})
+            if not cache.is_up_to_date(target_file, keys[target_file]):
+                if manifest:
+                    create_ims_manifest(target_file, *manifest)
+                outdated[target_file] = options
+        if not outdated:
+            return
+
+        print(f"Generating material: {source_file} -> {', '.join(outdated)}")
+        for target_file in generate_targets(source_file, outdated):
+            cache.update(target_file, keys[target_file])
+
+
     def create_activity_file(self, section:MoodleSection, activity_title:str, target_file:str, source_file:str):
         """ Factory method to create a MoodleActivity and add it to the backup """
-        if is_source_newer(source_file, target_file):
-            print(f"Generating material: {source_file} -> {target_file}")
-            generate(source_file, target_file, None)
+        self.render_material(source_file, {target_file: None}, activity_title)
 
         activity_name = os.path.splitext(os.path.basename(target_file))[0]
         print(f"Creating file-activity {activity_name} from {target_file}")
@@ -349,12 +375,7 @@ class MoodleBackup(MoodleBase):
 
     def create_activity_scorm(self, section:MoodleSection, activity_title:str, target_file:str, source_file:str):
         """ Factory method to create a MoodleActivity and add it to the backup """
-        if is_source_newer(source_file, target_file):
-            course_title = self.course.title
-            course_name = self.course.name
-            print(f"Generating material: {source_file} -> {target_file}")
-            create_ims_manifest(target_file, course_name, course_title, activity_title)
-            generate(source_file, target_file, ["--scorm"])
+        self.render_material(source_file, {target_file: ["--scorm"]}, activity_title)
 
         target_file = target_file.replace(".html", ".zip")
 
@@ -382,94 +403,80 @@ class MoodleBackup(MoodleBase):
         self.activities.append(moodle_activity)
 
 
-    def generate_mbz(self, mbz_filename:str, remove_intermediate_files:bool = False, replace_existing:bool = True) -> None:
-        """ Generate the Moodle backup .mbz file. """
-        os.makedirs("output", exist_ok=True)
-        os.chdir("output")
-        mbz_directory = mbz_filename.replace(".mbz", "")
+    @contextlib.contextmanager
+    def __open_writer__(self, filename:str, directory_name:str, keep_directory:bool, replace_existing:bool):
+        """ Writer for the archive in the output directory (via a directory tree if keep_directory is set). """
+        os.makedirs(self.output_dir, exist_ok=True)
+        archive_path = os.path.join(self.output_dir, filename)
+        directory = os.path.join(self.output_dir, directory_name)
         if replace_existing:
-            remove_dir_recursively(mbz_directory)
-            remove_file_if_exists(mbz_filename)
-        os.makedirs(mbz_directory, exist_ok=not replace_existing)
-        os.chdir(mbz_directory)
-
-        self.__generate_files__()
-        self.__generate_groups__()
-        self._generate_empty_("outcomes.xml", "outcomes_definition")
-        self._generate_empty_("questions.xml", "question_categories")
-        self.__generate_roles__()
-        self._generate_empty_("scales.xml", "scales_definition")
+            remove_dir_recursively(directory)
+            remove_file_if_exists(archive_path)
+        elif os.path.exists(archive_path):
+            raise FileExistsError(f"{archive_path} already exists")
+
+        if keep_directory:
+            # debug mode: keep the archive contents as directory tree next to the archive
+            os.makedirs(directory)
+            with DirectoryWriter(directory) as writer:
+                yield writer
+            zip_directory(directory, archive_path)
+        else:
+            with ArchiveWriter(archive_path) as writer:
+                yield writer
+
+
+    def generate_mbz(self, mbz_filename:str, keep_directory:bool = False, replace_existing:bool = True) -> None:
+        """ Generate the Moodle backup .mbz file (streamed into the archive, or via a directory tree if keep_directory is set). """
+        self.filename = mbz_filename
+        self.cache.flush()  # the materials are rendered by now
+        with self.__open_writer__(mbz_filename, mbz_filename.replace(".mbz", ""), keep_directory, replace_existing) as writer:
+            self.__generate_mbz_contents__(writer)
+        print(f"Generated {mbz_filename} with {len(self.sections)} sections, {len(self.activities)} activities, and {len(self.files)} files "
+              f"({len(writer.content_index)} unique contents, {writer.deduplicated_bytes} bytes saved by deduplication).")
+
+
+    def __generate_mbz_contents__(self, writer:BackupWriter) -> None:
+        self.__generate_groups__(writer, "")
+        self._generate_empty_(writer, "outcomes.xml", "outcomes_definition")
+        self._generate_empty_(writer, "questions.xml", "question_categories")
+        self.__generate_roles__(writer, "")
+        self._generate_empty_(writer, "scales.xml", "scales_definition")
 
         # ----- /activities -----
-        if self.activities:
-            os.makedirs("activities", exist_ok=True)
-            os.chdir("activities")
-            for activity in self.activities:
-                activity.generate()
-            os.chdir("..")  # leave activities directory
+        for activity in self.activities:
+            activity.generate(writer, "activities")
 
         # ----- /course -----
-        self.course.generate()
+        self.course.generate(writer)
 
         # ----- /files -----
-        if self.files:
-            os.makedirs("files", exist_ok=True)
-            os.chdir("files")
-            for f in self.files:
-                f.generate()
-            os.chdir("..")  # leave files directory
+        # the files store is content-addressed: shared contents (e.g. theme images of several SCORM packages)
+        # are written once, while files.xml still references them for each context
+        for f in self.files:
+            f.generate(writer, "files")
+        for f in self.files:
+            f.close()
+        # files.xml after the files store, where the entries of SCORM packages get hashed
+        self.__generate_files__(writer, "")
 
         # ----- /sections -----
-        if self.sections:
-            os.makedirs("sections", exist_ok=True)
-            os.chdir("sections")
-            for section in self.sections.values():
-                section.generate()
-            os.chdir("..")
+        for section in self.sections.values():
+            section.generate(writer, "sections")
 
         # -------------------
-        self.filename = mbz_filename
-        self.generate()
-
-        zip_current_directory(".mbz")
-        if remove_intermediate_files and os.path.exists(mbz_directory):
-            remove_dir_recursively(mbz_directory)
-        os.chdir("..")  # leave mbz directory
+        self.generate(writer)
 
-        os.chdir("..")  # leave output directory
-        MoodleFile.remove_intermediate_dirs()
-        print(f"Generated {mbz_filename} with {len(self.sections)} sections, {len(self.activities)} activities, and {len(self.files)} files.")
 
-
-    def generate_zip(self, zip_filename:str, remove_intermediate_files:bool = False, replace_existing:bool = True) -> None:
-        """ Generate the Moodle backup .zip file. """
-        os.makedirs("output", exist_ok=True)
-        os.chdir("output")
-        zip_directory = zip_filename.replace(".zip", "")
-        if replace_existing:
-            remove_dir_recursively(zip_directory)
-            remove_file_if_exists(zip_filename)
-        os.makedirs(zip_directory, exist_ok=not replace_existing)
-        os.chdir(zip_directory)
+    def generate_zip(self, zip_filename:str, keep_directory:bool = False, replace_existing:bool = True) -> None:
+        """ Generate the .zip file with the materials of all activities, grouped by section and activity. """
         filecount = 0
-
-        # ----- Sections -----
-        if self.sections:
+        with self.__open_writer__(zip_filename, zip_filename.replace(".zip", "_zip"), keep_directory, replace_existing) as writer:
+            # ----- Sections -----
             for section in self.sections.values():
-                if section.activities:
-                    # ----- Activities -----
-                    os.makedirs(section.name, exist_ok=True)
-                    for activity in section.activities:
-                        os.makedirs(f"{section.name}/{activity.name}", exist_ok=True)
-                        for f in activity.files:
-                            if f.copy_file_to(f"{section.name}/{activity.name}"):
-                                filecount += 1
-
-        zip_current_directory()
-        if remove_intermediate_files and os.path.exists(zip_directory):
-            remove_dir_recursively(zip_directory)
-        os.chdir("..")  # leave zip directory
-
-        os.chdir("..")  # leave output directory
-        MoodleFile.remove_intermediate_dirs()
+                # ----- Activities -----
+                for activity in section.activities:
+                    for f in activity.files:
+                        if f.copy_file_to(writer, f"{section.name}/{activity.name}"):
+                            filecount += 1
         print(f"Generated {zip_filename} with {len(self.sections)} sections, {len(self.activities)} activities, and {filecount} files.")
@@ -2,8 +2,10 @@
 Moodle base class representing an (abstract) entity in Moodle backup structure
 Provides methods to generate XML files for the Moodle backup
 """
+import threading
 import time
 from abc import ABC, abstractmethod
+from markslidego.moodle.writer import BackupWriter
 
 
 class MoodleBase(ABC):
@@ -16,12 +18,23 @@ class MoodleBase(ABC):
     ROLE_ID = "5"
     USER_ID = "17726"
 
+    _id_lock = threading.Lock()
+
 
     def __init__(self):
         self.current_timestamp = int(time.time())
 
 
-    def _generate_empty_(self, filename, root_elem_name, child_elem_name = None) -> None:
+    @staticmethod
+    def _reserve_ids_(owner:type, counter:str, count:int = 1) -> int:
+        """ Reserve count consecutive ids of the class-level counter of owner (thread-safe), returns the first one. """
+        with MoodleBase._id_lock:
+            first_id = getattr(owner, counter)
+            setattr(owner, counter, first_id + count)
+            return first_id
+
+
+    def _generate_empty_(self, writer:BackupWriter, filename, root_elem_name, child_elem_name = None) -> None:
         file_content = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
         if root_elem_name:
             file_content += f"<{root_elem_name}>\n"
@@ -37,10 +50,9 @@ class MoodleBase(ABC):
 
         if root_elem_name:
             file_content += f"</{root_elem_name}>\n"
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(filename, file_content)
 
     @abstractmethod
-    def generate(self) -> None:
-        """ Generate the XML file for this Moodle entity. """
+    def generate(self, writer:BackupWriter, path:str = "") -> None:
+        """ Generate the XML file for this Moodle entity (below the path inside the backup). """
         raise NotImplementedError()
@@ -2,9 +2,10 @@
 Moodle course representation for Moodle backup structure.
 Provides methods to generate XML entries for Moodle courses in the backup.
 """
-import os
+import posixpath
 from typing import override
 from markslidego.moodle.base import MoodleBase
+from markslidego.moodle.writer import BackupWriter
 
 
 class MoodleCourse(MoodleBase):
@@ -16,7 +17,7 @@ class MoodleCourse(MoodleBase):
         self.id = course_id
 
 
-    def __generate_course__(self) -> None:
+    def __generate_course__(self, writer:BackupWriter, path:str) -> None:
         file_content = f"""<?xml version="1.0" encoding="UTF-8"?>
 <course id="{self.id}" contextid="946563">
   <shortname>{self.name}</shortname>
@@ -149,11 +150,10 @@ class MoodleCourse(MoodleBase):
   </courseformatoptions>
 </course>
 """
-        with open("course.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "course.xml"), file_content)
 
 
-    def __generate_enrolments__(self) -> None:
+    def __generate_enrolments__(self, writer:BackupWriter, path:str) -> None:
         file_content = f"""<?xml version="1.0" encoding="UTF-8"?>
 <enrolments>
   <enrols>
@@ -196,11 +196,10 @@ class MoodleCourse(MoodleBase):
   </enrols>
 </enrolments>
 """
-        with open("enrolments.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "enrolments.xml"), file_content)
 
 
-    def __generate_inforef__(self) -> None:
+    def __generate_inforef__(self, writer:BackupWriter, path:str) -> None:
         file_content = f"""<?xml version="1.0" encoding="UTF-8"?>
 <inforef>
   <roleref>
@@ -210,19 +209,15 @@ class MoodleCourse(MoodleBase):
   </roleref>
 </inforef>
 """
-        with open("inforef.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "inforef.xml"), file_content)
 
 
     @override
-    def generate(self) -> None:
-        os.makedirs("course", exist_ok=True)
-        os.chdir("course")
+    def generate(self, writer:BackupWriter, path:str = "") -> None:
+        path = posixpath.join(path, "course")
 
-        self._generate_empty_("completiondefaults.xml", "course_completion_defaults")
-        self.__generate_course__()
-        self.__generate_enrolments__()
-        self.__generate_inforef__()
-        self._generate_empty_("roles.xml", "roles", ["role_overrides", "role_assignments"])
-
-        os.chdir("..")  # leave course directory
+        self._generate_empty_(writer, posixpath.join(path, "completiondefaults.xml"), "course_completion_defaults")
+        self.__generate_course__(writer, path)
+        self.__generate_enrolments__(writer, path)
+        self.__generate_inforef__(writer, path)
+        self._generate_empty_(writer, posixpath.join(path, "roles.xml"), "roles", ["role_overrides", "role_assignments"])
@@ -4,13 +4,41 @@ Provides methods to generate XML entries and handle file content for Moodle back
 """
 import hashlib
 import os
+import posixpath
+import threading
 import xml.etree.ElementTree as ET
 import zipfile
 import sys
 from typing import override
+from markslidego.archive import CHUNK_SIZE, ZipEntry, get_index
 from markslidego.moodle.base import MoodleBase
+from markslidego.moodle.writer import BackupWriter
 
 
+class PackageArchive:
+    """ The ZIP archive of a package, opened once (on first use) for reading all of its entries. """
+
+    def __init__(self, zip_filepath:str) -> None:
+        self.zip_filepath = zip_filepath
+        self.zip_file: zipfile.ZipFile|None = None
+        self.lock = threading.Lock()
+
+
+    def open(self, name:str):
+        """ Open the entry for binary reading. """
+        with self.lock:
+            if self.zip_file is None:
+                self.zip_file = zipfile.ZipFile(self.zip_filepath, 'r')
+            return self.zip_file.open(name)
+
+
+    def close(self) -> None:
+        """ Close the archive (entries which are still open can be read to their end). """
+        with self.lock:
+            if self.zip_file is not None:
+                self.zip_file.close()
+                self.zip_file = None
+
 
 class MoodleFile(MoodleBase):
     """ Class to represent a Moodle file in the backup structure. """
@@ -18,46 +46,85 @@ class MoodleFile(MoodleBase):
     next_file_id = 10000
     next_context_id = 15000
 
-    intermediate_dirs = []
-
-    def __init__(self, filepath:str, component:str = "mod_resource", context_id:int=0, filearea:str="content"):
+    def __init__(self, filepath:str, component:str = "mod_resource", context_id:int=0, filearea:str="content",
+                 zip_entry:ZipEntry|None = None, archive:PackageArchive|None = None):
+        """ Represents the file at filepath, or (if zip_entry is given) the entry inside the ZIP archive at filepath,
+        which is read through the archive shared by all entries of the package. """
         super().__init__()
-        self.file_id = MoodleFile.next_file_id
-        MoodleFile.next_file_id += 1
+        self.file_id = self._reserve_ids_(MoodleFile, "next_file_id")
         if context_id != 0:
             self.context_id = context_id
         else:
-            self.context_id = MoodleFile.next_context_id
-            MoodleFile.next_context_id += 1
+            self.context_id = self._reserve_ids_(MoodleFile, "next_context_id")
         self.filepath = filepath
+        self.source_path = os.path.abspath(filepath)
+        self.zip_entry = zip_entry
+        self.archive = archive if archive is not None or zip_entry is None else PackageArchive(filepath)
         self.subdir = ""
         self.filearea = filearea
         self.component = component
 
-        self.filename = os.path.basename(filepath)
-        self.filesize = os.path.getsize(filepath)
-        self.mimetype = self.get_mime_type(filepath)
-        self.creationtime = int(os.path.getctime(filepath))
-        self.modificationtime = int(os.path.getmtime(filepath))
-
-        # self.content_hash is the SHA1 hash of the file content
-        sha1 = hashlib.sha1()
-        with open(filepath, "rb") as f:
-            while True:
-                data = f.read(65536)  # Read in 64k chunks
-                if not data:
-                    break
-                sha1.update(data)
-        self.content_hash = sha1.hexdigest()
+        if zip_entry is not None:
+            # the file is read from the archive, its hash is taken from the archive index (if known)
+            # or computed when streaming it into the files store (see generate)
+            entry_dir, self.filename = os.path.split(zip_entry.name)
+            if entry_dir:
+                self.subdir = "/" + entry_dir
+            self.filesize = zip_entry.size
+            self.mimetype = self.get_mime_type(zip_entry.name)
+            self.creationtime = int(os.path.getctime(filepath))
+            self.modificationtime = int(os.path.getmtime(filepath))
+            self._content_hash = zip_entry.sha1
+        else:
+            self.filename = os.path.basename(filepath)
+            self.filesize = os.path.getsize(filepath)
+            self.mimetype = self.get_mime_type(filepath)
+            self.creationtime = int(os.path.getctime(filepath))
+            self.modificationtime = int(os.path.getmtime(filepath))
+
+            # self.content_hash is the SHA1 hash of the file content
+            sha1 = hashlib.sha1()
+            with open(filepath, "rb") as f:
+                while True:
+                    data = f.read(65536)  # Read in 64k chunks
+                    if not data:
+                        break
+                    sha1.update(data)
+            self._content_hash = sha1.hexdigest()
 
         # if file has structured content, then store them as dictionary
         self.content_dict = {}
         if self.filename == "imsmanifest.xml":
-            with open(filepath, "r", encoding="utf-8") as f:
-                xml_string = f.read()
+            with self.open() as f:
+                xml_string = f.read().decode("utf-8")
             self.content_dict = self.parse_imsmanifest(xml_string)
 
 
+    @property
+    def content_hash(self) -> str:
+        """ SHA1 hash of the file content (entries of ZIP archives are hashed on first use). """
+        if self._content_hash is None:
+            sha1 = hashlib.sha1()
+            with self.open() as f:
+                while data := f.read(CHUNK_SIZE):
+                    sha1.update(data)
+            self._content_hash = sha1.hexdigest()
+        return self._content_hash
+
+
+    def open(self, filepath:str|None = None):
+        """ Open the file content (the file itself or the entry of the ZIP archive) for binary reading. """
+        if self.zip_entry is None:
+            return open(filepath or self.source_path, "rb")
+        return self.archive.open(self.zip_entry.name)
+
+
+    def close(self) -> None:
+        """ Close the archive the entry is read from (it is opened again when needed). """
+        if self.archive is not None:
+            self.archive.close()
+
+
     @staticmethod
     def get_mime_type(filepath:str) -> str:
         """ Return the mime type based on the file extension. """
@@ -96,38 +163,21 @@ class MoodleFile(MoodleBase):
 
 
     @override
-    def generate(self) -> None:
-        """ Generate the file content in the appropriate directory structure. """
-        files_subdir = self.content_hash[0:2]
-        os.makedirs(f"{files_subdir}", exist_ok=True)
-        os.chdir(f"{files_subdir}")
-        # copy file contents to self.content_hash
-        with open(self.content_hash, "wb") as out_file:
-            # open source file and copy contents
-            with open(os.path.join("..", "..", "..", "..", self.filepath), "rb") as in_file:
-                while True:
-                    data = in_file.read(65536)  # Read in 64k chunks
-                    if not data:
-                        break
-                    out_file.write(data)
-        os.chdir("..")
-
-
-    def copy_file_to(self, target_dir:str) -> bool:
-        """ Copy the file to the specified target directory. """
-        source_filepath = os.path.join("..", "..", self.filepath)
-        if os.path.exists(source_filepath):
-            target_filepath = os.path.join(target_dir, self.filename)
-            with open(target_filepath, "wb") as out_file:
-                # open source file and copy contents
-                with open(source_filepath, "rb") as in_file:
-                    while True:
-                        data = in_file.read(65536)  # Read in 64k chunks
-                        if not data:
-                            break
-                        out_file.write(data)
-            return True
-        return False
+    def generate(self, writer:BackupWriter, path:str = "") -> None:
+        """ Store the file content (once per content hash) in the content-addressed files store. """
+        # entries of archives without index get hashed while they are stored
+        self._content_hash = writer.write_content_addressed(path, self.open, self._content_hash)
+
+
+    def copy_file_to(self, writer:BackupWriter, target_dir:str) -> bool:
+        """ Copy the file to the specified target directory (of the writer). """
+        if self.zip_entry is not None:
+            return False  # entries are contained in the (copied) ZIP archive itself
+        if not os.path.exists(self.source_path):
+            return False
+        with self.open() as in_file:
+            writer.write_stream(posixpath.join(target_dir, self.filename), in_file)
+        return True
 
 
     @staticmethod
@@ -171,38 +221,22 @@ class MoodleFile(MoodleBase):
 
     @staticmethod
     def unzip_and_add(zip_filepath:str, component:str="mod_scorm") -> list:
-        """ Unzip the specified zip file and create MoodleFile instances for each file inside. """
-        zip_contents_dir = zip_filepath.replace(".zip", "_unzipped")
+        """ Create MoodleFile instances for the zip file and each file inside (without extracting it). """
         if not os.path.exists(zip_filepath):
             print(f"Error: Zip file {zip_filepath} does not exist.", file=sys.stderr)
             return []
-        with zipfile.ZipFile(zip_filepath, 'r') as zip_ref:
-            zip_ref.extractall(zip_contents_dir)
-        MoodleFile.intermediate_dirs.append(zip_contents_dir)
-
-        context_id = MoodleFile.next_context_id
-        MoodleFile.next_context_id += 1
-        result = []
-        # walk through the files in the extracted directory recursivly and create MoodleFile instances
-        for root, dirs, files in os.walk(zip_contents_dir):
-            for name in files:
-                filepath = os.path.join(root, name)
-                moodlefile = MoodleFile(filepath, component, context_id)
-                if zip_contents_dir != root:
-                    moodlefile.subdir = root.replace(zip_contents_dir, "")
-                result.append(moodlefile)
+
+        # if the archive was written by this build, its index provides all entries, sizes and hashes,
+        # otherwise the entries are hashed when streaming them into the files store
+        zip_index = get_index(zip_filepath)
+        if zip_index is None:
+            with zipfile.ZipFile(zip_filepath, 'r') as zip_ref:
+                zip_index = [ZipEntry(info.filename, info.file_size, None, info.date_time)
+                             for info in zip_ref.infolist() if not info.is_dir()]
+
+        context_id = MoodleBase._reserve_ids_(MoodleFile, "next_context_id")
+        archive = PackageArchive(zip_filepath)
+        result = [MoodleFile(zip_filepath, component, context_id, zip_entry=entry, archive=archive) for entry in zip_index]
+        archive.close()  # until the entries are stored in the backup
         result.append(MoodleFile(zip_filepath, component, context_id))
         return result
-
-
-    @staticmethod
-    def remove_intermediate_dirs():
-        """ Remove all intermediate directories created during file operations. """
-        for intermediate_dir in MoodleFile.intermediate_dirs:
-            if os.path.exists(intermediate_dir):
-                for root, dirs, files in os.walk(intermediate_dir, topdown=False):
-                    for name in files:
-                        os.remove(os.path.join(root, name))
-                    for name in dirs:
-                        os.rmdir(os.path.join(root, name))
-                os.rmdir(intermediate_dir)
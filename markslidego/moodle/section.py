@@ -2,9 +2,10 @@
 Moodle section representation for Moodle backup structure.
 Provides methods to generate XML entries for Moodle sections in the backup.
 """
-import os
+import posixpath
 from typing import override
 from markslidego.moodle.base import MoodleBase
+from markslidego.moodle.writer import BackupWriter
 
 
 class MoodleSection(MoodleBase):
@@ -14,8 +15,7 @@ class MoodleSection(MoodleBase):
 
     def __init__(self, name:str, title:str, number:int):
         super().__init__()
-        self.id = MoodleSection.next_section_id
-        MoodleSection.next_section_id += 1
+        self.id = self._reserve_ids_(MoodleSection, "next_section_id")
         self.name = name
         self.title = title.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
         self.number = number
@@ -24,7 +24,7 @@ class MoodleSection(MoodleBase):
         self.activities = []
 
 
-    def __generate_section__(self) -> None:
+    def __generate_section__(self, writer:BackupWriter, path:str) -> None:
         file_content = f"""<?xml version="1.0" encoding="UTF-8"?>
 <section id="{self.id}">
   <number>{self.number}</number>
@@ -59,16 +59,12 @@ class MoodleSection(MoodleBase):
   </course_format_options>
 </section>
 """
-        with open("section.xml", "w", encoding="utf-8") as f:
-            f.write(file_content)
+        writer.write_text(posixpath.join(path, "section.xml"), file_content)
 
 
     @override
-    def generate(self) -> None:
-        os.makedirs(f"section_{self.id}", exist_ok=True)
-        os.chdir(f"section_{self.id}")
+    def generate(self, writer:BackupWriter, path:str = "") -> None:
+        path = posixpath.join(path, f"section_{self.id}")
 
-        self._generate_empty_("inforef.xml", "inforef")
-        self.__generate_section__()
-
-        os.chdir("..")
+        self._generate_empty_(writer, posixpath.join(path, "inforef.xml"), "inforef")
+        self.__generate_section__(writer, path)
@@ -0,0 +1,202 @@
+"""
+Output backends for the Moodle backup structure.
+The backup entities write their XML documents and file contents through a writer, which either streams
+them straight into the .mbz archive or (for debugging) creates the backup directory tree on disk.
+"""
+import hashlib
+import logging
+import os
+import posixpath
+import tempfile
+import threading
+import zipfile
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import override
+from markslidego.archive import CHUNK_SIZE, ZipStreamWriter
+
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SIZE = 8 * 1024 * 1024  # Contents of unknown hash are buffered in memory up to 8MB, then on disk
+
+
+class BackupWriter(ABC):
+    """ Abstract output backend for the files of a Moodle backup (paths are relative to the backup root).
+    Writers may be shared by several threads. Each path is written once: a second write to the same path
+    is skipped with a warning, as an archive can't overwrite its entries (the first one wins). """
+
+    def __init__(self) -> None:
+        # index of the content-addressed store: each unique content is only written once
+        self.content_index: dict[str, int] = {}   # content hash -> size
+        self.deduplicated_bytes = 0               # size of the contents which were not written again
+        self.pending: dict[str, int] = {}         # content hash being written -> number of duplicates meanwhile
+        self.names: set[str] = set()              # paths which were written
+        self.lock = threading.RLock()
+
+
+    def __enter__(self) -> "BackupWriter":
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+    @abstractmethod
+    def exists(self, path:str) -> bool:
+        """ Check if the file was already written. """
+        raise NotImplementedError()
+
+
+    @abstractmethod
+    def write_text(self, path:str, content:str) -> None:
+        """ Write a (XML) document. """
+        raise NotImplementedError()
+
+
+    @abstractmethod
+    def write_stream(self, path:str, in_file) -> None:
+        """ Write the content of an opened (binary) file object. """
+        raise NotImplementedError()
+
+
+    def write_content_addressed(self, directory:str, open_content, content_hash:str|None = None) -> str:
+        """ Store a content as <directory>/<xx>/<sha1>, where open_content returns a (binary) file object.
+        Contents which were already written are skipped. Returns the SHA1 hash of the content. """
+        if content_hash is not None:
+            if self.__is_stored__(content_hash):
+                return content_hash
+            with open_content() as in_file:
+                self.__write_blob__(directory, content_hash, in_file)
+            return content_hash
+
+        # the path depends on the hash, so buffer the content while hashing it
+        sha1 = hashlib.sha1()
+        with open_content() as in_file, tempfile.SpooledTemporaryFile(SPOOL_SIZE) as spool:
+            while data := in_file.read(CHUNK_SIZE):
+                sha1.update(data)
+                spool.write(data)
+            content_hash = sha1.hexdigest()
+            if not self.__is_stored__(content_hash):
+                spool.seek(0)
+                self.__write_blob__(directory, content_hash, spool)
+        return content_hash
+
+
+    @contextmanager
+    def __claim_path__(self, path:str) -> Iterator[bool]:
+        """ Claim the path for writing, False (with a warning) if it was already written.
+        The claim is released if the write fails. """
+        with self.lock:
+            claimed = path not in self.names
+            self.names.add(path)
+        if not claimed:
+            logger.warning("%s was already written to the backup, skipping the second write", path)
+        try:
+            yield claimed
+        except BaseException:
+            if claimed:
+                with self.lock:
+                    self.names.discard(path)
+            raise
+
+
+    def __is_stored__(self, content_hash:str) -> bool:
+        with self.lock:
+            if content_hash in self.pending:
+                self.pending[content_hash] += 1  # being written, counted as deduplicated when its size is known
+                return True
+            if content_hash in self.content_index:
+                self.deduplicated_bytes += self.content_index[content_hash]
+                return True
+            self.pending[content_hash] = 0  # claimed, recorded in the index when written
+            return False
+
+
+    def __write_blob__(self, directory:str, content_hash:str, in_file) -> None:
+        blob_path = posixpath.join(directory, content_hash[0:2], content_hash)
+        try:
+            self.write_stream(blob_path, in_file)
+        except BaseException:
+            with self.lock:
+                self.pending.pop(content_hash, None)  # release the claim
+            raise
+        size = in_file.tell()
+        with self.lock:
+            self.content_index[content_hash] = size
+            self.deduplicated_bytes += size * self.pending.pop(content_hash)
+
+
+    def close(self) -> None:
+        """ Finish writing the backup. """
+
+
+class DirectoryWriter(BackupWriter):
+    """ Writes the backup as directory tree (used for debugging the backup contents). """
+
+    def __init__(self, root_dir:str) -> None:
+        super().__init__()
+        self.root_dir = root_dir
+
+
+    def __target__(self, path:str) -> str:
+        target = os.path.join(self.root_dir, *path.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        return target
+
+
+    @override
+    def exists(self, path:str) -> bool:
+        return os.path.exists(os.path.join(self.root_dir, *path.split("/")))
+
+
+    @override
+    def write_text(self, path:str, content:str) -> None:
+        with self.__claim_path__(path) as claimed:
+            if claimed:
+                with open(self.__target__(path), "w", encoding="utf-8") as f:
+                    f.write(content)
+
+
+    @override
+    def write_stream(self, path:str, in_file) -> None:
+        with self.__claim_path__(path) as claimed:
+            if claimed:
+                with open(self.__target__(path), "wb") as out_file:
+                    while data := in_file.read(CHUNK_SIZE):
+                        out_file.write(data)
+
+
+class ArchiveWriter(BackupWriter):
+    """ Streams the backup straight into the (.mbz) archive, without staging it on disk. """
+
+    def __init__(self, zip_path:str, compression:int = zipfile.ZIP_DEFLATED) -> None:
+        super().__init__()
+        self.archive = ZipStreamWriter(zip_path, compression)
+
+
+    @override
+    def exists(self, path:str) -> bool:
+        return path in self.names
+
+
+    @override
+    def write_text(self, path:str, content:str) -> None:
+        with self.lock, self.__claim_path__(path) as claimed:
+            if claimed:
+                self.archive.add_bytes(content, path)
+
+
+    @override
+    def write_stream(self, path:str, in_file) -> None:
+        with self.lock, self.__claim_path__(path) as claimed:
+            if claimed:
+                self.archive.add_stream(in_file, path)
+
+
+    @override
+    def close(self) -> None:
+        with self.lock:
+            self.archive.close()
@@ -0,0 +1,41 @@
+""" Placeholders ({{key}}) in the templates and slide decks of a course.
+
+All placeholders are replaced in one pass over the content, so the values are inserted as they are
+(a value containing {{other}} is not expanded again). Unknown placeholders are kept and reported.
+The values are scoped: the placeholders of the course are overridden by those of the topic and of the slide.
+"""
+import logging
+import re
+
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\{([^{}\n]+)\}\}')  # any key within a line, e.g. {{course name}}
+
+
+logger = logging.getLogger(__name__)
+
+
+def scoped_placeholders(*scopes: dict|None) -> dict[str, str]:
+    """ Merge the placeholder scopes (from course to slide), the later scopes take precedence. """
+    placeholders = {}
+    for scope in scopes:
+        if scope:
+            placeholders.update({str(key): str(value) for key, value in scope.items() if value is not None})
+    return placeholders
+
+
+def substitute_placeholders(content: str, placeholders: dict[str, str], source: str = "",
+                            unknown: set[str]|None = None) -> str:
+    """ Replace the placeholders in the content, warns once about each unknown placeholder
+    (pass the same unknown set when substituting a document in several parts). """
+    unknown = set() if unknown is None else unknown
+
+    def replace(match: re.Match) -> str:
+        key = match.group(1)
+        if key in placeholders:
+            return placeholders[key]
+        if key not in unknown:
+            unknown.add(key)
+            logger.warning("Unknown placeholder {{%s}} in %s is kept unchanged", key, source or "content")
+        return match.group(0)
+
+    return PLACEHOLDER_PATTERN.sub(replace, content)
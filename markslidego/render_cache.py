@@ -0,0 +1,212 @@
+""" Machine-wide, content-addressed cache of the rendered slide decks (PDF, HTML, PPTX).
+
+Many courses render the same catalog decks, which are byte-identical after preprocessing.
+The key of a rendered output is a hash over the final Marp input (the Markdown file and the contents of all
+referenced assets and of the themes Marp loads), the Marp options, the marp-cli version and the output format.
+On a hit the cached output is provided (reflinked or copied) instead of running Marp.
+The cache is enabled by setting its size limit RENDER_CACHE_SIZE (e.g. 2G, default 0 = disabled), the least recently
+used outputs are evicted. It lives in RENDER_CACHE_DIR (default ~/.cache/markslidego/renders).
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from collections.abc import Callable
+from markslidego.assets import file_hash, find_asset_links, reflink
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(size: str) -> int:
+    """ Parse a size like 500M or 2G (or a number of bytes). """
+    size = size.strip().upper().removesuffix("B")
+    if size and size[-1] in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+    return int(size or 0)
+
+
+def default_cache_dir() -> str:
+    """ The user's cache directory for the rendered outputs. """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "markslidego", "renders")
+
+
+def hash_existing_file(path: str) -> str|None:
+    """ SHA1 of the file content, None if the file doesn't exist. """
+    try:
+        return file_hash(path)
+    except OSError:
+        return None
+
+
+def content_key(source: str, target: str, values: dict, theme_files: list[str]|None = None,
+                hash_file: Callable[[str], str|None] = hash_existing_file) -> str:
+    """ Key of the target rendered from the Markdown source: the content of the source,
+    the contents of the assets it references and of the theme files Marp loads, and further values.
+    The location of the source doesn't matter, identical decks of several courses have the same key. """
+    with open(source, 'rb') as file:
+        content = file.read()
+    source_dir = os.path.dirname(os.path.abspath(source))
+    files = {link: os.path.join(source_dir, link) for link in find_asset_links(content.decode("utf-8"))}
+    for i, theme_file in enumerate(theme_files or []):
+        files[f"theme:{i}"] = theme_file  # only the contents, the location of the themes doesn't matter
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps({'version': CACHE_VERSION, 'format': os.path.splitext(target)[1].lower(),
+                              **values}, sort_keys=True, default=str).encode("utf-8"))
+    hasher.update(hashlib.sha256(content).digest())
+    for link, path in sorted(files.items()):
+        hasher.update(f"\n{link}:{hash_file(path)}".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+class RenderCache:
+    """ Content-addressed store of rendered outputs with size-bounded LRU eviction
+    (the modification time of an entry is its last use). """
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.hashes: dict[str, tuple[int, int, str]] = {}  # file path -> size, mtime_ns, sha1
+        self.size: int|None = None  # total size of the entries, determined on first store
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __hash_file__(self, path: str) -> str|None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            known = self.hashes.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = file_hash(path)
+        with self.lock:
+            self.hashes[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+
+    def key(self, source: str, target: str, values: dict, theme_files: list[str]|None = None) -> str:
+        """ Key of the target rendered from the Markdown source (see content_key). """
+        return content_key(source, target, values, theme_files, self.__hash_file__)
+
+
+    def entry(self, key: str, target: str) -> str:
+        """ Path of the cache entry of the key (with the extension of the target). """
+        return os.path.join(self.cache_dir, key[:2], key + os.path.splitext(target)[1].lower())
+
+
+    def fetch(self, key: str, target: str) -> bool:
+        """ Provide the cached output at the target path, returns False if it is not cached. """
+        entry = self.entry(key, target)
+        try:
+            os.utime(entry)  # mark as recently used
+            if os.path.lexists(target):
+                os.remove(target)
+            # reflink or copy, but never hardlink: outputs are overwritten in place (e.g. when rendered again)
+            if not reflink(entry, target):
+                shutil.copyfile(entry, target)
+            os.utime(target)  # the output is new
+        except OSError:  # not cached, or evicted meanwhile
+            with self.lock:
+                self.misses += 1
+            return False
+        with self.lock:
+            self.hits += 1
+        return True
+
+
+    def store(self, key: str, target: str) -> None:
+        """ Add the rendered target to the cache (atomically), then evict the least recently used entries. """
+        entry = self.entry(key, target)
+        tmp_file = f"{entry}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            if not reflink(target, tmp_file):
+                shutil.copyfile(target, tmp_file)
+            os.replace(tmp_file, entry)
+            size = os.path.getsize(entry)
+        except OSError as e:
+            logger.warning("Could not add %s to the render cache: %s", target, e)
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            return
+        with self.lock:
+            self.size = self.__scan__() if self.size is None else self.size + size
+            if self.size > self.max_bytes:
+                self.__evict__()
+
+
+    def __entries__(self) -> list[tuple[float, int, str]]:
+        """ The cached outputs as (last use, size, path). """
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith(".tmp"):
+                    continue  # being stored
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # evicted by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+
+    def __scan__(self) -> int:
+        return sum(size for _, size, _ in self.__entries__())
+
+
+    def __evict__(self) -> None:
+        """ Remove the least recently used entries, until the cache is below 90% of its size limit
+        (so not every store evicts again). """
+        entries = sorted(self.__entries__())
+        self.size = sum(size for _, size, _ in entries)
+        limit = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self.size <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+        logger.debug("Render cache evicted to %d bytes", self.size)
+
+
+    def report(self) -> str:
+        """ Summary of the cache use (of this process). """
+        return f"Render cache: {self.hits} hits, {self.misses} misses ({self.cache_dir})"
+
+
+_render_cache: RenderCache|None = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> RenderCache|None:
+    """ Return the (shared) render cache, None if it is disabled (RENDER_CACHE_SIZE unset or 0). """
+    global _render_cache  # pylint: disable=global-statement
+    with _render_cache_lock:
+        max_bytes = parse_size(os.getenv('RENDER_CACHE_SIZE', '0'))
+        if max_bytes <= 0:
+            return None
+        cache_dir = os.getenv('RENDER_CACHE_DIR') or default_cache_dir()
+        if _render_cache is None or _render_cache.cache_dir != os.path.abspath(cache_dir):
+            _render_cache = RenderCache(cache_dir, max_bytes)
+        _render_cache.max_bytes = max_bytes
+        return _render_cache
+
+
+def render_cache_report() -> str:
+    """ Summary of the render cache use (of this process). """
+    render_cache = get_render_cache()
+    return render_cache.report() if render_cache is not None else "Render cache: disabled"
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import sys
+import zipfile
+from pathlib import Path
+import pytest
+
+# Ensure repository root is on sys.path so tests can import the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from markslidego.archive import ZipStreamWriter, get_index, update_archive
+from markslidego.moodle.file import MoodleFile
+from markslidego.moodle.writer import DirectoryWriter
+
+
+@pytest.fixture(autouse=True)
+def use_tmp_cwd(tmp_path):
+    """Change working directory to a temporary path for each test."""
+    old_cwd = os.getcwd()
+    os.chdir(tmp_path)
+    yield tmp_path
+    os.chdir(old_cwd)
+
+
+def create_scorm_zip(tmp_path):
+    (tmp_path / "deck").mkdir()
+    (tmp_path / "deck" / "image.png").write_bytes(b"\x89PNG" + b"x" * 100000)
+    (tmp_path / "deck.html").write_text("<html>slides</html>", encoding="utf-8")
+    zip_path = tmp_path / "deck.zip"
+    with ZipStreamWriter(str(zip_path)) as writer:
+        writer.add_file(str(tmp_path / "deck.html"), "deck.html")
+        writer.add_bytes("<manifest></manifest>", "imsmanifest.xml")
+        writer.add_file(str(tmp_path / "deck" / "image.png"), "deck/image.png")
+    return zip_path, writer.entries
+
+
+def test_index_matches_archive_contents(tmp_path):
+    zip_path, entries = create_scorm_zip(tmp_path)
+    assert [e.name for e in entries] == ["deck.html", "imsmanifest.xml", "deck/image.png"]
+    with zipfile.ZipFile(zip_path) as zipf:
+        for entry in entries:
+            data = zipf.read(entry.name)
+            assert entry.size == len(data)
+            assert entry.sha1 == hashlib.sha1(data).hexdigest()
+    assert get_index(str(zip_path)) == entries
+
+
+def test_index_is_dropped_when_archive_changes(tmp_path):
+    zip_path, _ = create_scorm_zip(tmp_path)
+    with zipfile.ZipFile(zip_path, 'a') as zipf:
+        zipf.writestr("other.txt", "changed")
+    assert get_index(str(zip_path)) is None
+
+
+def test_unzip_and_add_uses_index_without_extracting(tmp_path):
+    zip_path, entries = create_scorm_zip(tmp_path)
+    files = MoodleFile.unzip_and_add(str(zip_path))
+
+    assert not (tmp_path / "deck_unzipped").exists()
+    assert [f.content_hash for f in files[:-1]] == [e.sha1 for e in entries]
+    assert files[-1].filename == "deck.zip"
+    image = next(f for f in files if f.filename == "image.png")
+    assert image.subdir == "/deck"
+    assert image.filesize == 100004
+    manifest = next(f for f in files if f.filename == "imsmanifest.xml")
+    assert 'manifest.identifier' in manifest.content_dict
+
+    # the file contents are streamed from the archive
+    with image.open() as f:
+        assert f.read() == (tmp_path / "deck" / "image.png").read_bytes()
+
+
+def test_unzip_and_add_hashes_foreign_archive_while_storing(tmp_path):
+    zip_path, entries = create_scorm_zip(tmp_path)
+    # an archive not written by this build has no index
+    foreign_path = tmp_path / "foreign.zip"
+    with zipfile.ZipFile(zip_path) as src, zipfile.ZipFile(foreign_path, 'w') as dst:
+        for info in src.infolist():
+            dst.writestr(info, src.read(info))
+    files = MoodleFile.unzip_and_add(str(foreign_path))
+    assert not (tmp_path / "foreign_unzipped").exists()
+
+    with DirectoryWriter(str(tmp_path / "backup")) as writer:
+        for f in files:
+            f.generate(writer, "files")
+    for f, entry in zip(files, entries):
+        assert f.content_hash == entry.sha1
+        assert (tmp_path / "backup" / "files" / entry.sha1[0:2] / entry.sha1).exists()
+
+
+def test_update_archive_reuses_unchanged_members(tmp_path):
+    (tmp_path / "deck.pdf").write_bytes(b"%PDF" + b"x" * 10000)
+    (tmp_path / "deck.md").write_text("# Deck\n" * 1000, encoding="utf-8")
+    files = [(str(tmp_path / "deck.pdf"), "T1/deck.pdf"), (str(tmp_path / "deck.md"), "T1/deck.md")]
+    zip_path = str(tmp_path / "course.zip")
+    assert update_archive(zip_path, files) == (0, 2)
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.getinfo("T1/deck.pdf").compress_type == zipfile.ZIP_STORED
+        assert zipf.getinfo("T1/deck.md").compress_type == zipfile.ZIP_DEFLATED
+
+    (tmp_path / "deck.md").write_text("# Changed\n" * 1000, encoding="utf-8")
+    assert update_archive(zip_path, files) == (1, 1)
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.testzip() is None
+        assert zipf.read("T1/deck.pdf") == (tmp_path / "deck.pdf").read_bytes()
+        assert zipf.read("T1/deck.md") == (tmp_path / "deck.md").read_bytes()
+    assert [e.name for e in get_index(zip_path)] == ["T1/deck.pdf", "T1/deck.md"]
+
+
+def test_update_archive_without_zipfile_internals_compresses_again(tmp_path, monkeypatch):
+    monkeypatch.setattr("markslidego.archive.RAW_ZIPFILE_NAMES", ("_FH_REMOVED_IN_A_NEWER_PYTHON",))
+    (tmp_path / "deck.pdf").write_bytes(b"%PDF" + b"x" * 10000)
+    (tmp_path / "deck.md").write_text("# Deck\n" * 1000, encoding="utf-8")
+    files = [(str(tmp_path / "deck.pdf"), "T1/deck.pdf"), (str(tmp_path / "deck.md"), "T1/deck.md")]
+    zip_path = str(tmp_path / "course.zip")
+    assert update_archive(zip_path, files) == (0, 2)
+
+    (tmp_path / "deck.md").write_text("# Changed\n" * 1000, encoding="utf-8")
+    assert update_archive(zip_path, files) == (1, 1)
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.testzip() is None
+        assert zipf.getinfo("T1/deck.pdf").compress_type == zipfile.ZIP_STORED
+        assert zipf.getinfo("T1/deck.md").compress_type == zipfile.ZIP_DEFLATED
+        assert zipf.read("T1/deck.pdf") == (tmp_path / "deck.pdf").read_bytes()
+        assert zipf.read("T1/deck.md") == (tmp_path / "deck.md").read_bytes()
+
+
+def test_failed_update_keeps_the_archive_and_leaves_no_tmp_file(tmp_path):
+    (tmp_path / "deck.md").write_text("# Deck\n", encoding="utf-8")
+    zip_path = str(tmp_path / "course.zip")
+    update_archive(zip_path, [(str(tmp_path / "deck.md"), "deck.md")])
+    with pytest.raises(FileNotFoundError):
+        update_archive(zip_path, [(str(tmp_path / "deck.md"), "deck.md"), (str(tmp_path / "missing.md"), "missing.md")])
+    assert not os.path.exists(zip_path + ".tmp")
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.namelist() == ["deck.md"]
+
+
+def test_add_files_compresses_in_parallel_and_keeps_order(tmp_path):
+    files = []
+    for i in range(20):
+        path = tmp_path / (f"page{i}.html" if i % 2 else f"page{i}.png")
+        path.write_bytes((f"<p>page {i}</p>" * 5000).encode("utf-8"))
+        files.append((str(path), f"pages/{path.name}"))
+    zip_path = tmp_path / "pages.zip"
+    with ZipStreamWriter(str(zip_path)) as writer:
+        writer.add_files(files, jobs=4)
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.testzip() is None
+        assert [info.filename for info in zipf.infolist()] == [arcname for _, arcname in files]
+        assert [info.compress_type for info in zipf.infolist()][:2] == [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]
+        for (path, arcname), entry in zip(files, writer.entries):
+            assert zipf.read(arcname) == Path(path).read_bytes()
+            assert entry.sha1 == hashlib.sha1(Path(path).read_bytes()).hexdigest()
@@ -0,0 +1,64 @@
+import os
+import sys
+from pathlib import Path
+
+# Ensure repository root is on sys.path so tests can import the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from markslidego.assets import find_asset_links, materialize_asset, materialize_tree, rewrite_asset_links
+
+
+DECK = """---
+marp: true
+backgroundImage: url('images/bg.jpg')
+---
+![bg left:40%](images/photo.png)
+![Diagram](images/diagram.svg "Architecture")
+<img src="images/logo.png" width="100">
+See [the docs](https://example.org/docs.png), [above](#intro) and [mail](mailto:a@b.c).
+Again: ![](images/photo.png)
+"""
+
+
+def test_find_asset_links_covers_markdown_html_and_css():
+    assert find_asset_links(DECK) == ["images/bg.jpg", "images/photo.png", "images/diagram.svg", "images/logo.png"]
+
+
+def test_find_asset_links_with_spaces_and_titles():
+    assert find_asset_links('![x](my images/a b.png)') == ["my images/a b.png"]
+    assert find_asset_links('![x](my images/a b.png "A title")') == ["my images/a b.png"]
+    assert find_asset_links('[doc]( docs/read me.pdf )') == ["docs/read me.pdf"]
+    content = rewrite_asset_links('![x](my images/a b.png "A title")', lambda link: "assets/a b.png")
+    assert content == '![x](assets/a b.png "A title")'
+
+
+def test_rewrite_calls_once_per_unique_asset():
+    calls = []
+    def rewrite(link):
+        calls.append(link)
+        return None if link.endswith(".svg") else "assets/" + link.split("/")[-1]
+
+    content = rewrite_asset_links(DECK, rewrite)
+    assert calls == ["images/bg.jpg", "images/photo.png", "images/diagram.svg", "images/logo.png"]
+    assert "url('assets/bg.jpg')" in content
+    assert content.count("(assets/photo.png)") == 2
+    assert '![Diagram](images/diagram.svg "Architecture")' in content  # unchanged (None)
+    assert '<img src="assets/logo.png" width="100">' in content
+    assert "(https://example.org/docs.png)" in content and "(#intro)" in content
+
+
+def test_materialize_skips_up_to_date_and_never_writes_through_links(tmp_path):
+    (tmp_path / "src" / "img").mkdir(parents=True)
+    (tmp_path / "src" / "img" / "a.png").write_bytes(b"a" * 100)
+    (tmp_path / "other.png").write_bytes(b"b" * 50)
+
+    materialize_tree(str(tmp_path / "src"), str(tmp_path / "out"))
+    target = tmp_path / "out" / "img" / "a.png"
+    assert target.read_bytes() == b"a" * 100
+    mtime = os.stat(target).st_mtime_ns
+    materialize_asset(str(tmp_path / "src" / "img" / "a.png"), str(target))
+    assert os.stat(target).st_mtime_ns == mtime
+
+    # replacing the target with another asset must not change the (possibly linked) source
+    materialize_asset(str(tmp_path / "other.png"), str(target))
+    assert target.read_bytes() == b"b" * 50
+    assert (tmp_path / "src" / "img" / "a.png").read_bytes() == b"a" * 100
@@ -0,0 +1,71 @@
+import os
+import sys
+from pathlib import Path
+import pytest
+
+# Ensure repository root is on sys.path so tests can import the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from markslidego.build_cache import BuildCache, referenced_assets
+
+
+@pytest.fixture(autouse=True)
+def use_tmp_cwd(tmp_path):
+    """Change working directory to a temporary path for each test."""
+    old_cwd = os.getcwd()
+    os.chdir(tmp_path)
+    yield tmp_path
+    os.chdir(old_cwd)
+
+
+def create_deck(tmp_path):
+    (tmp_path / "deck").mkdir()
+    (tmp_path / "deck" / "image.png").write_bytes(b"\x89PNG dummy")
+    deck = tmp_path / "deck.md"
+    deck.write_text("# Slide\n![bg](deck/image.png)\n[Web](https://example.org/x.png)\n", encoding="utf-8")
+    return deck
+
+
+def test_referenced_assets_only_local_existing_files(tmp_path):
+    deck = create_deck(tmp_path)
+    assets = referenced_assets(deck.read_text(encoding="utf-8"), str(tmp_path))
+    assert assets == [os.path.join(str(tmp_path), "deck/image.png")]
+
+
+def test_key_ignores_touched_files_but_detects_changes(tmp_path):
+    deck = create_deck(tmp_path)
+    image = tmp_path / "deck" / "image.png"
+    cache = BuildCache("output/.msgo-cache.json")
+    key = cache.key([str(deck), str(image)], {'options': ['--scorm']})
+
+    # only the modification time changes (e.g. git checkout)
+    os.utime(deck, ns=(deck.stat().st_atime_ns, deck.stat().st_mtime_ns + 10**9))
+    assert cache.key([str(deck), str(image)], {'options': ['--scorm']}) == key
+
+    # changed options and changed asset contents result in new keys
+    assert cache.key([str(deck), str(image)], {'options': []}) != key
+    image.write_bytes(b"\x89PNG changed")
+    assert cache.key([str(deck), str(image)], {'options': ['--scorm']}) != key
+
+
+def test_is_up_to_date_is_persisted(tmp_path):
+    deck = create_deck(tmp_path)
+    target = tmp_path / "output" / "deck.pdf"
+    cache = BuildCache("output/.msgo-cache.json")
+    key = cache.key([str(deck)])
+    assert not cache.is_up_to_date(str(target), key)
+
+    target.parent.mkdir(exist_ok=True)
+    target.write_bytes(b"%PDF-1.4\n")
+    cache.update(str(target), key)
+    # recorded outputs are saved in batches, and at the end of the build
+    assert not (tmp_path / "output" / ".msgo-cache.json").exists()
+    cache.flush()
+    assert (tmp_path / "output" / ".msgo-cache.json").exists()
+
+    reloaded = BuildCache("output/.msgo-cache.json")
+    assert reloaded.is_up_to_date(str(target), key)
+    assert not reloaded.is_up_to_date(str(target), "another-key")
+
+    # a deleted output is always rebuilt
+    target.unlink()
+    assert not reloaded.is_up_to_date(str(target), key)
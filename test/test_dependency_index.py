@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Ensure repository root is on sys.path so tests can import the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from markslidego.dependency_index import INDEX_FILE, DependencyIndex
+
+
+COURSE = """course-title: Course
+course: c1
+program: BIF
+version: "1.0"
+topics:
+  - name: T1
+    slides:
+      - title: Intro
+        source: prog/intro.md
+        target: intro.pdf
+      - title: All
+        sources:
+          - prog/intro.md
+          - prog/more.md
+        target: all.pdf
+"""
+
+
+def create_repository(root):
+    (root / "catalogs" / "prog").mkdir(parents=True)
+    (root / "catalogs" / "prog" / "intro.md").write_text("# Intro\n![](pic.png)\n", encoding="utf-8")
+    (root / "catalogs" / "prog" / "more.md").write_text("# More\n", encoding="utf-8")
+    (root / "catalogs" / "prog" / "pic.png").write_bytes(b"png")
+    (root / "courses" / "c1" / "_template").mkdir(parents=True)
+    (root / "courses" / "c1" / "c1.yml").write_text(COURSE, encoding="utf-8")
+    (root / "courses" / "m1" / "Class-1").mkdir(parents=True)
+    (root / "courses" / "m1" / "Class-1" / "deck.md").write_text("---\nmarp: true\n---\n![](deck/pic.png)\n", encoding="utf-8")
+    (root / "courses" / "m1" / "Class-1" / "deck").mkdir()
+    (root / "courses" / "m1" / "Class-1" / "deck" / "pic.png").write_bytes(b"png")
+
+
+def test_index_maps_files_to_outputs(tmp_path):
+    create_repository(tmp_path)
+    index = DependencyIndex(str(tmp_path))
+    index.update()
+    assert (tmp_path / INDEX_FILE).exists()
+
+    c1, m1 = "courses/c1/c1.yml", "courses/m1"
+    assert index.affected(["catalogs/prog/more.md"]) == {(c1, "T1", "all.md")}
+    assert index.affected(["catalogs/prog/pic.png"]) == {(c1, "T1", "intro.md"), (c1, "T1", "all.md")}
+    assert index.affected(["courses/m1/Class-1/deck/pic.png"]) == {(m1, "Class-1", "deck.md")}
+    assert index.affected(["courses/c1/_template/fhtw.css"]) == {(c1, "T1", "intro.md"), (c1, "T1", "all.md")}
+    assert index.affected(["README.md"]) == set()
+
+    # the persisted index answers without parsing, and only changed files are parsed again
+    (tmp_path / "catalogs" / "prog" / "more.md").write_text("# More\n![](more.png)\n", encoding="utf-8")
+    (tmp_path / "catalogs" / "prog" / "more.png").write_bytes(b"png")
+    index = DependencyIndex(str(tmp_path))
+    assert index.affected(["catalogs/prog/more.png"]) == set()
+    index.update()
+    assert index.affected(["catalogs/prog/more.png"]) == {(c1, "T1", "all.md")}
+
+
+def test_index_is_usable_without_marp_setup(tmp_path):
+    # the generation modules exit at import without NPX_CMD/MARKSLIDE_DIR, the index must not depend on them
+    env = {k: v for k, v in os.environ.items() if k not in ("NPX_CMD", "MARKSLIDE_DIR")}
+    result = subprocess.run([sys.executable, "-c", "import markslidego.dependency_index, sys; "
+                             "sys.exit('markslidego.generate' in sys.modules)"],
+                            cwd=str(tmp_path), env={**env, "PYTHONPATH": str(Path(__file__).resolve().parent.parent)},
+                            capture_output=True, text=True, check=False)
+    assert result.returncode == 0, result.stderr
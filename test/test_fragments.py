@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+import fitz
+
+# Ensure repository root is on sys.path so tests can import the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from markslidego.build_cache import get_build_cache
+from markslidego.fragments import assemble_pdf, fragment_pdf, read_manifest, write_keys, write_manifest
+
+
+def create_fragment(path, headings):
+    path.write_text("---\nmarp: true\n---\n", encoding="utf-8")
+    with fitz.open() as doc:
+        for heading in headings:
+            doc.new_page().insert_text((72, 72), heading)
+        doc.set_toc([[1, heading, page] for page, heading in enumerate(headings, start=1)])
+        doc.save(fragment_pdf(str(path)))
+
+
+def test_fragments_are_assembled_with_outlines(tmp_path):
+    fragments = [tmp_path / "000.md", tmp_path / "001.md", tmp_path / "002.md"]
+    create_fragment(fragments[0], ["Compilation", "Table of Contents"])
+    create_fragment(fragments[1], ["Intro", "Slide A"])
+    create_fragment(fragments[2], ["More"])
+    manifest = tmp_path / "fragments.json"
+    write_manifest(str(manifest), [str(f) for f in fragments])
+    assert read_manifest(str(manifest)) == [str(f) for f in fragments]
+    cache = get_build_cache(str(tmp_path / ".msgo-cache.json"))
+    keys = ["key0", "key1", "key2"]
+    write_keys(str(manifest), cache.cache_file, keys)
+    for fragment, key in zip(fragments, keys):
+        cache.update(fragment_pdf(str(fragment)), key)
+
+    target = tmp_path / "all.pdf"
+    assert assemble_pdf(str(manifest), str(target))
+    with fitz.open(target) as doc:
+        assert doc.page_count == 5
+        assert [(title, page) for _, title, page in doc.get_toc()] == \
+            [("Compilation", 1), ("Table of Contents", 2), ("Intro", 3), ("Slide A", 4), ("More", 5)]
+        assert doc[4].get_label() == "5"
+
+    # a fragment whose deck changed after rendering (its key isn't the rendered one) is not assembled
+    write_keys(str(manifest), cache.cache_file, ["key0", "changed", "key2"])
+    assert not assemble_pdf(str(manifest), str(target))
@@ -0,0 +1,76 @@
+import os
+import sys
+from pathlib import Path
+
+# Ensure repository root is on sys.path so tests can import the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from markslidego.dependency_index import DependencyIndex
+from markslidego.generate_affected import affected_outputs
+
+
+COURSE = """course-title: Course
+course: {name}
+program: BIF
+version: "1.0"
+topics:
+  - name: T1
+    slides:
+      - title: Intro
+        source: prog/{source}
+        target: intro.pdf
+"""
+
+
+def test_affected_outputs_across_courses(tmp_path):
+    (tmp_path / "catalogs" / "prog").mkdir(parents=True)
+    (tmp_path / "catalogs" / "prog" / "intro.md").write_text("# Intro\n![](pic.png)\n", encoding="utf-8")
+    (tmp_path / "catalogs" / "prog" / "more.md").write_text("# More\n", encoding="utf-8")
+    (tmp_path / "catalogs" / "prog" / "pic.png").write_bytes(b"png")
+    for name, source in (("c1", "intro.md"), ("c2", "intro.md"), ("c3", "more.md")):
+        (tmp_path / "courses" / name).mkdir(parents=True)
+        (tmp_path / "courses" / name / f"{name}.yml").write_text(COURSE.format(name=name, source=source),
+                                                                 encoding="utf-8")
+
+    # without an index (e.g. in a fresh clone) it is built first
+    picture = str(tmp_path / "catalogs" / "prog" / "pic.png")
+    assert affected_outputs(DependencyIndex(str(tmp_path)), [picture]) == {
+        ("courses/c1/c1.yml", "T1", "intro.md"), ("courses/c2/c2.yml", "T1", "intro.md")}
+
+    # an image which is not referenced anymore still affects the outputs which used it
+    (tmp_path / "catalogs" / "prog" / "intro.md").write_text("# Intro\n", encoding="utf-8")
+    os.remove(picture)
+    changed = [picture, str(tmp_path / "catalogs" / "prog" / "intro.md")]
+    assert affected_outputs(DependencyIndex(str(tmp_path)), changed) == {
+        ("courses/c1/c1.yml", "T1", "intro.md"), ("courses/c2/c2.yml", "T1", "intro.md")}
+    assert affected_outputs(DependencyIndex(str(tmp_path)), [picture]) == set()
+
+
+def test_affected_decks_of_a_course_are_prepared_together(tmp_path, monkeypatch):
+    from markslidego import generate_affected, generate_course
+    (tmp_path / "catalogs" / "prog").mkdir(parents=True)
+    (tmp_path / "catalogs" / "prog" / "intro.md").write_text("# Intro\n", encoding="utf-8")
+    (tmp_path / "courses" / "c1").mkdir(parents=True)
+    (tmp_path / "courses" / "c1" / "c1.yml").write_text(COURSE.format(name="c1", source="intro.md") + """\
+      - title: Again
+        source: prog/intro.md
+        target: again.pdf
+  - name: T2
+    slides:
+      - title: Other
+        source: prog/intro.md
+        target: other.pdf
+""", encoding="utf-8")
+
+    loads = []
+    prepare_course = generate_affected.prepare_course
+    monkeypatch.setattr(generate_affected, "prepare_course",
+                        lambda yaml_file, *args, **kwargs: loads.append(yaml_file) or prepare_course(yaml_file, *args, **kwargs))
+    prepared = []
+    monkeypatch.setattr(generate_course, "prepare_course_topic",
+                        lambda name, *args: prepared.append((name, sorted(args[4]))) or [])
+    monkeypatch.setattr(generate_affected, "render_deduplicated", lambda render_jobs, jobs: len(render_jobs))
+    monkeypatch.setattr(generate_affected, "package_course", lambda yaml_file: None)
+
+    generate_affected.generate_affected([str(tmp_path / "catalogs" / "prog" / "intro.md")], 2, str(tmp_path))
+    assert loads == [str(tmp_path / "courses" / "c1" / "c1.yml")]
+    assert prepared == [("T1", ["again.md", "intro.md"]), ("T2", ["other.md"])]
@@ -0,0 +1,69 @@
+import os
+import sys
+from pathlib import Path
+import pytest
+
+# Ensure repository root is on sys.path so tests can import the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from markslidego.courses import resolve_course
+from markslidego.generate_batch import render_deduplicated, split_jobs
+
+
+@pytest.fixture(autouse=True)
+def use_tmp_cwd(tmp_path):
+    """Change working directory to a temporary path for each test."""
+    old_cwd = os.getcwd()
+    os.chdir(tmp_path)
+    yield tmp_path
+    os.chdir(old_cwd)
+
+
+def test_resolve_course_arguments(tmp_path):
+    (tmp_path / "courses" / "swen1").mkdir(parents=True)
+    (tmp_path / "courses" / "swen1" / "swen1.yml").write_text("topics: []\n", encoding="utf-8")
+    (tmp_path / "courses" / "moodle1").mkdir()
+    (tmp_path / "courses" / "_template").mkdir()
+    (tmp_path / "courses" / "README.md").write_text("# Courses\n", encoding="utf-8")
+
+    yaml_file = os.path.join("courses", "swen1", "swen1.yml")
+    assert resolve_course("swen1") == ("yaml", yaml_file)
+    assert resolve_course("courses/swen1") == ("yaml", yaml_file)
+    assert resolve_course(yaml_file) == ("yaml", yaml_file)
+    assert resolve_course("courses/moodle1") == ("moodle", "courses/moodle1")
+    assert resolve_course("courses/_template") is None
+    assert resolve_course("courses/README.md") is None
+
+
+def test_jobs_are_split_between_renders_and_moodle_backups():
+    assert split_jobs(8, 0) == (8, 0, 0)
+    assert split_jobs(8, 3) == (4, 3, 1)     # at most 4 + 3 * 1 renders at once
+    assert split_jobs(8, 1) == (4, 1, 4)
+    assert split_jobs(8, 2, renders=False) == (1, 2, 4)  # all jobs for the backups
+    assert split_jobs(1, 2) == (1, 1, 1)
+
+
+def test_deck_shared_by_two_courses_is_rendered_once(tmp_path, monkeypatch):
+    monkeypatch.delenv("RENDER_CACHE_SIZE", raising=False)
+    rendered = []
+    def fake_run_marp(source, targets):
+        rendered.append(source)
+        for target in targets:
+            Path(target).write_text(f"rendered {source}", encoding="utf-8")
+        return targets
+    monkeypatch.setattr("markslidego.generate.run_marp", fake_run_marp)
+
+    render_jobs = []
+    for course, topic in (("swen1", "Intro"), ("swen2", "Basics")):  # the topics of the deck are named differently
+        topic_dir = tmp_path / course / "output" / topic
+        topic_dir.mkdir(parents=True)
+        (topic_dir / "img").mkdir()
+        (topic_dir / "img" / "logo.png").write_bytes(b"PNG")
+        source = topic_dir / f"{topic}.md"
+        source.write_text("# Git\n\n![logo](img/logo.png)\n", encoding="utf-8")
+        render_jobs.append((str(source), str(topic_dir / f"{topic}.pdf"), None, f"key-{course}",
+                            str(tmp_path / course / "output")))
+
+    assert render_deduplicated(render_jobs) == 2
+    assert len(rendered) == 1
+    for _, target, _, _, _ in render_jobs:
+        assert os.path.exists(target)
@@ -0,0 +1,119 @@
+import os
+import sys
+from pathlib import Path
+
+# Ensure repository root is on sys.path so tests can import the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import zipfile
+from markslidego.generate_course import get_template, package_course, preprocess, preprocess_multiple
+from markslidego.fragments import read_manifest
+from markslidego.placeholders import scoped_placeholders, substitute_placeholders
+
+
+TEMPLATE = """---
+marp: true
+---
+# {{title}}
+![bg](images/bg.jpg)
+
+---
+"""
+
+DECK = """---
+marp: true
+---
+# Intro
+
+---
+## Slide
+"""
+
+
+def test_template_is_read_once_and_assets_are_shared(tmp_path):
+    template_dir = tmp_path / "_template"
+    (template_dir / "images").mkdir(parents=True)
+    (template_dir / "template.md").write_text(TEMPLATE, encoding="utf-8")
+    (template_dir / "images" / "bg.jpg").write_bytes(b"jpg")
+    (tmp_path / "deck.md").write_text(DECK, encoding="utf-8")
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    for name in ["one", "two"]:
+        assert preprocess(str(tmp_path / "deck.md"), str(output_dir / f"{name}.md"), {'title': name}, str(template_dir))
+        content = (output_dir / f"{name}.md").read_text(encoding="utf-8")
+        assert f"# {name}\n![bg](_template/bg.jpg)" in content
+        assert not (output_dir / name / "bg.jpg").exists()
+    assert (output_dir / "_template" / "bg.jpg").read_bytes() == b"jpg"
+    assert get_template(str(template_dir)) is get_template(str(template_dir))
+
+    # an edited template asset is provided again, even though template.md is unchanged
+    (template_dir / "images" / "bg.jpg.new").write_bytes(b"new jpg")
+    os.replace(template_dir / "images" / "bg.jpg.new", template_dir / "images" / "bg.jpg")
+    assert preprocess(str(tmp_path / "deck.md"), str(output_dir / "one.md"), {'title': "one"}, str(template_dir))
+    assert (output_dir / "_template" / "bg.jpg").read_bytes() == b"new jpg"
+
+    # a changed template is read again
+    template = get_template(str(template_dir))
+    (template_dir / "template.md").write_text(TEMPLATE + "changed\n", encoding="utf-8")
+    os.utime(template_dir / "template.md", ns=(0, os.stat(template_dir / "template.md").st_mtime_ns + 1_000_000))
+    assert get_template(str(template_dir)) is not template
+
+
+def test_placeholders_are_substituted_in_one_pass(caplog):
+    placeholders = scoped_placeholders({'course': "SWEN1", 'version': 1.0, 'note': "{{course}}"},
+                                       {'course': "SWEN1-T1"}, {'title': "Intro"})
+    content = substitute_placeholders("{{title}} {{course}} {{version}} {{note}} {{unknown}} {{unknown}}", placeholders)
+    assert content == "Intro SWEN1-T1 1.0 {{course}} {{unknown}} {{unknown}}"
+    assert caplog.text.count("Unknown placeholder {{unknown}}") == 1
+
+
+def test_placeholder_keys_may_contain_spaces_and_punctuation(caplog):
+    placeholders = {'course name': "Software Engineering", 'date/time': "Monday, 10:00", 'lecturer:': "Ada"}
+    content = substitute_placeholders("{{course name}} ({{date/time}}) {{lecturer:}} {{room (main)}}", placeholders)
+    assert content == "Software Engineering (Monday, 10:00) Ada {{room (main)}}"
+    assert "Unknown placeholder {{room (main)}}" in caplog.text
+
+
+def test_preprocess_multiple_merges_sources_without_front_matter(tmp_path):
+    template_dir = tmp_path / "_template"
+    template_dir.mkdir()
+    (template_dir / "template.md").write_text(TEMPLATE, encoding="utf-8")
+    (tmp_path / "first.md").write_text("---\ntitle: First\n---\n# Title\n\n---\n## One {{title}}\n", encoding="utf-8")
+    (tmp_path / "plain.md").write_text("# No front matter\n\n---\n# Title\n\n---\n## Two\n", encoding="utf-8")
+    (tmp_path / "second.md").write_text("---\ntitle: Second\n---\n# Title\n\n---\n## Three\n", encoding="utf-8")
+
+    target = tmp_path / "output" / "all.md"
+    target.parent.mkdir()
+    sources = [str(tmp_path / name) for name in ["first.md", "plain.md", "second.md"]]
+    assert preprocess_multiple(sources, str(target), {'title': "All"}, str(template_dir))
+    slides = target.read_text(encoding="utf-8").split("\n---\n")
+    assert "* First\n* Second\n" in slides[2]
+    assert slides[3].strip().endswith("# First") and slides[4] == "## One All\n"
+    assert slides[5] == "## Two\n"
+    assert slides[6].strip().endswith("# Second") and slides[7] == "## Three\n"
+
+    # with fragments, the title and each source are decks of their own
+    assert preprocess_multiple(sources, str(target), {'title': "All"}, str(template_dir), fragments=True)
+    fragments = read_manifest(str(tmp_path / "output" / ".fragments" / "all" / "fragments.json"))
+    assert [os.path.basename(f) for f in fragments] == ["000.md", "001.md", "002.md", "003.md"]
+    assert Path(fragments[1]).read_text(encoding="utf-8").startswith("---\nmarp: true\n---\n\n<!--")
+    assert Path(fragments[2]).read_text(encoding="utf-8") == "---\nmarp: true\n---\n## Two\n"
+
+    # nothing is written if a source is missing
+    assert not preprocess_multiple(sources + [str(tmp_path / "missing.md")], str(tmp_path / "output" / "none.md"),
+                                   {}, str(template_dir))
+    assert not (tmp_path / "output" / "none.md").exists()
+
+
+def test_course_zip_excludes_build_internals(tmp_path):
+    output_dir = tmp_path / "c1" / "output"
+    (output_dir / "T1" / ".fragments" / "all").mkdir(parents=True)
+    (output_dir / "T1" / "intro.pdf").write_bytes(b"%PDF")
+    (output_dir / "T1" / ".fragments" / "all" / "000.md").write_text("# Part", encoding="utf-8")
+    (output_dir / ".msgo-cache.json").write_text("{}", encoding="utf-8")
+    (output_dir / "T1.zip").write_bytes(b"")
+    (tmp_path / "c1" / "c1.yml").write_text("", encoding="utf-8")
+
+    package_course(str(tmp_path / "c1" / "c1.yml"))
+    with zipfile.ZipFile(output_dir / "c1.zip") as zipf:
+        assert zipf.namelist() == ["T1/intro.pdf"]
@@ -1,3 +1,4 @@
+import io
 import os
 import shutil
 import zipfile
@@ -143,6 +144,177 @@ def test_all_creates_full_mbz(tmp_path):
     assert zipfile.is_zipfile(out)
 
 
+def test_mbz_is_streamed_without_directory(tmp_path):
+    create_dummy_pdf(tmp_path / "test" / "java-kickstart.pdf")
+    generator = MoodleBackup("Stream", "Streamed Course", 16204)
+    pdf_file = MoodleFile(str(tmp_path / "test" / "java-kickstart.pdf"))
+    generator.files.append(pdf_file)
+    pdf_activity = MoodleActivity("java-kickstart", "Java (PDF)")
+    pdf_activity.files.append(pdf_file)
+    generator.activities.append(pdf_activity)
+
+    generator.generate_mbz("streamed.mbz")
+    assert not (tmp_path / "output" / "streamed").exists()
+    with zipfile.ZipFile(tmp_path / "output" / "streamed.mbz") as z:
+        streamed_names = sorted(z.namelist())
+    assert f"files/{pdf_file.content_hash[0:2]}/{pdf_file.content_hash}" in streamed_names
+
+    # the debug mode keeps the directory tree with the same contents
+    generator.generate_mbz("streamed.mbz", keep_directory=True)
+    assert (tmp_path / "output" / "streamed" / "moodle_backup.xml").exists()
+    with zipfile.ZipFile(tmp_path / "output" / "streamed.mbz") as z:
+        assert sorted(z.namelist()) == streamed_names
+
+
+def test_shared_contents_are_stored_once(tmp_path):
+    # two SCORM packages sharing the same theme image
+    zip_paths = []
+    for name in ["deck1", "deck2"]:
+        zip_path = tmp_path / "test" / f"{name}.zip"
+        zip_path.parent.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(zip_path, 'w') as z:
+            z.writestr("imsmanifest.xml", f"<manifest>{name}</manifest>")
+            z.writestr(f"{name}/theme.png", b"\x89PNG" + b"x" * 1000)
+        zip_paths.append(zip_path)
+
+    generator = MoodleBackup("Dedup", "Deduplicated Course", 16205)
+    for zip_path in zip_paths:
+        scorm_files = MoodleFile.unzip_and_add(str(zip_path))
+        generator.files.extend(scorm_files)
+        scorm_activity = MoodleActivity(zip_path.stem, zip_path.stem, "scorm")
+        scorm_activity.files.extend(scorm_files)
+        generator.activities.append(scorm_activity)
+
+    generator.generate_mbz("dedup.mbz")
+    with zipfile.ZipFile(tmp_path / "output" / "dedup.mbz") as z:
+        blobs = [name for name in z.namelist() if name.startswith("files/")]
+        files_xml = z.read("files.xml").decode("utf-8")
+    theme_files = [f for f in generator.files if f.filename == "theme.png"]
+    assert theme_files[0].content_hash == theme_files[1].content_hash
+    assert len(blobs) == len({f.content_hash for f in generator.files}) == len(generator.files) - 1
+    # files.xml still lists the theme image for each context
+    assert files_xml.count("<filename>theme.png</filename>") == 2
+    assert files_xml.count(f"<contenthash>{theme_files[0].content_hash}</contenthash>") == 2
+
+
+def test_backups_are_built_concurrently(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    create_dummy_pdf(tmp_path / "test" / "java-kickstart.pdf")
+
+    def build(nr):
+        generator = MoodleBackup(f"Course{nr}", f"Course {nr}", 16300 + nr, output_dir=str(tmp_path / f"course{nr}" / "output"))
+        pdf_file = MoodleFile(str(tmp_path / "test" / "java-kickstart.pdf"))
+        generator.files.append(pdf_file)
+        pdf_activity = MoodleActivity("java-kickstart", "Java (PDF)")
+        pdf_activity.files.append(pdf_file)
+        generator.activities.append(pdf_activity)
+        section = MoodleSection("Class-1", "Class 1", 1)
+        section.activities.append(pdf_activity)
+        pdf_activity.section = section
+        generator.sections["Class-1"] = section
+        generator.generate_mbz(f"course{nr}.mbz")
+        generator.generate_zip(f"course{nr}.zip")
+        return generator
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        generators = list(executor.map(build, range(8)))
+
+    assert os.getcwd() == str(tmp_path)
+    assert len({g.activities[0].id for g in generators}) == 8
+    assert len({g.files[0].file_id for g in generators}) == 8
+    for nr in range(8):
+        with zipfile.ZipFile(tmp_path / f"course{nr}" / "output" / f"course{nr}.zip") as z:
+            assert z.namelist() == ["Class-1/java-kickstart/java-kickstart.pdf"]
+        assert zipfile.is_zipfile(tmp_path / f"course{nr}" / "output" / f"course{nr}.mbz")
+
+
+def test_materials_are_rendered_again_after_a_theme_change(tmp_path, monkeypatch):
+    from markslidego.moodle import backup
+    (tmp_path / "_template").mkdir()
+    (tmp_path / "_template" / "theme.css").write_text("h1 { color: red; }", encoding="utf-8")
+    (tmp_path / "deck.md").write_text("---\nmarp: true\n---\n# Deck\n", encoding="utf-8")
+    rendered = []
+    def generate_targets(source, targets):
+        for target in targets:
+            create_dummy_pdf(Path(target))
+        rendered.extend(targets)
+        return list(targets)
+    monkeypatch.setattr(backup, "generate_targets", generate_targets)
+    monkeypatch.setattr("markslidego.generate.marp_cli_version", lambda: "4.0")
+
+    generator = MoodleBackup("Themed", "Themed Course", 16205, template_dir=str(tmp_path / "_template"))
+    targets = {str(tmp_path / "deck.pdf"): None}
+    generator.render_material(str(tmp_path / "deck.md"), targets, "Deck")
+    generator.render_material(str(tmp_path / "deck.md"), targets, "Deck")
+    assert len(rendered) == 1
+    (tmp_path / "_template" / "theme.css").write_text("h1 { color: blue; }", encoding="utf-8")
+    generator.render_material(str(tmp_path / "deck.md"), targets, "Deck")
+    assert len(rendered) == 2
+
+
+def test_failed_content_write_releases_its_claim(tmp_path):
+    from markslidego.moodle.writer import DirectoryWriter
+
+    class FailingWriter(DirectoryWriter):
+        fail = True
+        def write_stream(self, path, in_file):
+            if self.fail:
+                raise OSError("disk full")
+            super().write_stream(path, in_file)
+
+    writer = FailingWriter(str(tmp_path / "backup"))
+    create_dummy_pdf(tmp_path / "a.pdf")
+    open_content = lambda: open(tmp_path / "a.pdf", "rb")
+    with pytest.raises(OSError):
+        writer.write_content_addressed("files", open_content)
+    assert not writer.content_index and writer.deduplicated_bytes == 0
+
+    writer.fail = False
+    content_hash = writer.write_content_addressed("files", open_content)
+    assert (tmp_path / "backup" / "files" / content_hash[:2] / content_hash).exists()
+    writer.write_content_addressed("files", open_content)
+    assert writer.deduplicated_bytes == writer.content_index[content_hash] > 0
+
+
+def test_package_entries_share_one_archive(tmp_path, monkeypatch):
+    zip_path = tmp_path / "package.zip"
+    with zipfile.ZipFile(zip_path, 'w') as z:
+        for i in range(5):
+            z.writestr(f"page{i}.html", f"<p>{i}</p>")
+    entries = [f for f in MoodleFile.unzip_and_add(str(zip_path)) if f.zip_entry is not None]
+
+    opened = []
+    zip_file_class = zipfile.ZipFile
+    def counting_zip_file(*args, **kwargs):
+        opened.append(args[0])
+        return zip_file_class(*args, **kwargs)
+    monkeypatch.setattr(zipfile, "ZipFile", counting_zip_file)
+
+    for i, entry in enumerate(entries):
+        with entry.open() as f:
+            assert f.read() == f"<p>{i}</p>".encode()
+    assert len(opened) == 1
+    entries[0].close()
+    assert entries[-1].archive.zip_file is None
+
+
+def test_writers_keep_the_first_write_of_a_path(tmp_path, caplog):
+    from markslidego.moodle.writer import ArchiveWriter, DirectoryWriter
+
+    with DirectoryWriter(str(tmp_path / "backup")) as writer:
+        writer.write_text("moodle_backup.xml", "first")
+        writer.write_stream("moodle_backup.xml", io.BytesIO(b"second"))
+    assert (tmp_path / "backup" / "moodle_backup.xml").read_text(encoding="utf-8") == "first"
+
+    with ArchiveWriter(str(tmp_path / "backup.mbz")) as writer:
+        writer.write_text("moodle_backup.xml", "first")
+        writer.write_stream("moodle_backup.xml", io.BytesIO(b"second"))
+    with zipfile.ZipFile(tmp_path / "backup.mbz") as z:
+        assert z.namelist() == ["moodle_backup.xml"]
+        assert z.read("moodle_backup.xml") == b"first"
+    assert caplog.text.count("moodle_backup.xml was already written") == 2
+
+
 # --------------------------------------------
 if __name__ == "__main__":
     import pytest
@@ -0,0 +1,69 @@
+import os
+import sys
+from pathlib import Path
+
+# Ensure repository root is on sys.path so tests can import the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from markslidego import generate_watch
+from markslidego.generate_watch import CourseGraph, rebuild_changes
+
+
+COURSE = """course-title: Course
+course: c1
+program: BIF
+version: "1.0"
+topics:
+  - name: T1
+    slides:
+      - title: Intro
+        source: prog/intro.md
+        target: intro.pdf
+      - title: Intro
+        source: prog/intro.md
+        target: intro.html
+      - title: All
+        sources:
+          - prog/intro.md
+          - prog/more.md
+        target: all.pdf
+"""
+
+
+def test_course_graph_maps_changes_to_outputs(tmp_path):
+    (tmp_path / "catalogs" / "prog").mkdir(parents=True)
+    (tmp_path / "catalogs" / "prog" / "intro.md").write_text("# Intro\n![](pic.png)\n", encoding="utf-8")
+    (tmp_path / "catalogs" / "prog" / "more.md").write_text("# More\n", encoding="utf-8")
+    (tmp_path / "catalogs" / "prog" / "pic.png").write_bytes(b"png")
+    (tmp_path / "courses" / "c1" / "_template").mkdir(parents=True)
+    (tmp_path / "courses" / "c1" / "c1.yml").write_text(COURSE, encoding="utf-8")
+
+    graph = CourseGraph(str(tmp_path / "courses" / "c1" / "c1.yml"), str(tmp_path / "courses" / "c1" / "_template"))
+    catalog = str(tmp_path / "catalogs" / "prog")
+    assert graph.affected({os.path.join(catalog, "more.md")}) == {("T1", "all.md")}
+    assert graph.affected({os.path.join(catalog, "pic.png")}) == {("T1", "intro.md"), ("T1", "all.md")}
+    assert graph.affected({os.path.join(catalog, "other.md")}) == set()
+    assert graph.affected({graph.yaml_file}) is None
+    assert graph.affected({str(tmp_path / "courses" / "c1" / "_template" / "fhtw.css")}) is None
+
+
+def test_watch_survives_invalid_yaml(tmp_path, monkeypatch):
+    (tmp_path / "catalogs" / "prog").mkdir(parents=True)
+    (tmp_path / "catalogs" / "prog" / "intro.md").write_text("# Intro\n", encoding="utf-8")
+    (tmp_path / "catalogs" / "prog" / "more.md").write_text("# More\n", encoding="utf-8")
+    (tmp_path / "courses" / "c1" / "_template").mkdir(parents=True)
+    yaml_file = tmp_path / "courses" / "c1" / "c1.yml"
+    yaml_file.write_text(COURSE, encoding="utf-8")
+    prepared = []
+    monkeypatch.setattr(generate_watch, "prepare_course_topic",
+                        lambda name, *args: prepared.append(name) or [("src", "target", None, "key")])
+    monkeypatch.setattr(generate_watch, "render_course_jobs", lambda render_jobs, *args, **kwargs: len(render_jobs))
+    graph = CourseGraph(str(yaml_file), str(tmp_path / "courses" / "c1" / "_template"))
+
+    # a half-edited YAML file is reported, but doesn't stop watching
+    yaml_file.write_text(COURSE.replace("topics:", "topics: [", 1), encoding="utf-8")
+    assert rebuild_changes(graph, {str(yaml_file)}) is False
+    assert prepared == []
+
+    yaml_file.write_text(COURSE.replace("title: Intro", "title: Introduction"), encoding="utf-8")
+    assert rebuild_changes(graph, {str(yaml_file)}) is True
+    assert prepared == ["T1"]
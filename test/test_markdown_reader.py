@@ -107,3 +107,66 @@ def test_with_lesson_markdonw_file(tmp_path):
     assert len(reader.pages) > 0
     print(f"First page content:\n{reader.pages[0] if reader.pages else 'No pages found.'}")
     print(f"Last page content:\n{reader.pages[-1] if reader.pages else 'No pages found.'}")
+
+
+def test_frontmatter_yaml_and_lazy_pages(tmp_path):
+    md = """---
+marp: true
+backgroundColor: #fff
+section_number: 2
+version: 1.10
+paginate: yes
+moodle: FALSE
+style: |
+  .columns {
+    display: grid;
+  }
+---
+# Slide 1
+
+---
+# Slide 2
+"""
+    path = tmp_path / "yaml_frontmatter.md"
+    path.write_text(md, encoding="utf-8")
+
+    reader = MarkdownReader(str(path))
+    assert reader.metadata["style"] == ".columns {\n  display: grid;\n}\n"
+    assert reader.metadata["backgroundColor"] == "#fff"
+    assert reader.metadata["section_number"] == "2"
+    # scalars keep their text (as the "key: value" parser did), only true/false become booleans
+    assert reader.metadata["version"] == "1.10"
+    assert reader.metadata["paginate"] == "yes"
+    assert reader.metadata["moodle"] is False
+    # metadata-only readers don't parse the pages
+    assert reader._pages is None
+    assert [page.title for page in reader.iter_pages()] == ["Slide 1", "Slide 2"]
+    assert [page.title for page in reader.pages] == ["Slide 1", "Slide 2"]
+
+
+def test_page_tokens_links_anywhere_in_line():
+    page = MarkdownPage("""# Question
+<!-- TYPE:TRUEFALSE -->
+Is it [true](moodle://answer?jumpto=-1&score=1) or [false](moodle://answer?jumpto=0)?
+See [the docs](https://example.org)
+[Next](moodle://answer?jumpto=-1)""")
+    assert page.title == "Question"
+    assert page.moodle_type == "TRUEFALSE"
+    assert page.comments == ["TYPE:TRUEFALSE"]
+    assert [(link.text, link.params) for link in page.moodle_links] == [
+        ("true", {'jumpto': '-1', 'score': '1'}), ("false", {'jumpto': '0'}), ("Next", {'jumpto': '-1'})]
+    assert page.strip() == "Is it  or ?\nSee [the docs](https://example.org)"
+
+
+def test_to_html_reuses_converter_and_caches(monkeypatch):
+    import markdown
+    from markslidego.markdown import page as page_module
+    html = MarkdownPage.to_html("# Title\n\n* one\n* two")
+    assert html == markdown.markdown("# Title\n\n* one\n* two")
+    # a second conversion must not be affected by the state of the first one
+    assert MarkdownPage.to_html("plain *text*") == "<p>plain <em>text</em></p>"
+
+    calls = []
+    monkeypatch.setattr(page_module, "_converter", lambda: calls.append(1))
+    assert MarkdownPage.to_html("# Title\n\n* one\n* two") == html
+    assert calls == []
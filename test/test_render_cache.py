@@ -0,0 +1,71 @@
+import os
+import sys
+from pathlib import Path
+
+# Ensure repository root is on sys.path so tests can import the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from markslidego.render_cache import RenderCache, get_render_cache, parse_size
+
+
+def test_render_cache_shares_identical_decks(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), 1024)
+    for course in ("c1", "c2"):
+        (tmp_path / course / "images").mkdir(parents=True)
+        (tmp_path / course / "intro.md").write_text("# Intro\n![](images/pic.png)\n", encoding="utf-8")
+        (tmp_path / course / "images" / "pic.png").write_bytes(b"png")
+    key = cache.key(str(tmp_path / "c1" / "intro.md"), "intro.pdf", {'marp-cli': "4.0"})
+    assert key == cache.key(str(tmp_path / "c2" / "intro.md"), "intro.pdf", {'marp-cli': "4.0"})
+    assert key != cache.key(str(tmp_path / "c2" / "intro.md"), "intro.html", {'marp-cli': "4.0"})
+    assert key != cache.key(str(tmp_path / "c2" / "intro.md"), "intro.pdf", {'marp-cli': "4.1"})
+
+    assert not cache.fetch(key, str(tmp_path / "c2" / "intro.pdf"))
+    (tmp_path / "c1" / "intro.pdf").write_bytes(b"pdf")
+    cache.store(key, str(tmp_path / "c1" / "intro.pdf"))
+    assert cache.fetch(key, str(tmp_path / "c2" / "intro.pdf"))
+    assert (tmp_path / "c2" / "intro.pdf").read_bytes() == b"pdf"
+
+    # a changed asset changes the key
+    (tmp_path / "c2" / "images" / "pic.png").write_bytes(b"png2")
+    assert key != cache.key(str(tmp_path / "c2" / "intro.md"), "intro.pdf", {'marp-cli': "4.0"})
+
+
+def test_changed_theme_is_a_cache_miss(tmp_path):
+    from markslidego.generate import marp_theme_files
+    (tmp_path / "theme").mkdir()
+    (tmp_path / "theme" / "fhtw.css").write_text("/* @theme fhtw */ h1 { color: red; }", encoding="utf-8")
+    (tmp_path / ".marprc.yml").write_text("themeSet:\n  - ./theme/fhtw.css\n", encoding="utf-8")
+    (tmp_path / "course" / "output").mkdir(parents=True)
+    deck = tmp_path / "course" / "output" / "intro.md"
+    deck.write_text("---\ntheme: fhtw\n---\n# Intro\n", encoding="utf-8")
+    themes = marp_theme_files(str(tmp_path / "course"))
+    assert themes == [str(tmp_path / "theme" / "fhtw.css")]
+
+    cache = RenderCache(str(tmp_path / "cache"), 1024)
+    key = cache.key(str(deck), "intro.pdf", {}, themes)
+    (tmp_path / "course" / "output" / "intro.pdf").write_bytes(b"pdf")
+    cache.store(key, str(tmp_path / "course" / "output" / "intro.pdf"))
+
+    (tmp_path / "theme" / "fhtw.css").write_text("/* @theme fhtw */ h1 { color: blue; }", encoding="utf-8")
+    changed_key = cache.key(str(deck), "intro.pdf", {}, themes)
+    assert changed_key != key
+    assert not cache.fetch(changed_key, str(tmp_path / "course" / "output" / "intro.pdf"))
+
+
+def test_render_cache_evicts_least_recently_used(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), 1000)
+    for i, key in enumerate(("a1", "b2", "c3")):
+        target = tmp_path / f"{key}.pdf"
+        target.write_bytes(b"x" * 400)
+        cache.store(key, str(target))
+        os.utime(cache.entry(key, str(target)), (i, i))
+    assert not os.path.exists(cache.entry("a1", "a1.pdf"))
+    assert os.path.exists(cache.entry("b2", "b2.pdf")) and os.path.exists(cache.entry("c3", "c3.pdf"))
+    assert parse_size("2G") == 2 * 1024 ** 3 and parse_size("500M") == 500 * 1024 ** 2 and parse_size("0") == 0
+
+
+def test_render_cache_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.delenv("RENDER_CACHE_SIZE", raising=False)
+    monkeypatch.setenv("RENDER_CACHE_DIR", str(tmp_path / "renders"))
+    assert get_render_cache() is None
+    monkeypatch.setenv("RENDER_CACHE_SIZE", "2G")
+    assert get_render_cache().max_bytes == 2 * 1024 ** 3